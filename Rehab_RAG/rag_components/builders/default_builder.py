@@ -4,6 +4,8 @@ DefaultBuilder: 従来のシンプルなDB構築プロセスをコンポーネ
 import importlib
 import os
 
+from ..rate_limiter import background_priority
+
 
 class DefaultBuilder:
     """
@@ -28,6 +30,7 @@ class DefaultBuilder:
         class_ = getattr(module, class_name)
         return class_(**params)
 
+    @background_priority
     def build(self):
         """データベース構築のメイン処理"""
         # 1. 必要なコンポーネントを準備
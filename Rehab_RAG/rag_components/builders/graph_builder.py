@@ -1,7 +1,6 @@
 import enum
 import importlib
 import os
-import time
 from typing import List, Optional
 
 from dotenv import load_dotenv
@@ -9,6 +8,8 @@ from neo4j import GraphDatabase
 from pydantic import BaseModel, Field
 from tqdm import tqdm
 
+from ..rate_limiter import background_priority, estimate_tokens, get_rate_limiter
+
 # ガイドラインの構造に特化したEnumとPydanticモデルを定義
 
 class NodeType(str, enum.Enum):
@@ -84,6 +85,7 @@ class GraphBuilder:
 "{chunk_text}"
 """
         try:
+            get_rate_limiter("gemini").acquire(estimate_tokens(prompt))
             response = self.llm.client.models.generate_content(
                 model=self.llm.model_name,
                 contents=prompt,
@@ -118,6 +120,7 @@ class GraphBuilder:
                         source=rel.source, target=rel.target, context=chunk_text
                     )
 
+    @background_priority
     def build(self):
         with self.driver.session() as session:
             print("既存のグラフデータを削除しています...")
@@ -134,7 +137,6 @@ class GraphBuilder:
                 all_chunks.extend(chunks)
         print(f"合計 {len(all_chunks)} 個のチャンクからナレッジグラフを構築します...")
         for chunk in tqdm(all_chunks, desc="Building Knowledge Graph"):
-            time.sleep(1)
             graph_data = self._extract_graph_from_chunk(chunk['text'])
             if graph_data:
                 self._write_to_neo4j(graph_data, chunk['text'])
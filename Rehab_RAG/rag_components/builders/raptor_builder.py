@@ -4,12 +4,13 @@ RAPTORBuilder: 階層的な情報ツリーを構築する先進的なBuilder
 import hashlib
 import importlib
 import os
-import time
 
 import numpy as np
 from sklearn.cluster import DBSCAN
 from tqdm import tqdm
 
+from ..rate_limiter import background_priority
+
 
 class RAPTORBuilder:
     """
@@ -67,10 +68,11 @@ class RAPTORBuilder:
 {context_str}
 
 # 要約:"""
-        time.sleep(1) # APIレート制限対策
+        # APIレート制限は llm 側の共有リミッタで待機する
         summary = llm.generate(prompt, max_output_tokens=1024)
         return summary.strip()
 
+    @background_priority
     def build(self):
         # 1. RAPTORに必要なコンポーネントを準備
         print("RAPTOR Builderのコンポーネントを初期化中...")
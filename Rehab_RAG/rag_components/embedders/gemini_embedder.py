@@ -7,6 +7,8 @@ from google import genai
 from google.genai import types
 from tqdm import tqdm
 
+from ..rate_limiter import estimate_tokens, get_rate_limiter
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
 dotenv_path = os.path.join(PROJECT_ROOT, '.env')
@@ -19,7 +21,7 @@ class GeminiEmbedder:
 
     特徴:
     - APIベースであるため、ローカルに大規模なモデルを持つ必要がない。
-    - レート制限（1分あたりのリクエスト数）があるため、バッチ処理とAPIコール間の待機が不可欠。
+    - レート制限（1分あたりのリクエスト数・トークン数）があるため、バッチ処理と共有のレートリミッタによる待機が不可欠。
     - RAGのユースケースに合わせて `task_type` を指定することで、検索精度を最適化できる。
     """
 
@@ -32,6 +34,8 @@ class GeminiEmbedder:
             batch_size (int): 一度のAPIコールで処理するテキストの数。レート制限対策の要。
             requests_per_minute (int): 1分あたりのAPIコール回数の上限。無料枠の場合、TPMも考慮して余裕を持った値に設定する。
                                        Gemini Embeddingの無料枠RPMは100, TPMは30,000。
+                                       プロセス内の全Embedderで共有するリミッタの初期値として使い、
+                                       環境変数 GEMINI_EMBEDDING_RPM / GEMINI_EMBEDDING_TPM があればそちらを優先する。
         """
         if not os.getenv("GEMINI_API_KEY"):
             raise ValueError("環境変数 `GEMINI_API_KEY` が設定されていません。")
@@ -40,8 +44,8 @@ class GeminiEmbedder:
         self.client = genai.Client()
         self.model_name = model_name
         self.batch_size = batch_size
-        self.sleep_duration = 60.0 / requests_per_minute
-        print(f"Embeddingモデルの初期化完了。バッチサイズ: {self.batch_size}, APIコール間の待機時間: {self.sleep_duration:.2f}秒")
+        self.rate_limiter = get_rate_limiter("gemini-embedding", requests_per_minute=requests_per_minute)
+        print(f"Embeddingモデルの初期化完了。バッチサイズ: {self.batch_size}, RPM上限: {self.rate_limiter.requests_per_minute:.0f}")
 
     @backoff.on_exception(
         backoff.expo,
@@ -55,6 +59,7 @@ class GeminiEmbedder:
         APIコールをリトライロジックでラップした内部メソッド。
         ResourceExhaustedエラーが発生した場合、自動的にエクスポネンシャルバックオフで再試行する。
         """
+        self.rate_limiter.acquire(sum(estimate_tokens(text) for text in batch_texts))
         return self.client.models.embed_content(
             model=self.model_name,
             contents=batch_texts,
@@ -91,8 +96,6 @@ class GeminiEmbedder:
                 print(f"エラー: バッチ {i//self.batch_size + 1} で予期せぬエラーが発生しました。: {e}")
                 all_embeddings.extend([None] * len(batch_texts))
 
-            time.sleep(self.sleep_duration)
-
         valid_embeddings = [emb for emb in all_embeddings if emb is not None]
 
         # 最終的に有効なエンベディングが1つも無かった場合に、明確なエラーを出す
@@ -109,6 +112,7 @@ class GeminiEmbedder:
         単一のクエリテキストをベクトル化するメソッド。
         ユーザーからの質問を検索する際に使用します。
         """
+        self.rate_limiter.acquire(estimate_tokens(text))
         result = self.client.models.embed_content(
             model=self.model_name,
             contents=[text],
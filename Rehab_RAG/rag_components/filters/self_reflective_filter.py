@@ -3,7 +3,6 @@ SelfReflectiveFilter: 検索結果の関連性を自己評価・フィルタリ
 """
 import logging
 import math
-import time
 from typing import List
 
 from pydantic import BaseModel, Field
@@ -93,7 +92,7 @@ class SelfReflectiveFilter:
 
 
 
-            time.sleep(1) # APIレート制限対策
+            # APIレート制限は llm 側の共有リミッタで待機する
             response = self.llm.generate(
                 prompt,
                 temperature=0.0,
@@ -9,6 +9,9 @@ from google import genai
 from google.genai import types
 from pydantic import BaseModel
 
+from ..rate_limiter import estimate_tokens, get_rate_limiter
+from ..response_cache import get_response_cache
+
 
 class GeminiLLM:
     """
@@ -38,6 +41,9 @@ class GeminiLLM:
 
         self.client = genai.Client()
         self.model_name = model_name
+        # アプリ本体のGeminiClientと共有するレート制限 (RPM / TPM) と応答キャッシュ
+        self.rate_limiter = get_rate_limiter("gemini")
+        self.response_cache = get_response_cache()
 
         # [エラー回避/安定化のポイント]
         # 医療系の質問は、モデルのセーフティ機能によって回答がブロックされることがあります。
@@ -76,24 +82,46 @@ class GeminiLLM:
             config.response_mime_type = "application/json"
             config.response_schema = response_schema
 
+        # 温度が LLM_CACHE_MAX_TEMPERATURE 以下の呼び出しは、同じ条件の前回の応答を再利用する
+        cache_key = None
+        if self.response_cache.cacheable(temperature):
+            cache_key = self.response_cache.make_key(
+                self.model_name, prompt, response_schema, temperature, max_output_tokens=max_output_tokens
+            )
+            site = f"rag.gemini.{response_schema.__name__ if response_schema else 'text'}"
+            cached = self.response_cache.get(cache_key, site=site)
+            if cached is not None:
+                return response_schema.model_validate(cached) if response_schema else cached
+
+        # 出力分も含めてTPMの枠を確保し、応答後に実際のトークン数で補正する
+        estimated_tokens = estimate_tokens(prompt) + max_output_tokens
         for attempt in range(2): # 最大2回試行
             try:
+                self.rate_limiter.acquire(estimated_tokens)
                 response = self.client.models.generate_content(
                     model=self.model_name,
                     contents=prompt,
                     config=config
                 )
+                usage = getattr(response, "usage_metadata", None)
+                actual_tokens = getattr(usage, "total_token_count", None)
+                if isinstance(actual_tokens, int):
+                    self.rate_limiter.record_usage(estimated_tokens, actual_tokens)
 
                 # スキーマの有無で戻り値を分岐
                 if response_schema:
                     # JSONモードの場合、パース済みのPydanticオブジェクトを返す
                     if hasattr(response, 'parsed'):
+                        if cache_key and isinstance(response.parsed, BaseModel):
+                            self.response_cache.put(cache_key, response.parsed.model_dump(mode="json"))
                         return response.parsed
                     else:
                         # まれにパースに失敗した場合のエラーハンドリング
                         raise ValueError(f"JSONスキーマのパースに失敗しました。Response: {response.text}")
 
                 elif response.text:
+                    if cache_key:
+                        self.response_cache.put(cache_key, response.text)
                     return response.text
                 else:
                     # レスポンスが空の場合、ブロックされたかトークン上限に達した可能性がある
@@ -104,7 +132,11 @@ class GeminiLLM:
             except Exception as e:
                 print(f"回答生成中にエラー発生 (試行 {attempt + 1} 回目): {e}")
                 if attempt == 0:
-                    time.sleep(3)
+                    if getattr(e, "code", None) == 429:
+                        # レート制限超過: 同じリミッタを使う全ての呼び出しを止めてから再試行する
+                        self.rate_limiter.pause(3)
+                    else:
+                        time.sleep(3)
                 else:
                     error_message = f"回答の生成中にエラーが繰り返し発生しました: {e}"
                     # JSONモードでのエラーの場合は辞書で、テキストモードでは文字列で返す
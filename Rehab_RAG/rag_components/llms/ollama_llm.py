@@ -6,6 +6,8 @@ from typing import Optional, Type
 import ollama
 from pydantic import BaseModel, ValidationError
 
+from ..response_cache import get_response_cache
+
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
@@ -27,6 +29,8 @@ class OllamaLLM:
             "temperature": 0.6, # 決定性を高めるために 0.0 にする
             "top_p": top_p       # top_p も低め (0.5など) にしても良いかも
         }
+        # 温度が LLM_CACHE_MAX_TEMPERATURE 以下の場合のみ、同じ条件の応答を再利用する
+        self.response_cache = get_response_cache()
         logger.info(f"Ollama LLM Wrapper initialized (Model: {self.model_name})") # ログ追加
 
     def generate(self, prompt: str, response_schema: Optional[Type[BaseModel]] = None, **kwargs):
@@ -46,6 +50,17 @@ class OllamaLLM:
             except Exception as e:
                 logger.error(f"Pydanticモデル ({response_schema.__name__}) からJSONスキーマの取得に失敗: {e}")
                 return {"error": f"内部エラー: スキーマ定義の取得に失敗しました ({response_schema.__name__})。"}
+        cache_key = None
+        if self.response_cache.cacheable(self.options["temperature"]):
+            cache_key = self.response_cache.make_key(
+                self.model_name, prompt, response_schema, self.options["temperature"],
+                format=format_param, top_p=self.options["top_p"],
+            )
+            site = f"rag.ollama.{response_schema.__name__ if response_schema else 'text'}"
+            cached = self.response_cache.get(cache_key, site=site)
+            if cached is not None:
+                return response_schema.model_validate(cached) if response_schema else cached
+
         try:
             response = ollama.chat(
                 model=self.model_name,
@@ -70,6 +85,8 @@ class OllamaLLM:
                     # Pydanticモデルでバリデーション
                     validated_data = response_schema.model_validate(json_data)
                     logger.info(f"Ollama JSON Response validated successfully against {response_schema.__name__}.")
+                    if cache_key:
+                        self.response_cache.put(cache_key, validated_data.model_dump(mode="json"))
                     return validated_data # 検証済みPydanticオブジェクトを返す
                 except ValidationError as e:
                     error_msg = f"Ollama応答のスキーマ検証に失敗しました: {e}"
@@ -91,6 +108,8 @@ class OllamaLLM:
                      return {"error": f"AIの応答がJSON形式ではありませんでした (jsonモード)。受信データ: {generated_content[:100]}..."}
             else: # テキスト応答の場合
                 logger.info("Ollama Text Response generated successfully.")
+                if cache_key:
+                    self.response_cache.put(cache_key, generated_content)
                 return generated_content
 
         except Exception as e:
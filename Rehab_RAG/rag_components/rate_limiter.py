@@ -0,0 +1,243 @@
+"""
+RateLimiter: Gemini APIのレート制限 (RPM / TPM) をプロセス全体で共有するトークンバケット
+"""
+import contextvars
+import functools
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+# 優先度クラス (値が小さいほど優先される)
+PRIORITY_INTERACTIVE = 0  # 画面操作に応答する生成 (計画書の生成・再生成、RAG検索など)
+PRIORITY_BACKGROUND = 1   # データベース構築 (RAPTOR要約、ナレッジグラフ抽出、文書のベクトル化など)
+
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+# 待ち時間ヒストグラムの区切り (秒)
+WAIT_HISTOGRAM_BUCKETS = (0.0, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+# 既定の上限 (環境変数で上書き可能)。name ごとに別のバケットを持つ
+DEFAULT_LIMITS = {
+    "gemini": {"rpm_env": "GEMINI_RPM", "rpm": 1000, "tpm_env": "GEMINI_TPM", "tpm": 1_000_000},
+    "gemini-embedding": {"rpm_env": "GEMINI_EMBEDDING_RPM", "rpm": 750, "tpm_env": "GEMINI_EMBEDDING_TPM", "tpm": 1_000_000},
+}
+
+
+class RateLimitTimeout(TimeoutError):
+    """timeout 秒以内にレート制限の枠を確保できなかったことを表す例外"""
+
+
+class RateLimiter:
+    """
+    [手法解説: Token Bucket]
+    1分あたりのリクエスト数 (RPM) とトークン数 (TPM) の2つのバケットを持ち、
+    呼び出しのたびに「リクエスト1回分」と「推定トークン数」を取り出すレートリミッタ。
+    バケットは時間とともに一定の速度で補充され、空の場合は補充されるまで待ちます。
+
+    - 同じ name のリミッタはプロセス内で1つだけ作られ (get_rate_limiter)、アプリ本体と
+      Rehab_RAG の全てのGemini呼び出しで共有されるため、同時に使うユーザーが増えても上限を超えません。
+    - 待っている呼び出しは優先度順 (同じ優先度なら到着順) に通過するため、
+      データベース構築などのバックグラウンド処理が、画面操作に応答する生成を待たせません。
+    - APIが ResourceExhausted を返した場合は pause() で全呼び出しを一斉に止め、
+      各呼び出しがばらばらにリトライしてさらに制限を悪化させることを防ぎます。
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float):
+        self.name = name
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._requests = self.requests_per_minute
+        self._tokens = self.tokens_per_minute
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._stats: Dict[int, dict] = {}
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60.0)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60.0)
+
+    def _time_until_available(self, now: float, tokens: float) -> float:
+        """バケットに必要な量がたまるまでの秒数"""
+        wait = max(0.0, self._paused_until - now)
+        if self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60.0 / self.requests_per_minute)
+        if self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60.0 / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, tokens: int = 0, priority: Optional[int] = None, timeout: Optional[float] = None) -> float:
+        """
+        リクエスト1回分と tokens 分の枠を確保する (確保できるまで待つ)。
+
+        Args:
+            tokens: この呼び出しで消費すると見込まれるトークン数 (estimate_tokens で概算)。
+            priority: 優先度クラス。None の場合は priority_scope で指定された値 (既定は PRIORITY_INTERACTIVE)。
+            timeout: 待つ上限 (秒)。超えた場合は RateLimitTimeout を送出する。
+
+        Returns:
+            float: 待った秒数
+        """
+        if priority is None:
+            priority = current_priority()
+        # 1回でバケット容量を超える呼び出しは、満杯になった時点で通す
+        tokens = min(float(tokens), self.tokens_per_minute)
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        entry = (priority, next(self._sequence))
+
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._time_until_available(now, tokens)
+                    if self._waiters[0] == entry and wait <= 0:
+                        heapq.heappop(self._waiters)
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        self._cond.notify_all()
+                        break
+                    if deadline is not None and now >= deadline:
+                        raise RateLimitTimeout(f"{self.name}: rate limit wait exceeded {timeout:.1f}s")
+                    # 先頭でなければ、先頭の呼び出しが通過したときに notify される
+                    sleep_for = wait if self._waiters[0] == entry else 1.0
+                    if deadline is not None:
+                        sleep_for = min(sleep_for, deadline - now)
+                    self._cond.wait(timeout=max(0.001, sleep_for))
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+        waited = time.monotonic() - start
+        self._record_wait(priority, waited)
+        return waited
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """APIが返した実際のトークン数で、acquire() 時の推定との差をバケットに反映する"""
+        if actual_tokens is None:
+            return
+        with self._cond:
+            self._tokens -= actual_tokens - estimated_tokens
+            if actual_tokens < estimated_tokens:
+                self._tokens = min(self._tokens, self.tokens_per_minute)
+                self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """ResourceExhausted を受けたときに、全ての呼び出しを seconds 秒止める"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _record_wait(self, priority: int, waited: float) -> None:
+        with self._cond:
+            stats = self._stats.setdefault(
+                priority, {"count": 0, "total_wait": 0.0, "max_wait": 0.0, "buckets": [0] * len(WAIT_HISTOGRAM_BUCKETS)}
+            )
+            stats["count"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+            index = max(i for i, bound in enumerate(WAIT_HISTOGRAM_BUCKETS) if waited >= bound)
+            stats["buckets"][index] += 1
+
+    def get_stats(self) -> dict:
+        """優先度クラスごとの待ち時間 (件数・平均・最大・ヒストグラム) と現在のバケット残量"""
+        with self._cond:
+            self._refill(time.monotonic())
+            labels = [f">={bound:g}s" for bound in WAIT_HISTOGRAM_BUCKETS]
+            return {
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "available_requests": round(self._requests, 1),
+                "available_tokens": round(self._tokens),
+                "waiting": len(self._waiters),
+                "wait_time": {
+                    PRIORITY_NAMES.get(priority, str(priority)): {
+                        "count": stats["count"],
+                        "mean": round(stats["total_wait"] / stats["count"], 3),
+                        "max": round(stats["max_wait"], 3),
+                        "histogram": dict(zip(labels, stats["buckets"])),
+                    }
+                    for priority, stats in sorted(self._stats.items())
+                },
+            }
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str = "gemini", requests_per_minute: Optional[float] = None,
+                     tokens_per_minute: Optional[float] = None) -> RateLimiter:
+    """
+    name のリミッタを返す (プロセス内で共有)。
+    上限は環境変数 (GEMINI_RPM / GEMINI_TPM など) > 初回呼び出し時の引数 > 既定値 の順に決まる。
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            defaults = DEFAULT_LIMITS.get(name, DEFAULT_LIMITS["gemini"])
+            rpm = float(os.getenv(defaults["rpm_env"], requests_per_minute or defaults["rpm"]))
+            tpm = float(os.getenv(defaults["tpm_env"], tokens_per_minute or defaults["tpm"]))
+            limiter = RateLimiter(name, rpm, tpm)
+            _limiters[name] = limiter
+        return limiter
+
+
+def rate_limiter_stats() -> dict:
+    """作成済みの全リミッタの統計 (管理者用API /admin/api/llm-stats で使用)"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.get_stats() for limiter in limiters}
+
+
+def estimate_tokens(text) -> int:
+    """
+    プロンプトのトークン数を概算する (日本語は1文字あたり約1トークン、英数字は約4文字で1トークン)。
+    正確な値はレスポンスの usage_metadata で record_usage() に渡して補正する。
+    """
+    text = str(text or "")
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_chars) + math.ceil(ascii_chars / 4)
+
+
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "rate_limit_priority", default=PRIORITY_INTERACTIVE
+)
+
+
+def current_priority() -> int:
+    return _current_priority.get()
+
+
+@contextmanager
+def priority_scope(priority: int) -> Iterator[int]:
+    """with ブロック内のGemini呼び出しの優先度を priority にする (データベース構築処理などで使用)"""
+    reset = _current_priority.set(priority)
+    try:
+        yield priority
+    finally:
+        _current_priority.reset(reset)
+
+
+def background_priority(func: Callable) -> Callable:
+    """関数内のGemini呼び出しを PRIORITY_BACKGROUND で実行するデコレータ (Builder.build など)"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with priority_scope(PRIORITY_BACKGROUND):
+            return func(*args, **kwargs)
+
+    return wrapper
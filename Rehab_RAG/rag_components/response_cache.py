@@ -0,0 +1,290 @@
+"""
+ResponseCache: 同じプロンプトに対するLLMの応答を再利用する2段 (メモリLRU + SQLite) のキャッシュ
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 共有キャッシュのディスク層の保存先 (LLM_CACHE_PATH)。応答には患者情報から生成した文章が平文で含まれるため、
+# 既定では空 (メモリのみ) とし、保存先を指定した場合だけディスク層を使う (例: .cache/llm_response_cache.sqlite3)
+DEFAULT_CACHE_PATH = ""
+
+
+class ResponseCache:
+    """
+    [手法解説: Content-addressed Cache]
+    モデル名・プロンプト・スキーマ・温度などの生成条件のハッシュをキーに、LLMの応答を保存するキャッシュ。
+    ブラウザの再接続による再実行や、同じ指示での再生成、変更のないカルテの標準化など、
+    同じプロンプトでの呼び出しはAPIを呼ばずに前回の応答を返します。
+
+    - メモリ層: 直近 max_entries 件を保持するLRU。
+    - ディスク層: SQLite に保存し、プロセスを再起動しても再利用できる。合計 disk_max_mb を超えたら古い順に削除する。
+    - どちらの層も ttl_sec を過ぎたエントリは使わない。
+    - 温度が max_temperature を超える (出力が毎回変わる) 呼び出しはキャッシュしない (cacheable)。
+    - 呼び出し箇所 (site) ごとのヒット率を get_stats() で集計する。
+
+    値は JSON にできるもの (文字列・辞書など) のみ保存できます。エラー応答は呼び出し側で put しないこと。
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_sec: float = 86400, path: Optional[str] = None,
+                 disk_max_mb: float = 100, max_temperature: float = 0.0, enabled: bool = True,
+                 clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.path = path or None
+        self.disk_max_bytes = int(disk_max_mb * 1024 * 1024)
+        self.max_temperature = max_temperature
+        self.enabled = enabled
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_failed = False
+
+    @staticmethod
+    def make_key(model: str, prompt: str, schema: Any = None, temperature: Optional[float] = None, **params) -> str:
+        """
+        生成条件からキャッシュキーを作る。
+        schema は Pydantic モデル・JSONスキーマ辞書のどちらでもよく、内容 (JSONスキーマ) が変わればキーも変わる。
+        params には max_output_tokens や format など、応答に影響するその他の設定を渡す。
+        """
+        if schema is not None and hasattr(schema, "model_json_schema"):
+            schema = schema.model_json_schema()
+        material = json.dumps(
+            {
+                "model": model,
+                "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+                "schema": schema,
+                "temperature": temperature,
+                "params": params,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def cacheable(self, temperature: Optional[float]) -> bool:
+        """この温度の呼び出しをキャッシュしてよいか (温度未指定 = APIの既定値はキャッシュしない)"""
+        return self.enabled and temperature is not None and temperature <= self.max_temperature
+
+    def get_or_generate(self, site: str, generate: Callable[[], Any], model: str, prompt: str,
+                        schema: Any = None, temperature: Optional[float] = None, **params) -> Any:
+        """
+        キャッシュにあればその応答を、なければ generate() を呼んで結果を保存してから返す。
+        キャッシュできない温度の呼び出しは常に generate() を呼ぶ (site の bypassed として数える)。
+        generate() が例外を送出した場合や空の結果は保存しない。
+        """
+        if not self.cacheable(temperature):
+            self._record(site, "bypassed")
+            return generate()
+        key = self.make_key(model, prompt, schema, temperature, **params)
+        cached = self.get(key, site)
+        if cached is not None:
+            return cached
+        value = generate()
+        if value:
+            self.put(key, value)
+        return value
+
+    def get(self, key: str, site: str = "default") -> Optional[Any]:
+        """キャッシュされた応答を返す (なければ None)。結果は site ごとのヒット率に記録する"""
+        now = self._clock()
+        value = None
+        tier = None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    value, tier = entry[0], "memory"
+                else:
+                    del self._memory[key]
+
+        if tier is None:
+            row = self._disk_get(key, now)
+            if row is not None:
+                value, expires_at = row
+                tier = "disk"
+                self._memory_put(key, value, expires_at)
+
+        self._record(site, tier)
+        # 呼び出し側が結果を書き換えてもキャッシュに影響しないよう、コピーを返す
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Any) -> None:
+        if value is None:
+            return
+        expires_at = self._clock() + self.ttl_sec
+        self._memory_put(key, copy.deepcopy(value), expires_at)
+        self._disk_put(key, value, expires_at)
+
+    def _memory_put(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """SQLiteの接続 (初回に作成する)。ロックを保持した状態で呼ぶこと"""
+        if self.path is None or self._disk_failed:
+            return None
+        if self._db is None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(self.path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                # ディスク層が使えなくてもメモリ層だけで動作を続ける
+                logger.warning(f"ResponseCache: disk tier disabled ({self.path}): {e}")
+                self._disk_failed = True
+                self._db = None
+        return self._db
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if row[1] <= now:
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    db.commit()
+                    return None
+                db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                db.commit()
+                return json.loads(row[0]), row[1]
+            except (sqlite3.Error, ValueError) as e:
+                logger.warning(f"ResponseCache: disk read failed: {e}")
+                return None
+
+    def _disk_put(self, key: str, value: Any, expires_at: float) -> None:
+        try:
+            serialized = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"ResponseCache: value is not JSON serializable, kept in memory only: {e}")
+            return
+        now = self._clock()
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, serialized, len(serialized.encode("utf-8")), expires_at, now),
+                )
+                db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                self._evict_disk(db)
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"ResponseCache: disk write failed: {e}")
+
+    def _evict_disk(self, db: sqlite3.Connection) -> None:
+        """合計サイズが上限を超えていれば、最後に使われたのが古い順に削除する"""
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.disk_max_bytes:
+                break
+
+    def _record(self, site: str, tier: Optional[str]) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                site, {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "bypassed": 0}
+            )
+            if tier is None:
+                stats["misses"] += 1
+            elif tier == "bypassed":
+                stats["bypassed"] += 1
+            else:
+                stats["hits"] += 1
+                stats[f"{tier}_hits"] += 1
+
+    def get_stats(self) -> dict:
+        """呼び出し箇所ごとのヒット率と、各層のエントリ数"""
+        with self._lock:
+            sites = {site: dict(stats) for site, stats in self._stats.items()}
+            memory_entries = len(self._memory)
+            disk = None
+            db = self._connection()
+            if db is not None:
+                try:
+                    count, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+                    disk = {"entries": count, "bytes": size}
+                except sqlite3.Error:
+                    disk = None
+        for stats in sites.values():
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return {
+            "enabled": self.enabled,
+            "max_temperature": self.max_temperature,
+            "memory_entries": memory_entries,
+            "disk": disk,
+            "sites": sites,
+        }
+
+    def clear(self) -> None:
+        """全てのエントリと統計を削除する (テスト・プロンプト変更時用)"""
+        with self._lock:
+            self._memory.clear()
+            self._stats.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM responses")
+                db.commit()
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    プロセス全体で共有するキャッシュを返す (アプリ本体と Rehab_RAG で共有)。
+    設定は初回呼び出し時の環境変数 LLM_CACHE_* で決まる。
+    LLM_CACHE_MAX_TEMPERATURE (既定 0) 以下の温度の呼び出しのみキャッシュする。
+    ディスク層は LLM_CACHE_PATH を指定した場合のみ使う (既定はメモリのみ)。
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+                ttl_sec=float(os.getenv("LLM_CACHE_TTL_SEC", "86400")),
+                path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                disk_max_mb=float(os.getenv("LLM_CACHE_DISK_MAX_MB", "100")),
+                max_temperature=float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0")),
+                enabled=os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true",
+            )
+        return _response_cache
+
+
+def response_cache_stats() -> dict:
+    """共有キャッシュの統計 (管理者用API /admin/api/llm-stats で使用)"""
+    return get_response_cache().get_stats()
@@ -16,6 +16,7 @@ from app.routers.admin import admin_bp
 from app.routers.auth import auth_bp
 from app.routers.patient import patient_bp
 from app.routers.plan import plan_bp
+from app.services.field_registry import validate_field_registry
 
 # .env ファイルの読み込み
 load_dotenv()
@@ -62,6 +63,9 @@ def create_app(test_config=None):
     app.register_blueprint(plan_bp)
     app.register_blueprint(patient_bp)
 
+    # 項目定義 (患者情報の整形・Excel出力・編集可能項目) とDBのカラムの整合性を起動時に検証する
+    validate_field_registry()
+
     # 起動時の情報をログ出力
     llm_client_type = os.getenv("LLM_CLIENT_TYPE", "gemini")
     app.logger.info(f"App initialized with LLM Client: {llm_client_type}")
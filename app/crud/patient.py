@@ -168,6 +168,11 @@ def save_patient_master_data(form_data: dict):
         # 最後に計画書の変更をコミット
         db.commit()
 
+        # 生成用にメモ化した患者の事実情報を破棄する
+        from app.services.llm.context_builder import patient_facts_cache
+
+        patient_facts_cache.invalidate(saved_patient_id)
+
         return saved_patient_id
 
     except Exception as e:
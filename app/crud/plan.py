@@ -68,6 +68,12 @@ def save_new_plan(patient_id: int, staff_id: int, form_data: dict, liked_items:
         db.add(new_plan)
         db.commit()
         db.refresh(new_plan)  # new_planオブジェクトを更新して、DBが自動採番したIDなどを反映させる
+
+        # 生成用にメモ化した患者の事実情報を破棄する
+        from app.services.llm.context_builder import patient_facts_cache
+
+        patient_facts_cache.invalidate(patient_id)
+
         print(f"   [成功] 新しい計画書(plan_id: {new_plan.plan_id})をデータベースに保存しました。")
         return new_plan.plan_id  # 保存したplan_idを返す
     except Exception as e:
@@ -1,11 +1,20 @@
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 from pymysql.err import IntegrityError
 from werkzeug.security import generate_password_hash
 
 from app.crud import patient as patient_crud
 from app.crud import staff as staff_crud
+from app.services.llm.client_pool import llm_client_pool
+from app.services.llm.context_builder import patient_facts_cache
+from app.services.llm.metrics import llm_metrics, llm_retry_stats
+from app.services.llm.plan_snapshots import plan_snapshot_store
+from app.services.llm.rehab_rag_path import REHAB_RAG_PATH  # noqa: F401  (rag_components より前に読み込む)
+from app.services.llm.schema_registry import schema_registry
+from app.services.llm.singleflight import llm_singleflight
 from app.utils.decorators import admin_required
+from rag_components.rate_limiter import rate_limiter_stats
+from rag_components.response_cache import response_cache_stats
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -110,3 +119,21 @@ def delete_staff(staff_id):
     except Exception as e:
         flash(f"削除中にエラーが発生しました: {e}", "danger")
     return redirect(url_for("admin.manage_assignments"))
+
+
+@admin_bp.route("/api/llm-stats")
+@login_required
+@admin_required
+def llm_stats():
+    """LLM呼び出し周りのキャッシュ・統計情報をJSONで返す (管理者専用)"""
+    return jsonify({
+        "schema_registry": schema_registry.get_stats(),
+        "latency": llm_metrics.get_stats(),
+        "retries": llm_retry_stats.get_stats(),
+        "client_pool": llm_client_pool.get_stats(),
+        "rate_limit": rate_limiter_stats(),
+        "response_cache": response_cache_stats(),
+        "singleflight": llm_singleflight.get_stats(),
+        "plan_snapshots": plan_snapshot_store.get_stats(),
+        "patient_facts": patient_facts_cache.get_stats(),
+    })
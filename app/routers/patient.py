@@ -1,6 +1,7 @@
+import json
 import logging
 
-from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
+from flask import Blueprint, Response, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import login_required
 
 # 自作のPythonファイルをインポート
@@ -72,8 +73,43 @@ def api_parse_patient_info():
 
     try:
         text_to_parse = data["text"]
-        parsed_data = patient_info_parser.parse_text(text_to_parse)
-        return jsonify(parsed_data)
+        parsed_data, missing_groups = patient_info_parser.parse_text_with_missing_groups(text_to_parse)
+        response = jsonify(parsed_data)
+        if missing_groups:
+            # 本文はフォームに反映する項目のみとし、部分的な結果であることはヘッダーで知らせる
+            response.headers["X-Missing-Groups"] = ",".join(missing_groups)
+        return response
     except Exception as e:
         logger.error(f"Error during parsing patient info: {e}")
         return jsonify({"error": "解析中にサーバーでエラーが発生しました。", "details": str(e)}), 500
+
+
+@patient_bp.route("/api/parse-patient-info/stream", methods=["POST"])
+@login_required
+def api_parse_patient_info_stream():
+    """
+    カルテテキストの解析結果をSSEで逐次返すAPI。
+    抽出グループ・FastExtractorの完了ごとに1イベントを送信し、最後にチェックボックス復元後の統合結果を送る。
+    """
+    if not patient_info_parser:
+        return jsonify({"error": "サーバー側でパーサーが初期化されていません。"}), 500
+
+    data = request.get_json()
+    if not data or "text" not in data or not data["text"].strip():
+        return jsonify({"error": "解析対象のテキストがありません。"}), 400
+
+    text_to_parse = data["text"]
+
+    def event_stream():
+        try:
+            for event in patient_info_parser.parse_text_stream(text_to_parse):
+                event_type = event.pop("event")
+                # 日付型などはISO形式の文字列に変換する (フロントエンドは YYYY-MM-DD を期待)
+                payload = json.dumps(event, ensure_ascii=False, default=str)
+                yield f"event: {event_type}\ndata: {payload}\n\n"
+        except Exception as e:
+            logger.error(f"Error during streaming patient info parse: {e}", exc_info=True)
+            error_data = {"error": "解析中にサーバーでエラーが発生しました。", "details": str(e)}
+            yield f"event: error\ndata: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+
+    return Response(event_stream(), mimetype="text/event-stream")
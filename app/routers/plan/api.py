@@ -1,5 +1,7 @@
 import json
 import logging
+import os
+from typing import Optional
 
 from flask import Response, jsonify, request
 from flask_login import current_user, login_required
@@ -10,9 +12,12 @@ from app.crud import plan as plan_crud
 
 # 履歴取得用にモデルとセッションをインポート
 from app.models import RehabilitationPlan
+from app.services.field_registry import get_field_registry
 
 # 【修正】個別クライアントのインポートを廃止し、ファクトリ関数を使用
 from app.services.llm import get_llm_client
+from app.services.llm.singleflight import llm_singleflight, snapshot_hash
+from app.services.llm.stream_multiplexer import multiplex_sse_streams
 from app.services.rag_manager import (
     DEFAULT_RAG_PIPELINE,
     get_rag_executor,
@@ -24,6 +29,44 @@ from . import plan_bp
 
 logger = logging.getLogger(__name__)
 
+# 汎用モデルの生成を差分生成 (前回から変わった項目だけを生成) で行うかの既定値。クエリパラメータ incremental で上書きできる
+INCREMENTAL_GENERATION_DEFAULT = os.getenv("PLAN_INCREMENTAL_GENERATION", "false").lower() == "true"
+
+# 一括再生成API (/api/regenerate/batch) で一度に指定できる項目数の上限
+MAX_BATCH_REGENERATION_ITEMS = 10
+
+
+def _incremental_requested() -> bool:
+    value = request.args.get("incremental")
+    if value is None:
+        return INCREMENTAL_GENERATION_DEFAULT
+    return value.lower() in ("1", "true", "on")
+
+
+def _is_editable_item_key(item_key) -> bool:
+    """再生成できる項目のキーか (未検証の入力をスキーマのキャッシュやプロンプトに渡さないため、処理の前に確認する)"""
+    return isinstance(item_key, str) and get_field_registry().is_editable(item_key)
+
+
+def _parse_patient_id(value) -> Optional[int]:
+    """リクエストの patient_id を整数に変換する (正の整数として解釈できなければ None)"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        patient_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return patient_id if patient_id > 0 else None
+
+
+def _generation_key(kind: str, llm_client, patient_data: dict, pipeline_name: str = None) -> tuple:
+    """
+    同じ生成をまとめるためのキー (生成の種類・クライアント・パイプライン・患者データのスナップショット)。
+    二度押しや複数タブで同じキーの生成が並行した場合は、llm_singleflight で1本の生成を共有する。
+    """
+    return (kind, llm_client.__class__.__name__, pipeline_name, snapshot_hash(patient_data))
+
+
 @plan_bp.route("/api/generate/general")
 @login_required
 def generate_general_stream():
@@ -52,8 +95,12 @@ def generate_general_stream():
         print(f"--- {client_name} で汎用モデルを実行します ---")
         logger.info(f"Calling General Stream using {client_name} for patient_id: {patient_id}")
 
-        # 統一されたインターフェースでメソッド呼び出し
-        stream_generator = llm_client.generate_plan_stream(patient_data)
+        # 統一されたインターフェースでメソッド呼び出し (同じ患者データの生成が進行中なら、そのイベントを共有する)
+        incremental = _incremental_requested()
+        stream_generator = llm_singleflight.stream(
+            _generation_key("generate.general.incremental" if incremental else "generate.general", llm_client, patient_data),
+            lambda: llm_client.generate_plan_stream(patient_data, incremental=incremental),
+        )
 
         return Response(stream_generator, mimetype="text/event-stream")
 
@@ -101,10 +148,10 @@ def generate_rag_stream(pipeline_name):
         print(f"--- {client_name} でRAGモデルを実行します ---")
         logger.info(f"Calling RAG Stream using {client_name} for patient_id: {patient_id}")
 
-        # 統一されたインターフェースでメソッド呼び出し
-        stream_generator = llm_client.generate_rag_plan_stream(
-            patient_data=patient_data,
-            rag_executor=rag_executor
+        # 統一されたインターフェースでメソッド呼び出し (同じ患者データ・パイプラインの生成が進行中なら、そのイベントを共有する)
+        stream_generator = llm_singleflight.stream(
+            _generation_key("generate.rag", llm_client, patient_data, pipeline_name),
+            lambda: llm_client.generate_rag_plan_stream(patient_data=patient_data, rag_executor=rag_executor),
         )
 
         return Response(stream_generator, mimetype="text/event-stream")
@@ -120,6 +167,70 @@ def generate_rag_stream(pipeline_name):
         return Response(error_event, mimetype="text/event-stream")
 
 
+@plan_bp.route("/api/generate/combined/<pipeline_name>")
+@login_required
+def generate_combined_stream(pipeline_name):
+    """
+    汎用モデルとRAGモデルの計画案を1本のSSEで並行生成するAPI。
+    患者データの取得は1回だけで済み、Gunicornのスレッドも1本しか占有しない。
+    各イベントの data には model_type ('general' / 'specialized') が付与され、両方の完了後に all_finished を送る。
+    """
+    try:
+        # URLのクエリパラメータから患者IDと所見を取得
+        patient_id = int(request.args.get("patient_id"))
+        therapist_notes = request.args.get("therapist_notes", "")
+
+        # 権限チェック
+        if not has_permission_for_patient(current_user, patient_id):
+            return Response("権限がありません。", status=403)
+
+        # データベースから患者データを取得 (両モデルで共有する)
+        patient_data = patient_crud.get_patient_data_for_plan(patient_id)
+        if not patient_data:
+            return Response("患者データが見つかりません。", status=404)
+
+        # 担当者の所見を患者データに含める
+        patient_data["therapist_notes"] = therapist_notes
+
+        llm_client = get_llm_client()
+        client_name = llm_client.__class__.__name__
+
+        print(f"--- {client_name} で汎用モデルとRAGモデル({pipeline_name})を並行実行します ---")
+        logger.info(f"Calling Combined Stream using {client_name} for patient_id: {patient_id}")
+
+        def rag_stream():
+            # Executorの準備 (初回はモデルの読み込みを含む) もスレッド内で行い、汎用モデルの生成を待たせない
+            rag_executor = get_rag_executor(pipeline_name)
+            if not rag_executor:
+                raise Exception(f"パイプライン '{pipeline_name}' の Executorを取得できませんでした。")
+            return llm_client.generate_rag_plan_stream(patient_data=patient_data, rag_executor=rag_executor)
+
+        # 単独のエンドポイントと同じキーを使い、別のタブで進行中の生成とも共有する
+        incremental = _incremental_requested()
+        general_key = _generation_key(
+            "generate.general.incremental" if incremental else "generate.general", llm_client, patient_data
+        )
+        rag_key = _generation_key("generate.rag", llm_client, patient_data, pipeline_name)
+        stream_generator = multiplex_sse_streams({
+            "general": lambda: llm_singleflight.stream(
+                general_key, lambda: llm_client.generate_plan_stream(patient_data, incremental=incremental)
+            ),
+            "specialized": lambda: llm_singleflight.stream(rag_key, rag_stream),
+        })
+
+        return Response(stream_generator, mimetype="text/event-stream")
+
+    except ValueError:
+        error_message = "無効な患者IDが指定されました。"
+        error_event = f"event: error\ndata: {json.dumps({'error': error_message}, ensure_ascii=False)}\n\n"
+        return Response(error_event, mimetype="text/event-stream")
+    except Exception as e:
+        logger.error(f"汎用・RAGモデルの並行ストリーム処理中にエラーが発生しました: {e}", exc_info=True)
+        error_message = "サーバーエラーが発生しました。詳細は管理者にお問い合わせください。"
+        error_event = f"event: error\ndata: {json.dumps({'error': error_message}, ensure_ascii=False)}\n\n"
+        return Response(error_event, mimetype="text/event-stream")
+
+
 @plan_bp.route("/like_suggestion", methods=["POST"])
 @login_required
 def like_suggestion():
@@ -166,6 +277,8 @@ def regenerate_item():
 
         if not all([patient_id, item_key, instruction]):
             return Response("必須パラメータが不足しています。", status=400)
+        if not _is_editable_item_key(item_key):
+            return Response("再生成できない項目です。", status=400)
 
         # 権限チェック
         if not has_permission_for_patient(current_user, patient_id):
@@ -208,6 +321,79 @@ def regenerate_item():
         return Response(error_event, mimetype="text/event-stream")
 
 
+@plan_bp.route("/api/regenerate/batch", methods=["POST"])
+@login_required
+def regenerate_items_batch():
+    """
+    複数の項目を一括でストリーミング再生成するAPI
+    リクエスト例: {"patient_id": 1, "model_type": "general", "items": [{"item_key": "...", "current_text": "...", "instruction": "..."}]}
+    患者データの取得・RAG検索・LLM呼び出しを1回にまとめ、完成した項目から順に "update" イベントを送る。
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return Response("必須パラメータが不足しています。", status=400)
+        patient_id = _parse_patient_id(data.get("patient_id"))
+        items = data.get("items") or []
+        model_type = data.get("model_type")  # 'general' or 'specialized'
+        pipeline_name = data.get("pipeline_name", DEFAULT_RAG_PIPELINE)
+
+        if not patient_id or not isinstance(items, list) or not items:
+            return Response("必須パラメータが不足しています。", status=400)
+        if len(items) > MAX_BATCH_REGENERATION_ITEMS:
+            return Response(f"一度に再生成できる項目は{MAX_BATCH_REGENERATION_ITEMS}件までです。", status=400)
+        if not all(isinstance(item, dict) and item.get("item_key") and item.get("instruction") for item in items):
+            return Response("各項目に item_key と instruction を指定してください。", status=400)
+        item_keys = [item["item_key"] for item in items]
+        if not all(_is_editable_item_key(key) for key in item_keys):
+            return Response("再生成できない項目が含まれています。", status=400)
+        if len(set(item_keys)) != len(item_keys):
+            return Response("同じ項目が複数指定されています。", status=400)
+
+        # 権限チェック
+        if not has_permission_for_patient(current_user, patient_id):
+            return Response("権限がありません。", status=403)
+
+        # 患者データを取得 (全項目で1回だけ)
+        patient_data = patient_crud.get_patient_data_for_plan(patient_id)
+        if not patient_data:
+            return Response("患者データが見つかりません。", status=404)
+
+        # モデルタイプに応じてRAG Executorを準備
+        rag_executor = None
+        if model_type == "specialized":
+            rag_executor = get_rag_executor(pipeline_name)
+            if not rag_executor:
+                raise Exception(f"パイプライン '{pipeline_name}' の Executorを取得できませんでした。")
+
+        llm_client = get_llm_client()
+        client_name = llm_client.__class__.__name__
+
+        print(f"--- {client_name} で一括再生成を実行します ({len(items)}項目, RAG: {'あり' if rag_executor else 'なし'}) ---")
+        logger.info(f"Calling Batch Regeneration Stream using {client_name} for items: {item_keys}")
+
+        stream_generator = llm_client.regenerate_plan_items_stream(
+            patient_data=patient_data,
+            items=[
+                {
+                    "item_key": item["item_key"],
+                    "current_text": item.get("current_text", ""),
+                    "instruction": item["instruction"],
+                }
+                for item in items
+            ],
+            rag_executor=rag_executor,
+        )
+
+        return Response(stream_generator, mimetype="text/event-stream")
+
+    except Exception as e:
+        logger.error(f"項目の一括再生成中にエラーが発生しました: {e}", exc_info=True)
+        error_message = "サーバーエラーが発生しました。"
+        error_event = f"event: error\ndata: {json.dumps({'error': error_message}, ensure_ascii=False)}\n\n"
+        return Response(error_event, mimetype="text/event-stream")
+
+
 @plan_bp.route("/api/plan_history/<int:patient_id>")
 @login_required
 def get_plan_history(patient_id):
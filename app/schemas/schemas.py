@@ -147,6 +147,39 @@ GENERATION_GROUPS = [
     ComprehensiveTreatmentPlan, # ステップ3: 包括的な治療計画
 ]
 
+# 生成グループごとに「これまでの生成結果」から参照する項目 (キーのグループは、値の項目だけをプロンプトに含める)
+# ここに記載のないグループには、これまでの生成結果をすべて渡します。
+# 後段のグループほど前段の項目が増えるため、目標・治療計画の記述に関係する項目に絞ってプロンプトを短くしています。
+GENERATION_GROUP_DEPENDENCIES = {
+    CurrentAssessment: ["main_comorbidities_txt"],
+    Goals: [
+        "main_comorbidities_txt",
+        "main_risks_txt",
+        "main_contraindications_txt",
+        "func_pain_txt",
+        "func_rom_limitation_txt",
+        "func_muscle_weakness_txt",
+        "func_motor_muscle_tone_abnormality_txt",
+        "func_swallowing_disorder_txt",
+        "func_disorientation_txt",
+        "func_memory_disorder_txt",
+    ],
+    ComprehensiveTreatmentPlan: [
+        "goals_1_month_txt",
+        "goals_at_discharge_txt",
+        "main_risks_txt",
+        "main_contraindications_txt",
+        "func_pain_txt",
+        "func_rom_limitation_txt",
+        "func_muscle_weakness_txt",
+        "func_motor_muscle_tone_abnormality_txt",
+        "func_swallowing_disorder_txt",
+        "func_behavioral_psychiatric_disorder_txt",
+        "func_disorientation_txt",
+        "func_memory_disorder_txt",
+    ],
+}
+
 
 class PatientMasterSchema(BaseModel):
     """カルテの自由記述テキストから抽出した患者マスタ情報。可能な限り全ての項目を埋めてください。不明な項目はnullにしてください。"""
@@ -975,6 +1008,36 @@ PATIENT_INFO_EXTRACTION_GROUPS = [
     # 今後の拡張のために他のグループもここに追加可能
 ]
 
+# 抽出グループ間の依存関係 (キーのグループは、値のグループの抽出結果をコンテキストとして参照する)
+# ここに記載のないグループは他に依存しないため、並列に抽出できます。
+# 目標系のグループは、現状評価 (ADL・基本動作・社会資源など) を踏まえて抽出させるため後段に置いています。
+PATIENT_INFO_EXTRACTION_DEPENDENCIES = {
+    PatientInfo_Goals: [PatientInfo_Basic, PatientInfo_ADL, PatientInfo_Social],
+    PatientInfo_Goal_Activity: [PatientInfo_BasicMovements, PatientInfo_ADL],
+    PatientInfo_Goal_Psychological: [PatientInfo_Function_Cognitive],
+    PatientInfo_Goal_Environment: [PatientInfo_Social],
+    PatientInfo_Goal_HumanFactors: [PatientInfo_Social],
+}
+
+# 抽出グループの臨床的な重要度 (小さいほど重要)
+# 時間予算が足りない場合でも、計画書の記入に欠かせない項目 (基本情報・リスク・ADL・基本動作・目標) から先に抽出されるようにします。
+# 依存先のグループには、依存元の重要度が自動的に引き継がれます (例: Goals が 1 なので Social も 1 として扱われる)。
+PATIENT_INFO_EXTRACTION_PRIORITIES = {
+    PatientInfo_Basic: 1,
+    PatientInfo_Function_General: 1,
+    PatientInfo_ADL: 1,
+    PatientInfo_BasicMovements: 1,
+    PatientInfo_Goals: 1,
+    PatientInfo_Function_Motor: 2,
+    PatientInfo_Function_Cognitive: 2,
+    PatientInfo_Goal_Activity: 2,
+    PatientInfo_Social: 3,
+    PatientInfo_Nutrition: 3,
+    PatientInfo_Goal_Psychological: 3,
+    PatientInfo_Goal_Environment: 3,
+    PatientInfo_Goal_HumanFactors: 3,
+}
+
 
 
 
@@ -6,8 +6,10 @@ from openpyxl import load_workbook
 from openpyxl.cell import MergedCell
 from openpyxl.styles import Font
 
+from app.services.field_registry import get_field_registry
+
 # 設定ファイルからマッピングを読み込み
-from .mappings import DATE_MAPPING, GENDER_MAPPING, OUTPUT_DIR, SELECTION_MAPPING, TEMPLATE_PATH, TEXT_MAPPING
+from .mappings import DATE_MAPPING, GENDER_MAPPING, OUTPUT_DIR, SELECTION_MAPPING, TEMPLATE_PATH
 
 
 def _get_cell_by_address(wb, sheet_name, cell_address):
@@ -98,11 +100,8 @@ def create_plan_sheet(plan_data, return_bytes=False):
         raise
 
     # 1. 基本テキスト・チェックボックスの書き込み
-    for db_col_name, (sheet_name, cell_address) in TEXT_MAPPING.items():
-        # 日付や性別など特殊処理に含まれるキーがTEXT_MAPPINGに残っている場合のガード
-        if "date" in db_col_name or db_col_name == "gender":
-            continue
-
+    # (TEXT_MAPPING のうち日付・性別など特殊処理に含まれるキーは、項目レジストリの構築時に除外済み)
+    for db_col_name, sheet_name, cell_address, is_check in get_field_registry().excel_text_cells:
         value = plan_data.get(db_col_name)
         if value is None or value == "":
             continue
@@ -111,7 +110,7 @@ def create_plan_sheet(plan_data, return_bytes=False):
         if target_cell:
             try:
                 # ブール値または `_chk` キーはチェックマークに変換
-                if isinstance(value, bool) or db_col_name.endswith("_chk"):
+                if isinstance(value, bool) or is_check:
                     is_checked = value
                     if isinstance(value, str):
                         # 文字列 "False" 等が True 判定されてしまうのを防ぐため明示的に変換
@@ -0,0 +1,93 @@
+# app/services/extraction/keyword_automaton.py
+import logging
+from collections import deque
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordAutomaton:
+    """
+    複数のキーワードをテキストの1回の走査で検索する Aho-Corasick オートマトン。
+    FastExtractor の label_mapping (スキーマキー -> キーワードリスト) から構築し、
+    ヒットしたキーワードを対応するスキーマキーへ逆引きできるようにします。
+
+    キーワード数に関係なく、検索コストは「テキスト長 + ヒット数」に比例します。
+    """
+
+    def __init__(self, keyword_map: Dict[str, List[str]]):
+        # キーワード -> スキーマキーのリスト (同じキーワードが複数項目に属する場合がある)
+        self.keyword_to_keys: Dict[str, List[str]] = {}
+        for schema_key, keywords in keyword_map.items():
+            for kw in keywords:
+                if not kw:
+                    continue
+                keys = self.keyword_to_keys.setdefault(kw, [])
+                if schema_key not in keys:
+                    keys.append(schema_key)
+
+        # トライ木 (状態ごとの遷移表)、失敗リンク、出力 (その状態で終端するキーワード)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+
+        for kw in self.keyword_to_keys:
+            self._insert(kw)
+        self._build_failure_links()
+
+        logger.debug(f"KeywordAutomaton built: {len(self.keyword_to_keys)} keywords, {len(self._goto)} states")
+
+    def _insert(self, keyword: str) -> None:
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][ch] = next_state
+            state = next_state
+        self._output[state].append(keyword)
+
+    def _build_failure_links(self) -> None:
+        """幅優先で失敗リンクを張り、接尾辞として含まれるキーワードを出力に合流させる"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                # 例: "片麻痺" の終端状態では "麻痺" も同時にヒットさせる
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """
+        テキスト中の全キーワード出現を (start, end, keyword) で返す。
+        異なるキーワード同士の重なり (「片麻痺」と「麻痺」など) はすべて報告し、
+        同一キーワードについては re.finditer と同様に重ならない出現のみを返す。
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        last_end: Dict[str, int] = {}
+
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+
+            for kw in output[state]:
+                start = i - len(kw) + 1
+                if start < last_end.get(kw, 0):
+                    continue
+                last_end[kw] = i + 1
+                yield start, i + 1, kw
+
+    def schema_keys_for(self, keyword: str) -> List[str]:
+        """キーワードに対応するスキーマキーのリストを返す"""
+        return self.keyword_to_keys.get(keyword, [])
@@ -1,4 +1,6 @@
+import bisect
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -14,10 +16,37 @@ class NegationDetector:
             "ない", "ず", "ぬ", "ん", "なし", "無く", "なく", "非", "不", 
             "陰性", "(-)", "（-）", "－", "ー", "消失", "認めず", "否定", "クリア", "せず"
         }
+        # 直後ウィンドウの否定語チェックを1つの正規表現にまとめておく
+        self.negation_pattern = re.compile(
+            "|".join(re.escape(w) for w in sorted(self.negation_words, key=len, reverse=True))
+        )
 
-    def is_negated(self, text: str, entity_info: dict, doc=None) -> bool:
+        # 直前に解析した doc のトークン開始位置インデックス (doc, [token.idx, ...])
+        # 同じテキストに対する複数ヒットの判定で再利用する
+        self._token_index = (None, [])
+
+    def _get_token_starts(self, doc) -> list:
+        """doc のトークン開始位置 (昇順) を返す。同じ doc なら構築済みのものを再利用する。"""
+        indexed_doc, token_starts = self._token_index
+        if indexed_doc is not doc:
+            token_starts = [token.idx for token in doc]
+            self._token_index = (doc, token_starts)
+        return token_starts
+
+    def _find_target_token(self, doc, start_char: int, end_char: int):
+        """[start_char, end_char) 内で始まる最後のトークンを二分探索で特定する"""
+        token_starts = self._get_token_starts(doc)
+        i = bisect.bisect_left(token_starts, end_char) - 1
+        if i >= 0 and token_starts[i] >= start_char:
+            return doc[i]
+        return None
+
+    def is_negated(self, text: str, entity_info: dict, doc=None, doc_offset: int = 0) -> bool:
         """
         抽出されたエンティティが文脈的に否定されているか判定する。
+
+        doc がテキストの一部 (ヒットを含む文など) だけを解析したものである場合は、
+        その部分の text 上での開始位置を doc_offset に渡す。
         """
         is_negated = False
         start_char = entity_info['start']
@@ -26,10 +55,7 @@ class NegationDetector:
         # 1. GiNZAによる係り受け解析 (高精度)
         if doc:
             # エンティティ範囲内の代表トークン（通常は最後の名詞）を特定
-            target_token = None
-            for token in doc:
-                if token.idx >= start_char and token.idx < end_char:
-                    target_token = token
+            target_token = self._find_target_token(doc, start_char - doc_offset, end_char - doc_offset)
             
             if target_token:
                 # A. 親(head)が否定語 (例: "麻痺" -> "なし")
@@ -50,10 +76,8 @@ class NegationDetector:
             snippet_after = text[end_char : min(len(text), end_char + window_size)]
             
             # 簡易チェック: 否定語が含まれているか
-            for neg in self.negation_words:
-                if neg in snippet_after:
-                    is_negated = True
-                    break
+            if self.negation_pattern.search(snippet_after):
+                is_negated = True
 
         return is_negated
 
@@ -67,4 +91,4 @@ class NegationDetector:
         
         # 後方10文字を取得
         snippet = text[pos + len(keyword) : pos + len(keyword) + 10]
-        return any(neg in snippet for neg in self.negation_words)
\ No newline at end of file
+        return self.negation_pattern.search(snippet) is not None
\ No newline at end of file
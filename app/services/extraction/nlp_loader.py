@@ -5,6 +5,10 @@ logger = logging.getLogger(__name__)
 
 _nlp_instance = None
 
+# 否定判定 (NegationDetector) は係り受け (head/children) と lemma しか使わないため、
+# それ以外のコンポーネントはロード後に無効化して解析を軽くする
+UNUSED_PIPES = ["ner", "morphologizer", "compound_splitter", "bunsetu_recognizer"]
+
 def load_ginza():
     """
     GiNZA (spaCy) モデルをロードし、シングルトンとして返します。
@@ -19,7 +23,11 @@ def load_ginza():
             except OSError:
                 logger.info("ja_ginza_electra not found. Loading ja_ginza...")
                 _nlp_instance = spacy.load("ja_ginza")
-            logger.info("GiNZA loaded successfully.")
+
+            for pipe_name in UNUSED_PIPES:
+                if pipe_name in _nlp_instance.pipe_names:
+                    _nlp_instance.disable_pipe(pipe_name)
+            logger.info(f"GiNZA loaded successfully. Active pipes: {_nlp_instance.pipe_names}")
         except Exception as e:
             logger.error(f"Failed to load GiNZA: {e}. Please install with `pip install ja_ginza`.")
             _nlp_instance = None
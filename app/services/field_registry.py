@@ -0,0 +1,249 @@
+import logging
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 患者の事実情報 (prepare_patient_facts) のカテゴリを、キーのプレフィックスで判定する規則 (上から順に判定)
+CATEGORY_PREFIX_RULES = [
+    (("header_", "main_"), "基本情報"),
+    (("func_basic_",), "基本動作"),
+    (("nutrition_",), "栄養状態"),
+    (("social_",), "社会保障サービス"),
+    (("goal_p_",), "目標（参加）"),
+    (("goal_a_",), "目標（活動）"),
+    (("goal_s_",), "目標（環境・対応）"),
+    (("func_",), "心身機能・構造"),
+]
+
+# 年齢は生年月日から計算する値のため、DBのカラムではないが計画書データに含まれる
+COMPUTED_KEYS = frozenset({"age"})
+
+
+def classify_category(key: str) -> Optional[str]:
+    """キーのプレフィックスから、患者の事実情報のカテゴリを返す (該当しなければ None)"""
+    for prefixes, category in CATEGORY_PREFIX_RULES:
+        if key.startswith(prefixes):
+            return category
+    return None
+
+
+class FieldMetadata:
+    """1項目分のメタデータ"""
+
+    __slots__ = ("key", "label", "category", "check_key", "text_key", "excel_cell", "editable", "user_input")
+
+    def __init__(
+        self,
+        key: str,
+        label: Optional[str] = None,
+        category: Optional[str] = None,
+        check_key: Optional[str] = None,
+        text_key: Optional[str] = None,
+        excel_cell: Optional[Tuple[str, str]] = None,
+        editable: bool = False,
+        user_input: bool = False,
+    ):
+        self.key = key
+        self.label = label  # 日本語名 (CELL_NAME_MAPPING)
+        self.category = category  # 患者の事実情報のカテゴリ
+        self.check_key = check_key  # 詳細テキストに対応するチェックボックスのキー
+        self.text_key = text_key  # チェックボックスに対応する詳細テキストのキー
+        self.excel_cell = excel_cell  # (シート名, セル番地)
+        self.editable = editable
+        self.user_input = user_input  # ユーザーの入力をそのまま使う項目 (AIが生成しない)
+
+    def __repr__(self) -> str:
+        return f"FieldMetadata({self.key!r}, label={self.label!r}, category={self.category!r})"
+
+
+class FieldRegistry:
+    """
+    項目ごとのメタデータ (カテゴリ・対応するチェックボックス・Excelのセル・日本語名・編集可否) をまとめたレジストリ。
+
+    CELL_NAME_MAPPING・CHECK_TO_TEXT_MAP・USER_INPUT_FIELDS (context_builder)、TEXT_MAPPING (excel/mappings)、
+    EDITABLE_KEYS の各表を起動時に1回だけ読み込み、項目のキーから辞書で引けるようにします。
+    生成結果の後処理やExcel出力のたびに、各表を線形に探索しないためのものです。
+    """
+
+    def __init__(
+        self,
+        cell_names: Dict[str, str],
+        check_to_text: Dict[str, str],
+        user_input_fields: Iterable[str],
+        excel_text_mapping: Dict[str, Tuple[str, str]],
+        editable_keys: Iterable[str],
+    ):
+        self._check_to_text = dict(check_to_text)
+        self._user_input_fields = list(user_input_fields)
+        self._editable_keys = list(editable_keys)
+        self._fields: Dict[str, FieldMetadata] = {}
+
+        def field(key: str) -> FieldMetadata:
+            if key not in self._fields:
+                self._fields[key] = FieldMetadata(key, category=classify_category(key))
+            return self._fields[key]
+
+        for key, label in cell_names.items():
+            field(key).label = label
+        for chk_key, txt_key in self._check_to_text.items():
+            field(chk_key).text_key = txt_key
+            field(txt_key).check_key = chk_key
+        for key, cell in excel_text_mapping.items():
+            field(key).excel_cell = cell
+        for key in self._editable_keys:
+            field(key).editable = True
+        for key in self._user_input_fields:
+            field(key).user_input = True
+
+        # prepare_patient_facts で「通常項目」として扱う (キー, 日本語名, カテゴリ)。
+        # チェックボックスと詳細テキストのペアは別に処理するため除く
+        self.fact_fields: Dict[str, Tuple[str, str]] = {
+            key: (meta.label, meta.category)
+            for key, meta in self._fields.items()
+            if meta.label and meta.category and meta.check_key is None and meta.text_key is None
+        }
+        # チェックボックスと詳細テキストのペア (チェックボックスのキー, 詳細テキストのキー, 日本語名)
+        self.check_pairs: List[Tuple[str, str, str]] = [
+            (chk_key, txt_key, self._fields[chk_key].label)
+            for chk_key, txt_key in self._check_to_text.items()
+            if self._fields[chk_key].label
+        ]
+        # Excelの基本テキスト・チェックボックスの書き込み対象 (キー, シート名, セル番地, チェックボックスか)。
+        # 日付・性別は writer の特殊処理で書き込むため除く
+        self.excel_text_cells: List[Tuple[str, str, str, bool]] = [
+            (key, sheet_name, cell_address, key.endswith("_chk"))
+            for key, (sheet_name, cell_address) in excel_text_mapping.items()
+            if "date" not in key and key != "gender"
+        ]
+        self.editable_keys: FrozenSet[str] = frozenset(self._editable_keys)
+
+    def get(self, key: str) -> Optional[FieldMetadata]:
+        return self._fields.get(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._fields
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def category(self, key: str) -> Optional[str]:
+        meta = self._fields.get(key)
+        return meta.category if meta else classify_category(key)
+
+    def label(self, key: str) -> Optional[str]:
+        meta = self._fields.get(key)
+        return meta.label if meta else None
+
+    def check_key_for(self, text_key: str) -> Optional[str]:
+        """詳細テキストのキーに対応するチェックボックスのキー (例: func_pain_txt -> func_pain_chk)"""
+        meta = self._fields.get(text_key)
+        return meta.check_key if meta else None
+
+    def is_paired(self, key: str) -> bool:
+        """チェックボックスと詳細テキストのペアに含まれる項目か"""
+        meta = self._fields.get(key)
+        return bool(meta and (meta.check_key or meta.text_key))
+
+    def excel_cell(self, key: str) -> Optional[Tuple[str, str]]:
+        meta = self._fields.get(key)
+        return meta.excel_cell if meta else None
+
+    def is_editable(self, key: str) -> bool:
+        return key in self.editable_keys
+
+    def validate(
+        self,
+        plan_columns: Iterable[str],
+        patient_columns: Iterable[str] = (),
+        selection_keys: Iterable[str] = (),
+        date_prefixes: Iterable[str] = (),
+    ) -> Tuple[List[str], List[str]]:
+        """
+        各表の項目を RehabilitationPlan (と Patient) のカラムと照合し、(エラー, 警告) のメッセージを返す。
+
+        - エラー: 生成・後処理・Excel出力が正しく動かなくなる不整合
+          (チェックボックスと詳細テキストのペア、ユーザー入力項目、選択肢・日付の項目がカラムにない)
+        - 警告: フォームやExcelテンプレート用の仮想的なキーなど、カラムにないが動作には影響しない項目
+        """
+        plan_columns = set(plan_columns)
+        columns = plan_columns | set(patient_columns) | COMPUTED_KEYS
+        errors: List[str] = []
+        warnings: List[str] = []
+
+        for chk_key, txt_key in self._check_to_text.items():
+            for key in (chk_key, txt_key):
+                if key not in plan_columns:
+                    errors.append(f"CHECK_TO_TEXT_MAP: '{key}' は RehabilitationPlan のカラムにありません")
+        for key in self._user_input_fields:
+            if key not in plan_columns:
+                errors.append(f"USER_INPUT_FIELDS: '{key}' は RehabilitationPlan のカラムにありません")
+        for key in selection_keys:
+            if key not in plan_columns:
+                errors.append(f"SELECTION_MAPPING: '{key}' は RehabilitationPlan のカラムにありません")
+        date_part_keys = set()
+        for prefix in date_prefixes:
+            if f"{prefix}_date" not in plan_columns:
+                errors.append(f"DATE_MAPPING: '{prefix}_date' は RehabilitationPlan のカラムにありません")
+            date_part_keys.update(f"{prefix}_{part}_txt" for part in ("year", "month", "day"))
+
+        for key, meta in self._fields.items():
+            if key in columns or key in date_part_keys or meta.check_key or meta.text_key or meta.user_input:
+                continue
+            sources = [
+                name
+                for name, present in (
+                    ("CELL_NAME_MAPPING", meta.label),
+                    ("TEXT_MAPPING", meta.excel_cell),
+                    ("EDITABLE_KEYS", meta.editable),
+                )
+                if present
+            ]
+            warnings.append(f"{'/'.join(sources)}: '{key}' はDBのカラムにありません")
+
+        return errors, warnings
+
+
+def _build_field_registry() -> FieldRegistry:
+    from app.services.excel.mappings import TEXT_MAPPING
+    from app.services.llm.context_builder import CELL_NAME_MAPPING, CHECK_TO_TEXT_MAP, USER_INPUT_FIELDS
+    from app.services.plan_service import EDITABLE_KEYS
+
+    return FieldRegistry(CELL_NAME_MAPPING, CHECK_TO_TEXT_MAP, USER_INPUT_FIELDS, TEXT_MAPPING, EDITABLE_KEYS)
+
+
+_registry: Optional[FieldRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_field_registry() -> FieldRegistry:
+    """アプリケーション全体で共有するレジストリを返す (最初の呼び出しで各表から構築する)"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = _build_field_registry()
+    return _registry
+
+
+def validate_field_registry() -> List[str]:
+    """
+    起動時に、レジストリの項目を RehabilitationPlan / Patient のカラムと照合する。
+    警告はログに出力し、エラーがあれば ValueError を送出する。警告のメッセージのリストを返す。
+    """
+    from app.models import Patient, RehabilitationPlan
+    from app.services.excel.mappings import DATE_MAPPING, SELECTION_MAPPING
+
+    registry = get_field_registry()
+    errors, warnings = registry.validate(
+        RehabilitationPlan.__table__.columns.keys(),
+        Patient.__table__.columns.keys(),
+        selection_keys=SELECTION_MAPPING.keys(),
+        date_prefixes=DATE_MAPPING.keys(),
+    )
+    if warnings:
+        logger.warning(f"Field registry: {len(warnings)} keys are not DB columns: " + "; ".join(warnings))
+    if errors:
+        raise ValueError("項目定義とDBのカラムが一致しません:\n" + "\n".join(errors))
+    logger.info(f"Field registry validated: {len(registry)} fields")
+    return warnings
@@ -4,6 +4,7 @@ import os
 from dotenv import load_dotenv
 
 from app.services.llm.base import LLMClient
+from app.services.llm.client_pool import llm_client_pool
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -11,18 +12,26 @@ logger = logging.getLogger(__name__)
 def get_llm_client() -> LLMClient:
     """
     環境変数 LLM_CLIENT_TYPE に基づいて適切なLLMクライアントインスタンスを返すファクトリ関数。
+    インスタンスは種類ごとにプロセス全体で1つだけ生成し、全リクエストで共有する (llm_client_pool)。
 
     Returns:
-        LLMClient: GeminiClient または OllamaClient のインスタンス
+        LLMClient: GeminiClient, OllamaClient または MockLLMClient のインスタンス
     """
     # デフォルトは gemini とする
     client_type = os.getenv("LLM_CLIENT_TYPE", "gemini").lower()
+    return llm_client_pool.get_client(client_type, _create_llm_client)
 
+
+def _create_llm_client(client_type: str) -> LLMClient:
     logger.info(f"Initializing LLM Client type: {client_type}")
 
     if client_type == "ollama":
         from app.services.llm.ollama import OllamaClient
         return OllamaClient()
+    elif client_type == "mock":
+        # CPU専用のテスト・計測環境向け (実際の生成は行わない)
+        from app.services.llm.mock import MockLLMClient
+        return MockLLMClient()
     else:
         # gemini またはその他の値の場合
         from app.services.llm.gemini import GeminiClient
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Generator, Optional, Type
+from typing import Any, Dict, Generator, List, Optional, Type
 
 from pydantic import BaseModel
 
@@ -14,12 +14,14 @@ class LLMClient(ABC):
     """
 
     @abstractmethod
-    def generate_plan_stream(self, patient_data: Dict[str, Any]) -> Generator[str, None, None]:
+    def generate_plan_stream(self, patient_data: Dict[str, Any], incremental: bool = False) -> Generator[str, None, None]:
         """
         患者データから計画書を生成し、Server-Sent Events (SSE) 形式の文字列をストリーミングでyieldします。
 
         Args:
             patient_data: 患者情報の辞書
+            incremental: Trueの場合、同じ患者の前回の生成から参照先の患者データが変わった項目だけを生成し、
+                         残りの項目は前回の生成結果を送る (plan_snapshots.py)
 
         Yields:
             str: "event: update\ndata: {...}\n\n" 形式のSSE文字列
@@ -50,6 +52,40 @@ class LLMClient(ABC):
         """
         pass
 
+    def regenerate_plan_items_stream(
+        self,
+        patient_data: Dict[str, Any],
+        items: List[Dict[str, str]],
+        rag_executor: Optional[RAGExecutor] = None
+    ) -> Generator[str, None, None]:
+        """
+        複数の項目を、それぞれの修正指示に基づいて一括で再生成し、SSE形式でyieldします。
+        各項目の "update" イベント (key, chunk) を送り、全項目の完了後に "finished" を1回送ります。
+
+        既定の実装は regenerate_plan_item_stream() を項目ごとに順に呼び出します。
+        GeminiClient / OllamaClient は、患者情報の整形とRAG検索を1回にまとめ、
+        全項目を含むスキーマで1回の構造化出力として生成するようにオーバーライドしています。
+
+        Args:
+            patient_data: 患者情報の辞書
+            items: 再生成対象のリスト。各要素は item_key, current_text, instruction を持つ辞書
+            rag_executor: 専門知識検索用のRAGExecutor（任意）
+        """
+        for item in items:
+            for event in self.regenerate_plan_item_stream(
+                patient_data,
+                item["item_key"],
+                item.get("current_text", ""),
+                item["instruction"],
+                rag_executor=rag_executor,
+            ):
+                if event.startswith("event: finished"):
+                    continue
+                yield event
+                if event.startswith("event: error"):
+                    return
+        yield "event: finished\ndata: {}\n\n"
+
     @abstractmethod
     def generate_rag_plan_stream(
         self,
@@ -77,6 +113,15 @@ class LLMClient(ABC):
         """
         pass
 
+    def generate_json_with_prefix(self, prefix: str, suffix: str, schema: Type[BaseModel]) -> Dict[str, Any]:
+        """
+        プロンプトを「複数回の呼び出しで共通のプレフィックス (指示 + カルテ全文)」と
+        「呼び出しごとに変わるサフィックス (スキーマ + これまでの結果)」に分けて構造化データを生成する。
+        プレフィックスのキャッシュに対応したクライアントはこのメソッドを上書きする。
+        既定の実装では単純に連結して generate_json を呼び出す。
+        """
+        return self.generate_json(prefix + suffix, schema)
+
     def generate_text(self, prompt: str) -> str:
         """
         プレーンテキストを生成する。
@@ -0,0 +1,73 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+
+class CallCancelledError(RuntimeError):
+    """締め切りの超過・打ち切りにより、LLM呼び出しを開始 (継続) しなかったことを表す例外"""
+
+
+class CancelToken:
+    """
+    1回の処理 (抽出グループ1つ分など) に割り当てられた締め切りと打ち切りフラグ。
+
+    実行中のスレッドは外から止められないため、LLMクライアント側が呼び出し前・リトライ前に
+    このトークンを確認し、締め切りを過ぎていればAPIを呼ばずに終了します。
+    HTTPのタイムアウトにも remaining() を使うことで、呼び出し中のリクエストも締め切りで切り上げます。
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        # time.time() 基準の締め切り時刻 (None なら無制限)
+        self.deadline = deadline
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def remaining(self) -> Optional[float]:
+        """締め切りまでの残り秒数 (締め切りがなければ None)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise CallCancelledError("LLM call cancelled (deadline exceeded)")
+
+
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar(
+    "llm_cancel_token", default=None
+)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    """現在のスレッドで有効なキャンセルトークン (スケジューラ外からの呼び出しでは None)"""
+    return _current_token.get()
+
+
+@contextmanager
+def cancel_scope(token: Optional[CancelToken]) -> Iterator[Optional[CancelToken]]:
+    """with ブロック内のLLM呼び出しに token を適用する"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def run_with_token(token: CancelToken, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    func を token のスコープ内で実行する (ワーカースレッドに投入する関数のラッパー)。
+    スレッドプールでのキュー待ちの間に締め切りを過ぎていれば、func を呼ばずに CallCancelledError を送出する。
+    """
+    with cancel_scope(token):
+        token.raise_if_cancelled()
+        return func(*args, **kwargs)
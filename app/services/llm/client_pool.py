@@ -0,0 +1,154 @@
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from app.services.llm.cancellation import CallCancelledError, current_cancel_token
+from app.services.llm.metrics import llm_metrics
+
+logger = logging.getLogger(__name__)
+
+# バックエンドごとの同時呼び出し数の上限 (環境変数 LLM_MAX_IN_FLIGHT_<BACKEND> で上書き可能)
+# ローカルのOllamaは同時に処理できるリクエスト数 (OLLAMA_NUM_PARALLEL) が小さいため、Geminiより低くしておく
+DEFAULT_IN_FLIGHT_LIMITS = {"gemini": 16, "ollama": 4}
+DEFAULT_IN_FLIGHT_LIMIT = 8
+
+# Ollamaサーバーとの接続を使い回す時間 (秒)。httpx の既定値 (5秒) では、グループ間の待ち時間で接続が切れてしまう
+OLLAMA_HTTP_KEEPALIVE_SEC = float(os.getenv("OLLAMA_HTTP_KEEPALIVE_SEC", "300"))
+# 締め切り付きの呼び出しで使うHTTPタイムアウトの刻み (秒)。タイムアウトごとに接続プールを作るため、値を丸めて共有する
+OLLAMA_TIMEOUT_BUCKET_SEC = 5
+
+
+class LLMClientPool:
+    """
+    LLMクライアントとその接続をプロセス全体で共有するレジストリ。
+
+    - get_client(): GeminiClient / OllamaClient などを種類ごとに1つだけ生成し、全リクエストとパーサーで共有する
+    - ollama_http_client(): Ollamaサーバーへの ollama.Client (httpx の接続プール) をホストごとに共有し、keep-alive で接続を再利用する
+    - slot(): バックエンドごとの同時呼び出し数の上限。空きを待った時間を llm_metrics に "<backend>.queue_wait" として記録する
+
+    状態は管理者用API (/admin/api/llm-stats) の client_pool で確認できます。
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self._lock = threading.Lock()
+        self._limits = dict(limits or {})
+        self._clients: Dict[str, Any] = {}
+        self._http_clients: Dict[Tuple[str, Optional[float]], Any] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+
+    def get_client(self, client_type: str, factory: Callable[[str], Any]) -> Any:
+        """client_type のクライアントを返す (初回のみ factory で生成する)"""
+        with self._lock:
+            client = self._clients.get(client_type)
+            if client is None:
+                client = factory(client_type)
+                self._clients[client_type] = client
+            return client
+
+    def limit(self, backend: str) -> int:
+        if backend not in self._limits:
+            default = DEFAULT_IN_FLIGHT_LIMITS.get(backend, DEFAULT_IN_FLIGHT_LIMIT)
+            self._limits[backend] = max(1, int(os.getenv(f"LLM_MAX_IN_FLIGHT_{backend.upper()}", default)))
+        return self._limits[backend]
+
+    def _semaphore(self, backend: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if backend not in self._semaphores:
+                self._semaphores[backend] = threading.BoundedSemaphore(self.limit(backend))
+                self._in_flight[backend] = 0
+                self._waiting[backend] = 0
+            return self._semaphores[backend]
+
+    @contextmanager
+    def slot(self, backend: str) -> Iterator[None]:
+        """
+        backend への同時呼び出し数の上限内で実行する。空きがなければ待つ。
+        抽出スケジューラのタイムスライス内では、締め切りまでに空かなければ CallCancelledError を送出する。
+        """
+        semaphore = self._semaphore(backend)
+        token = current_cancel_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        remaining = token.remaining() if token is not None else None
+
+        with self._lock:
+            self._waiting[backend] += 1
+        start = time.time()
+        try:
+            acquired = semaphore.acquire(timeout=remaining) if remaining is not None else semaphore.acquire()
+        finally:
+            waited = time.time() - start
+            with self._lock:
+                self._waiting[backend] -= 1
+        llm_metrics.record(f"{backend}.queue_wait", waited)
+        if not acquired:
+            raise CallCancelledError(f"LLM call cancelled (no free {backend} slot before the deadline)")
+
+        with self._lock:
+            self._in_flight[backend] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[backend] -= 1
+            semaphore.release()
+
+    def ollama_http_client(self, host: str, timeout: Optional[float] = None):
+        """
+        host への ollama.Client を返す (ホスト・タイムアウトごとに共有)。
+        timeout は OLLAMA_TIMEOUT_BUCKET_SEC 単位に切り上げ、作成する接続プールの数を抑える。
+        """
+        import httpx
+        import ollama
+
+        if timeout is not None:
+            timeout = float(math.ceil(timeout / OLLAMA_TIMEOUT_BUCKET_SEC) * OLLAMA_TIMEOUT_BUCKET_SEC)
+        key = (host, timeout)
+        with self._lock:
+            http_client = self._http_clients.get(key)
+            if http_client is None:
+                http_client = ollama.Client(
+                    host=host,
+                    timeout=timeout,
+                    limits=httpx.Limits(
+                        max_keepalive_connections=self.limit("ollama"),
+                        keepalive_expiry=OLLAMA_HTTP_KEEPALIVE_SEC,
+                    ),
+                )
+                self._http_clients[key] = http_client
+                logger.info(f"LLMClientPool: created Ollama HTTP client for {host} (timeout={timeout})")
+            return http_client
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "clients": sorted(self._clients),
+                "ollama_http_clients": len(self._http_clients),
+                "backends": {
+                    backend: {
+                        "limit": self._limits[backend],
+                        "in_flight": self._in_flight[backend],
+                        "waiting": self._waiting[backend],
+                    }
+                    for backend in self._semaphores
+                },
+            }
+
+    def clear(self) -> None:
+        """共有しているクライアントを破棄する (テスト・設定変更用。実行中の呼び出しがない状態で使うこと)"""
+        with self._lock:
+            self._clients.clear()
+            self._http_clients.clear()
+            self._semaphores.clear()
+            self._in_flight.clear()
+            self._waiting.clear()
+
+
+# アプリケーション全体で共有するプール
+llm_client_pool = LLMClientPool()
@@ -1,6 +1,12 @@
+import hashlib
+import json
 import logging
+import threading
+from collections import OrderedDict
 from datetime import date
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.field_registry import get_field_registry
 
 logger = logging.getLogger(__name__)
 
@@ -359,6 +365,38 @@ CHECK_TO_TEXT_MAP = {
 # ユーザー入力フィールド
 USER_INPUT_FIELDS = ["main_comorbidities_txt"]
 
+# 計画書の各項目が参照する患者データ (prepare_patient_facts のカテゴリ)
+# 差分生成 (generate_plan_stream の incremental=True) で、変化したカテゴリを参照する項目だけを生成し直すために使う。
+# ここに記載のない項目は、いずれかのカテゴリが変化したら生成し直す。
+_FUNCTION_FACTS = ["基本情報", "心身機能・構造"]
+_NARRATIVE_GOAL_FACTS = ["基本情報", "基本動作", "ADL評価", "社会保障サービス", "目標（参加）", "目標（活動）", "目標（環境・対応）", "担当者からの所見"]
+PLAN_FIELD_FACT_DEPENDENCIES = {
+    "main_risks_txt": ["基本情報", "心身機能・構造", "基本動作", "ADL評価", "栄養状態", "担当者からの所見"],
+    "main_contraindications_txt": ["基本情報", "心身機能・構造", "担当者からの所見"],
+    "func_pain_txt": _FUNCTION_FACTS,
+    "func_rom_limitation_txt": _FUNCTION_FACTS,
+    "func_muscle_weakness_txt": _FUNCTION_FACTS,
+    "func_swallowing_disorder_txt": _FUNCTION_FACTS + ["栄養状態"],
+    "func_behavioral_psychiatric_disorder_txt": _FUNCTION_FACTS,
+    "func_nutritional_disorder_txt": _FUNCTION_FACTS + ["栄養状態"],
+    "func_excretory_disorder_txt": _FUNCTION_FACTS + ["ADL評価"],
+    "func_pressure_ulcer_txt": _FUNCTION_FACTS + ["栄養状態"],
+    "func_contracture_deformity_txt": _FUNCTION_FACTS,
+    "func_motor_muscle_tone_abnormality_txt": _FUNCTION_FACTS,
+    "func_disorientation_txt": _FUNCTION_FACTS,
+    "func_memory_disorder_txt": _FUNCTION_FACTS,
+    "goals_1_month_txt": _NARRATIVE_GOAL_FACTS,
+    "goals_at_discharge_txt": _NARRATIVE_GOAL_FACTS,
+    "policy_treatment_txt": ["基本情報", "心身機能・構造", "基本動作", "ADL評価", "担当者からの所見"],
+    "policy_content_txt": ["基本情報", "心身機能・構造", "基本動作", "ADL評価", "担当者からの所見"],
+    "adl_equipment_and_assistance_details_txt": ["基本情報", "基本動作", "ADL評価"],
+    "goal_a_action_plan_txt": ["基本動作", "ADL評価", "目標（活動）", "担当者からの所見"],
+    "goal_s_env_action_plan_txt": ["社会保障サービス", "目標（環境・対応）", "担当者からの所見"],
+    "goal_p_action_plan_txt": ["基本情報", "目標（参加）", "担当者からの所見"],
+    "goal_s_psychological_action_plan_txt": ["心身機能・構造", "目標（環境・対応）", "担当者からの所見"],
+    "goal_s_3rd_party_action_plan_txt": ["社会保障サービス", "目標（環境・対応）", "担当者からの所見"],
+}
+
 
 def format_value(value: Any) -> Optional[str]:
     """値を人間が読みやすい形に整形する"""
@@ -410,46 +448,22 @@ def prepare_patient_facts(patient_data: Dict[str, Any]) -> Dict[str, Any]:
     facts["基本情報"]["性別"] = format_value(patient_data.get("gender"))
 
     # 1. 通常項目の処理（マッピング定義に基づいてデータを振り分け）
+    # 日本語名とカテゴリ (プレフィックスで判定) は、項目レジストリで起動時に解決済み
+    registry = get_field_registry()
     for key, value in patient_data.items():
-        formatted_value = format_value(value)
-        if formatted_value is None or formatted_value == "なし":
-            continue
-
-        if key in CHECK_TO_TEXT_MAP or key in CHECK_TO_TEXT_MAP.values():
+        field = registry.fact_fields.get(key)
+        if field is None:
             continue
 
-        jp_name = CELL_NAME_MAPPING.get(key)
-        if not jp_name:
+        formatted_value = format_value(value)
+        if formatted_value is None or formatted_value == "なし":
             continue
 
-        category = None
-        # プレフィックスでカテゴリを判定
-        if key.startswith(("header_", "main_")):
-            category = "基本情報"
-        elif key.startswith("func_basic_"):
-            category = "基本動作"
-        elif key.startswith("nutrition_"):
-            category = "栄養状態"
-        elif key.startswith("social_"):
-            category = "社会保障サービス"
-        elif key.startswith("goal_p_"):
-            category = "目標（参加）"
-        elif key.startswith("goal_a_"):
-            category = "目標（活動）"
-        elif key.startswith("goal_s_"):
-            category = "目標（環境・対応）"
-        elif key.startswith("func_"):
-            category = "心身機能・構造"
-
-        if category:
-            facts[category][jp_name] = formatted_value
+        jp_name, category = field
+        facts[category][jp_name] = formatted_value
 
     # 2. チェックボックス + テキストのペア項目を処理
-    for chk_key, txt_key in CHECK_TO_TEXT_MAP.items():
-        jp_name = CELL_NAME_MAPPING.get(chk_key)
-        if not jp_name:
-            continue
-
+    for chk_key, txt_key, jp_name in registry.check_pairs:
         is_checked_value = patient_data.get(chk_key)
         is_truly_checked = str(is_checked_value).lower() in ["true", "1", "on"]
 
@@ -497,3 +511,86 @@ def prepare_patient_facts(patient_data: Dict[str, Any]) -> Dict[str, Any]:
             del facts[cat]
 
     return facts
+
+
+def _facts_cache_key(patient_data: Dict[str, Any]) -> Optional[Tuple[Any, Any, str]]:
+    """患者ID・最新の計画書ID・所見のハッシュ。患者IDがないデータ (DBを経由しない入力) はキャッシュしない"""
+    patient_id = patient_data.get("patient_id")
+    if patient_id is None:
+        return None
+    notes = str(patient_data.get("therapist_notes") or "").strip()
+    return (patient_id, patient_data.get("plan_id"), hashlib.sha256(notes.encode("utf-8")).hexdigest())
+
+
+class PatientFactsCache:
+    """
+    prepare_patient_facts() の結果と、そのJSON文字列をメモ化するキャッシュ。
+    キーは (患者ID, 最新の計画書ID, 所見のハッシュ) で、同じ患者・同じ計画書に対する生成・RAG・再生成で使い回します。
+    患者データの変更は必ず新しい計画書として保存されるため (save_patient_master_data / save_new_plan)、
+    計画書IDが変われば別のキーになります。保存時には invalidate() で古いエントリも削除します。
+    返す辞書は呼び出し元で共有されるため、変更しないこと。
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Any, Any, str], Tuple[Dict[str, Any], str]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, patient_data: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        """患者データの事実情報 (辞書) と、プロンプトに埋め込むJSON文字列を返す"""
+        key = _facts_cache_key(patient_data)
+        if key is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry
+
+        facts = prepare_patient_facts(patient_data)
+        entry = (facts, json.dumps(facts, indent=2, ensure_ascii=False, default=str))
+        with self._lock:
+            self._misses += 1
+            if key is not None:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, patient_id: Any) -> None:
+        """患者の事実情報のキャッシュを全て削除する (患者データ・計画書の保存時に呼ぶ)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == patient_id]:
+                del self._entries[key]
+            self._invalidations += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "hit_ratio": round(self._hits / total, 3) if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+            self._invalidations = 0
+
+
+# アプリケーション全体で共有するキャッシュ
+patient_facts_cache = PatientFactsCache()
+
+
+def get_patient_facts(patient_data: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """prepare_patient_facts() の結果とJSON文字列を、patient_facts_cache を経由して返す"""
+    return patient_facts_cache.get(patient_data)
@@ -0,0 +1,272 @@
+import concurrent.futures
+import heapq
+import logging
+import math
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from app.services.llm.cancellation import CallCancelledError, CancelToken, run_with_token
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionScheduler:
+    """
+    抽出グループの依存グラフ (DAG) に従って、LLM呼び出しを並列に実行するスケジューラ。
+
+    依存先がすべて完了したグループから順に実行キューへ投入し、最大 max_concurrency 件まで同時に実行します。
+    これにより、全体の所要時間は「全グループの合計」ではなく「依存関係のクリティカルパス」に近づきます。
+
+    各グループには、推移的な依存先グループの抽出結果だけをマージしたコンテキストが渡されます。
+    依存先が失敗・タイムアウトした場合も、後続グループは (その分のコンテキスト無しで) 実行されます。
+
+    全体の締め切り (deadline) がある場合は、次のように時間を配分します。
+    - 実行可能なグループは優先度 (priorities, 小さいほど重要) の順に投入し、予算が足りなくなったときに
+      欠けるのが重要度の低いグループになるようにします。優先度は依存先にも引き継がれます。
+    - 各グループには開始時点の「残り時間 / 残りの実行段数」をタイムスライスとして割り当てます
+      (min_slice 以上、group_timeout 以下)。早く終わったグループの余りは後続のグループに回ります。
+    - タイムスライスを超えたグループは CancelToken を通じて打ち切り、結果を待たずに見捨てます。
+      見捨てたスレッドがワーカーを占有していても、後続グループは待たされずにすぐ開始されます。
+      残り時間が min_slice に満たない場合、そのグループは開始せずに skipped とします。
+    """
+
+    def __init__(
+        self,
+        groups: List[type],
+        dependencies: Optional[Dict[type, List[type]]] = None,
+        max_concurrency: int = 4,
+        group_timeout: float = 180,
+        priorities: Optional[Dict[type, int]] = None,
+        min_slice: float = 0.0,
+    ):
+        self.groups = list(groups)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.group_timeout = group_timeout
+        self.min_slice = min_slice
+        self._order = {g: i for i, g in enumerate(self.groups)}
+
+        dependencies = dependencies or {}
+        self.dependencies: Dict[type, List[type]] = {}
+        for group in self.groups:
+            deps = dependencies.get(group, [])
+            unknown = [d.__name__ for d in deps if d not in self._order]
+            if unknown:
+                raise ValueError(f"{group.__name__} が未登録のグループに依存しています: {unknown}")
+            self.dependencies[group] = list(deps)
+
+        self.dependents: Dict[type, List[type]] = {g: [] for g in self.groups}
+        for group, deps in self.dependencies.items():
+            for dep in deps:
+                self.dependents[dep].append(group)
+
+        self._check_acyclic()
+        self.ancestors = {g: self._collect_ancestors(g) for g in self.groups}
+        self.priorities = self._inherit_priorities(priorities or {})
+
+    def _check_acyclic(self) -> None:
+        """Kahnのアルゴリズムで循環依存がないことを確認する"""
+        in_degree = {g: len(deps) for g, deps in self.dependencies.items()}
+        queue = [g for g, n in in_degree.items() if n == 0]
+        visited = 0
+        while queue:
+            group = queue.pop()
+            visited += 1
+            for child in self.dependents[group]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    queue.append(child)
+        if visited != len(self.groups):
+            cyclic = [g.__name__ for g, n in in_degree.items() if n > 0]
+            raise ValueError(f"抽出グループの依存関係が循環しています: {cyclic}")
+
+    def _collect_ancestors(self, group: type) -> List[type]:
+        """推移的な依存先を、グループ定義順に並べて返す"""
+        seen = set()
+        stack = list(self.dependencies[group])
+        while stack:
+            dep = stack.pop()
+            if dep in seen:
+                continue
+            seen.add(dep)
+            stack.extend(self.dependencies[dep])
+        return sorted(seen, key=self._order.__getitem__)
+
+    def _inherit_priorities(self, priorities: Dict[type, int]) -> Dict[type, int]:
+        """
+        依存先のグループには、依存元のうち最も高い優先度を引き継がせる。
+        (重要なグループが、優先度の低い依存先の完了待ちで後回しにされないようにするため)
+        優先度の指定がないグループは最も低い優先度として扱う。
+        """
+        lowest = max(priorities.values(), default=0) + 1
+        effective = {g: priorities.get(g, lowest) for g in self.groups}
+        for group in reversed(self._topological_order()):
+            for dep in self.dependencies[group]:
+                effective[dep] = min(effective[dep], effective[group])
+        return effective
+
+    def _ready_key(self, group: type) -> tuple:
+        return (self.priorities[group], self._order[group])
+
+    def _time_slice(self, now: float, deadline: Optional[float], pending: int) -> float:
+        """
+        これから開始するグループに割り当てる実行時間。
+        未開始のグループ (pending 件) を max_concurrency 件ずつ実行すると仮定して、残り時間を段数で等分する。
+        """
+        if deadline is None:
+            return self.group_timeout
+        remaining = max(0.0, deadline - now)
+        waves = max(1, math.ceil(pending / self.max_concurrency))
+        return min(self.group_timeout, remaining, max(self.min_slice, remaining / waves))
+
+    def critical_path_length(self) -> int:
+        """依存グラフ上の最長パスに含まれるグループ数 (直列に必要なLLM呼び出し回数)"""
+        depth: Dict[type, int] = {}
+        for group in self._topological_order():
+            depth[group] = 1 + max((depth[d] for d in self.dependencies[group]), default=0)
+        return max(depth.values(), default=0)
+
+    def _topological_order(self) -> List[type]:
+        in_degree = {g: len(deps) for g, deps in self.dependencies.items()}
+        ready = [self._order[g] for g, n in in_degree.items() if n == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            group = self.groups[heapq.heappop(ready)]
+            order.append(group)
+            for child in self.dependents[group]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    heapq.heappush(ready, self._order[child])
+        return order
+
+    def _build_context(self, group: type, results: Dict[type, dict]) -> dict:
+        context = {}
+        for dep in self.ancestors[group]:
+            context.update(results.get(dep) or {})
+        return context
+
+    def run(
+        self,
+        run_group: Callable[[type, dict], dict],
+        deadline: Optional[float] = None,
+    ) -> Iterator[dict]:
+        """
+        全グループを依存関係に従って実行し、完了したグループから順にイベントを返すジェネレータ。
+
+        Args:
+            run_group: (グループのスキーマ, 依存先の抽出結果) を受け取り、抽出結果のdictを返す関数。
+                実行中は current_cancel_token() でそのグループのタイムスライスを参照できる。
+            deadline: 全体の締め切り時刻 (time.time() 基準)。超過した時点で未完了のグループは打ち切る。
+
+        Yields:
+            {"group": スキーマ, "status": "success" | "error" | "timeout" | "skipped",
+             "data": 抽出結果 or None, "error": エラー内容 or None, "elapsed": 実行秒数,
+             "slice": 割り当てたタイムスライス秒数 (未開始なら None)}
+        """
+        results: Dict[type, dict] = {}
+        remaining_deps = {g: len(deps) for g, deps in self.dependencies.items()}
+        # 同時に実行可能になったグループは、優先度 -> 定義順 (= 臨床的な記入順) で投入する
+        ready = [self._ready_key(g) for g, n in remaining_deps.items() if n == 0]
+        heapq.heapify(ready)
+        running: Dict[concurrent.futures.Future, tuple] = {}
+        finished = set()
+        started_count = 0
+
+        def release(group: type) -> None:
+            finished.add(group)
+            for child in self.dependents[group]:
+                remaining_deps[child] -= 1
+                if remaining_deps[child] == 0:
+                    heapq.heappush(ready, self._ready_key(child))
+
+        def make_event(group, status, data=None, error=None, started=None, time_slice=None):
+            elapsed = time.time() - started if started else 0.0
+            return {
+                "group": group, "status": status, "data": data, "error": error,
+                "elapsed": elapsed, "slice": time_slice,
+            }
+
+        # 見捨てたスレッドは呼び出しが返るまでワーカーを占有し続ける。同時実行数は running で制限しているので、
+        # プールは全グループ分の余裕を持たせ、投入したグループがキューで待たされて (タイムスライスだけが進んで)
+        # 実行前にタイムアウトすることがないようにする。スレッドは必要になった時点でしか作られない。
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(self.max_concurrency, len(self.groups)), thread_name_prefix="extraction"
+        )
+        try:
+            while ready or running:
+                if deadline is not None and time.time() >= deadline:
+                    logger.warning("ExtractionScheduler: 全体の制限時間を超過したため、残りのグループを打ち切ります。")
+                    break
+
+                skipped = []
+                while ready and len(running) < self.max_concurrency:
+                    group = self.groups[heapq.heappop(ready)[1]]
+                    now = time.time()
+                    time_slice = self._time_slice(now, deadline, len(self.groups) - started_count)
+                    started_count += 1
+                    if deadline is not None and time_slice < self.min_slice:
+                        # 完了の見込みがない呼び出しは開始しない (クォータを無駄に消費しないため)
+                        logger.warning(
+                            f"ExtractionScheduler: skipped {group.__name__} (remaining {time_slice:.1f}s < {self.min_slice}s)"
+                        )
+                        release(group)
+                        skipped.append(make_event(group, "skipped", error="insufficient time budget"))
+                        continue
+                    context = self._build_context(group, results)
+                    token = CancelToken(deadline=now + time_slice)
+                    future = executor.submit(run_with_token, token, run_group, group, context)
+                    running[future] = (group, now, token, time_slice)
+                    logger.info(
+                        f"ExtractionScheduler: started {group.__name__} "
+                        f"(slice={time_slice:.1f}s, running={len(running)})"
+                    )
+                yield from skipped
+                if not running:
+                    continue
+
+                # 次に「いずれかの完了」「いずれかのタイムスライス切れ」が来るまで待機
+                # (タイムスライスは全体の締め切りを超えないように割り当てている)
+                now = time.time()
+                wait_until = min(token.deadline for _, _, token, _ in running.values())
+                done, _ = concurrent.futures.wait(
+                    running, timeout=max(0.0, wait_until - now), return_when=concurrent.futures.FIRST_COMPLETED
+                )
+
+                for future in done:
+                    group, started, token, time_slice = running.pop(future)
+                    try:
+                        data = future.result() or {}
+                        results[group] = data
+                        event = make_event(group, "success", data=data, started=started, time_slice=time_slice)
+                    except CallCancelledError as e:
+                        logger.error(f"ExtractionScheduler: {group.__name__} cancelled: {e}")
+                        event = make_event(group, "timeout", error=str(e), started=started, time_slice=time_slice)
+                    except Exception as e:
+                        logger.error(f"ExtractionScheduler: {group.__name__} failed: {e}")
+                        event = make_event(group, "error", error=str(e), started=started, time_slice=time_slice)
+                    release(group)
+                    yield event
+
+                now = time.time()
+                for future, (group, started, token, time_slice) in list(running.items()):
+                    if now >= token.deadline:
+                        # 実行中のスレッドは止められないため、トークンで以降のAPI呼び出し・リトライを止めて見捨てる
+                        running.pop(future)
+                        token.cancel()
+                        future.cancel()
+                        logger.error(f"ExtractionScheduler: {group.__name__} timed out after {time_slice:.1f}s")
+                        release(group)
+                        yield make_event(
+                            group, "timeout", error="time slice exceeded", started=started, time_slice=time_slice
+                        )
+
+            for future, (group, started, token, time_slice) in running.items():
+                token.cancel()
+                future.cancel()
+                finished.add(group)
+                yield make_event(group, "timeout", error="deadline exceeded", started=started, time_slice=time_slice)
+            for group in self.groups:
+                if group not in finished:
+                    yield make_event(group, "skipped", error="deadline exceeded")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
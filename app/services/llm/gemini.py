@@ -1,24 +1,37 @@
+import hashlib
 import json
 import logging
 import os
+import threading
 import time
-from typing import Any, Dict, Generator, Optional, Type
+from typing import Any, Dict, Generator, List, Optional, Type
 
 from dotenv import load_dotenv
 from google import genai
 from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
 from google.genai import types
-from pydantic import BaseModel, Field, create_model
+from pydantic import BaseModel
 
 from app.schemas.schemas import GENERATION_GROUPS
+from app.services.field_registry import get_field_registry
 from app.services.llm.base import LLMClient
+from app.services.llm.cancellation import CallCancelledError, current_cancel_token
+from app.services.llm.client_pool import llm_client_pool
+from app.services.llm.incremental_json import IncrementalJSONError, IncrementalJSONParser, iter_string_field_deltas
+from app.services.llm.metrics import llm_metrics
+from app.services.llm.plan_snapshots import changed_fact_categories, fields_to_regenerate, plan_snapshot_store
 from app.services.llm.context_builder import (
-    CHECK_TO_TEXT_MAP,
     USER_INPUT_FIELDS,
-    prepare_patient_facts,
+    get_patient_facts,
 )
-from app.services.llm.prompts import build_group_prompt, build_regeneration_prompt
+from app.services.llm.prompts import build_batch_regeneration_prompt, build_group_prompt, build_regeneration_prompt
 from app.services.llm.rag_executor import RAGExecutor
+from app.services.llm.rehab_rag_path import REHAB_RAG_PATH  # noqa: F401  (rag_components より前に読み込む)
+from app.services.llm.schema_registry import schema_registry
+from app.services.llm.text_coalescer import coalesce_text
+# Gemini APIのレート制限とLLM応答のキャッシュは、Rehab_RAG と同じもの (プロセス内で共有) を使う
+from rag_components.rate_limiter import RateLimitTimeout, estimate_tokens, get_rate_limiter
+from rag_components.response_cache import get_response_cache
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -40,15 +53,38 @@ except Exception as e:
 # プロトタイプ開発用の設定
 USE_DUMMY_DATA = False
 
+MODEL_NAME = "gemini-2.5-flash-lite"
+
+# 患者情報の抽出 (generate_json) の温度。決定的な出力にし、同じカルテの再抽出を応答キャッシュから返せるようにする
+EXTRACTION_TEMPERATURE = 0.0
+
+# Gemini APIのRPM / TPM 制限 (GEMINI_RPM / GEMINI_TPM)。Rehab_RAG の GeminiLLM などと共有する
+gemini_rate_limiter = get_rate_limiter("gemini")
+
+# 明示的コンテキストキャッシュ (caches.create) の設定
+# 無効の場合でも、共通プレフィックスを先頭に置いたプロンプトには Gemini 2.5 系の暗黙的キャッシュが効く
+USE_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+CONTEXT_CACHE_TTL_SEC = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SEC", "300"))
+
+# プレフィックスのハッシュ -> (キャッシュ名 or None, 有効期限)
+# None はトークン数不足などで作成できなかったことを表し、TTLの間は再作成を試みない
+_context_caches: Dict[str, tuple] = {}
+# _context_cache_lock は上の dict とキーごとのロックの参照だけを守る。作成処理はキーごとのロックで直列化する
+_context_cache_lock = threading.Lock()
+_context_cache_key_locks: Dict[str, threading.Lock] = {}
+# タイムスライスの外で呼ばれた場合に、キャッシュ作成のためにレート制限の枠を待つ上限 (秒)
+CONTEXT_CACHE_ACQUIRE_TIMEOUT_SEC = float(os.getenv("GEMINI_CONTEXT_CACHE_ACQUIRE_TIMEOUT_SEC", "10"))
+
 
 class GeminiClient(LLMClient):
     """
     Google Gemini APIを使用したLLMクライアントの実装
     """
 
-    def generate_plan_stream(self, patient_data: Dict[str, Any]) -> Generator[str, None, None]:
+    def generate_plan_stream(self, patient_data: Dict[str, Any], incremental: bool = False) -> Generator[str, None, None]:
         """
         Geminiモデルを使用して計画案をストリーミングで生成する。
+        incremental=True の場合は、前回の生成から参照先の患者データが変わった項目だけを生成し、残りは前回の結果を送る。
         """
         if USE_DUMMY_DATA:
             yield self._create_event("error", {"error": "ダミーデータモードは現在サポートされていません。"})
@@ -56,10 +92,16 @@ class GeminiClient(LLMClient):
 
         try:
             # 1. 患者情報の整形 (共通ロジック使用)
-            patient_facts = prepare_patient_facts(patient_data)
-            patient_facts_str = json.dumps(patient_facts, indent=2, ensure_ascii=False)
+            patient_facts, patient_facts_str = get_patient_facts(patient_data)
             generated_plan_so_far = {}
 
+            # 差分生成: 同じ患者の前回の生成で使った患者データと比べる
+            snapshot_key = (self.__class__.__name__, patient_data.get("patient_id"))
+            snapshot = plan_snapshot_store.get(snapshot_key) if incremental and snapshot_key[1] is not None else None
+            changed_categories = changed_fact_categories(snapshot["facts"], patient_facts) if snapshot else set()
+            if snapshot:
+                logger.info(f"Incremental generation: changed fact categories = {sorted(changed_categories)}")
+
             # ユーザーが既に入力済みの項目を先に処理
             for field_name in USER_INPUT_FIELDS:
                 if patient_data.get(field_name):
@@ -68,33 +110,57 @@ class GeminiClient(LLMClient):
                     yield self._create_event("update", {"key": field_name, "value": value, "model_type": "general"})
 
             # 2. グループごとに生成
+            plan_started_at = time.time()
+            first_field_sent = False
             for group_schema in GENERATION_GROUPS:
+                # 差分生成では、参照先が変わっていない項目は前回の結果をそのまま送る
+                stale_fields = fields_to_regenerate(group_schema, snapshot, changed_categories, generated_plan_so_far)
+                reused_fields = [f for f in group_schema.model_fields if f not in stale_fields]
+                for field_name in reused_fields:
+                    generated_plan_so_far[field_name] = snapshot["plan"][field_name]
+                    yield self._create_event(
+                        "update", {"key": field_name, "value": snapshot["plan"][field_name], "model_type": "general"}
+                    )
+                if snapshot:
+                    plan_snapshot_store.record(len(reused_fields), len(stale_fields))
+                if not stale_fields:
+                    logger.info(f"--- Reused Group: {group_schema.__name__} (no changes) ---")
+                    continue
+                target_schema = (
+                    schema_registry.partial_schema(group_schema, tuple(stale_fields)) if reused_fields else group_schema
+                )
+
                 # プロンプト構築 (共通ロジック使用)
                 prompt = build_group_prompt(
-                    group_schema,
+                    target_schema,
                     patient_facts_str,
                     generated_plan_so_far,
-                    is_ollama=False
+                    is_ollama=False,
+                    context_group=group_schema,
                 )
 
-                logger.info(f"--- Generating Group: {group_schema.__name__} ---")
+                logger.info(f"--- Generating Group: {group_schema.__name__} ({len(stale_fields)} fields) ---")
 
                 # API呼び出し設定 (JSONモード)
                 generation_config = types.GenerateContentConfig(
                     response_mime_type="application/json",
-                    response_schema=group_schema,
+                    response_schema=target_schema,
                 )
 
-                # API呼び出し (リトライ付き)
-                response = self._call_api_with_retry(prompt, generation_config)
-
-                if not response or not response.parsed:
-                    raise Exception(f"グループ {group_schema.__name__} のJSON生成に失敗しました。")
+                # 3. ストリーミング生成し、値が閉じたフィールドから順に送信する
+                group_started_at = time.time()
+                group_first_field_sent = False
+                for field_name, generated_text in self._stream_group_fields(prompt, generation_config, target_schema):
+                    # 最初のフィールドが画面に届くまでの時間を計測する
+                    now = time.time()
+                    if not group_first_field_sent:
+                        group_first_field_sent = True
+                        llm_metrics.record("gemini.group_time_to_first_field", now - group_started_at)
+                    if not first_field_sent:
+                        first_field_sent = True
+                        llm_metrics.record("gemini.time_to_first_field", now - plan_started_at)
+                        logger.info(f"Time to first field: {now - plan_started_at:.2f}s ({field_name})")
 
-                group_result = response.parsed.model_dump()
-
-                # 3. 結果の処理とストリーミング
-                for field_name, generated_text in group_result.items():
                     # チェックボックスとの整合性チェックなどを行う
                     final_text = self._post_process_text(field_name, generated_text, patient_data)
 
@@ -103,6 +169,8 @@ class GeminiClient(LLMClient):
                     yield self._create_event("update", {"key": field_name, "value": final_text, "model_type": "general"})
 
             logger.info("--- Gemini汎用項目の生成完了 ---")
+            if snapshot_key[1] is not None:
+                plan_snapshot_store.save(snapshot_key, patient_facts, generated_plan_so_far)
             yield "event: general_finished\ndata: {}\n\n"
 
         except Exception as e:
@@ -122,8 +190,7 @@ class GeminiClient(LLMClient):
         """
         try:
             # 1. 患者情報の整形
-            patient_facts = prepare_patient_facts(patient_data)
-            patient_facts_str = json.dumps(patient_facts, indent=2, ensure_ascii=False)
+            patient_facts, patient_facts_str = get_patient_facts(patient_data)
 
             # これまでの生成結果（対象項目以外）
             generated_plan_so_far = patient_data.copy()
@@ -143,11 +210,8 @@ class GeminiClient(LLMClient):
                 except Exception as e:
                     logger.error(f"RAG execution failed during regeneration: {e}")
 
-            # 3. 動的スキーマ生成 (再生成対象の1項目のみを含むスキーマ)
-            RegenerationSchema = create_model(
-                f"RegenerationSchema_{item_key}",
-                **{item_key: (str, Field(..., description=f"修正指示に基づいて書き直された'{item_key}'の新しい文章。"))},
-            )
+            # 3. 動的スキーマ生成 (再生成対象の1項目のみを含むスキーマ。項目ごとにレジストリでキャッシュ)
+            RegenerationSchema = schema_registry.regeneration_schema(item_key)
 
             # 4. プロンプト構築
             prompt = build_regeneration_prompt(
@@ -166,18 +230,29 @@ class GeminiClient(LLMClient):
                 response_schema=RegenerationSchema,
             )
 
-            # 5. API呼び出し
-            response = self._call_api_with_retry(prompt, generation_config)
+            # 5. API呼び出し (ストリーミング)
+            # 生成中の文章を文単位・一定時間ごとにまとめて送信する
+            parser = IncrementalJSONParser()
+            raw_chunks = []
 
-            if not response or not response.parsed:
-                raise Exception(f"項目 '{item_key}' の再生成に失敗しました。")
+            def text_chunks():
+                for chunk in self._call_stream_api_with_retry(prompt, generation_config):
+                    text = chunk.text or ""
+                    raw_chunks.append(text)
+                    yield text
 
-            regenerated_text = response.parsed.model_dump().get(item_key, "")
+            sent_text = ""
+            for text in coalesce_text(iter_string_field_deltas(parser, text_chunks(), item_key)):
+                sent_text += text
+                yield self._create_event("update", {"key": item_key, "chunk": text})
 
-            # 6. 文字単位でストリーミング風に返す
-            if regenerated_text:
-                for char in regenerated_text:
-                    yield self._create_event("update", {"key": item_key, "chunk": char})
+            # 6. 完成したJSONを検証し、送信できていない残りがあれば送る
+            try:
+                regenerated_text = RegenerationSchema.model_validate_json("".join(raw_chunks)).model_dump().get(item_key, "")
+            except Exception as e:
+                raise Exception(f"項目 '{item_key}' の再生成に失敗しました。") from e
+            if regenerated_text.startswith(sent_text) and len(regenerated_text) > len(sent_text):
+                yield self._create_event("update", {"key": item_key, "chunk": regenerated_text[len(sent_text):]})
 
             yield "event: finished\ndata: {}\n\n"
 
@@ -185,6 +260,61 @@ class GeminiClient(LLMClient):
             logger.error(f"Regeneration Error: {e}", exc_info=True)
             yield self._create_event("error", {"error": f"再生成中にエラーが発生しました: {str(e)}"})
 
+    def regenerate_plan_items_stream(
+        self,
+        patient_data: Dict[str, Any],
+        items: List[Dict[str, str]],
+        rag_executor: Optional[RAGExecutor] = None
+    ) -> Generator[str, None, None]:
+        """
+        複数の項目を一括で再生成する。
+        患者情報の整形とRAG検索は1回だけ行い、全項目を含むスキーマで1回だけ生成して、値が閉じた項目から順に送信する。
+        """
+        try:
+            item_keys = tuple(item["item_key"] for item in items)
+
+            # 1. 患者情報の整形
+            patient_facts, patient_facts_str = get_patient_facts(patient_data)
+
+            # これまでの生成結果（対象項目以外）
+            generated_plan_so_far = {k: v for k, v in patient_data.items() if k not in item_keys}
+
+            # 2. RAG検索（オプション・全項目で共有）
+            rag_context_str = None
+            if rag_executor:
+                logger.info("--- RAG一括再生成: 専門知識の検索を開始 ---")
+                try:
+                    rag_result = rag_executor.execute(patient_facts)
+                    contexts = rag_result.get("contexts", [])
+                    if contexts:
+                        rag_context_str = "\n\n".join([ctx.get("content", "") for ctx in contexts])
+                        logger.info(f"--- RAG一括再生成: {len(contexts)}件の専門知識を発見 ---")
+                except Exception as e:
+                    logger.error(f"RAG execution failed during batch regeneration: {e}")
+
+            # 3. 動的スキーマ生成 (再生成対象の全項目を含むスキーマ。項目の組み合わせごとにレジストリでキャッシュ)
+            BatchRegenerationSchema = schema_registry.batch_regeneration_schema(item_keys)
+
+            # 4. プロンプト構築
+            prompt = build_batch_regeneration_prompt(patient_facts_str, generated_plan_so_far, items, rag_context_str)
+
+            logger.info(f"--- Regenerating Items: {', '.join(item_keys)} ---")
+
+            generation_config = types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=BatchRegenerationSchema,
+            )
+
+            # 5. API呼び出し (ストリーミング)。値が閉じた項目から順に送信する
+            for item_key, regenerated_text in self._stream_group_fields(prompt, generation_config, BatchRegenerationSchema):
+                yield self._create_event("update", {"key": item_key, "chunk": regenerated_text})
+
+            yield "event: finished\ndata: {}\n\n"
+
+        except Exception as e:
+            logger.error(f"Batch Regeneration Error: {e}", exc_info=True)
+            yield self._create_event("error", {"error": f"一括再生成中にエラーが発生しました: {str(e)}"})
+
     def generate_rag_plan_stream(
         self,
         patient_data: Dict[str, Any],
@@ -199,7 +329,7 @@ class GeminiClient(LLMClient):
             logger.info("--- RAGモデルによる生成を開始 ---")
 
             # 1. 患者情報の整形
-            patient_facts = prepare_patient_facts(patient_data)
+            patient_facts, _ = get_patient_facts(patient_data)
 
             # 2. RAGExecutorの実行
             # rag_executor.execute は { "answer": {...}, "contexts": [...] } を返す想定
@@ -280,11 +410,127 @@ class GeminiClient(LLMClient):
         generation_config = types.GenerateContentConfig(
             response_mime_type="application/json",
             response_schema=schema,
+            temperature=EXTRACTION_TEMPERATURE,
+        )
+
+        def generate():
+            # リトライロジック込みでAPI呼び出し
+            response = self._call_api_with_retry(prompt, generation_config)
+            return self._parse_json_response(response)
+
+        # 同じプロンプト・スキーマでの呼び出しは応答キャッシュから返す (温度が LLM_CACHE_MAX_TEMPERATURE 以下の場合のみ)
+        return get_response_cache().get_or_generate(
+            f"gemini.json.{schema.__name__}", generate,
+            model=MODEL_NAME, prompt=prompt, schema=schema, temperature=generation_config.temperature,
+        )
+
+    def generate_json_with_prefix(self, prefix: str, suffix: str, schema: Type[BaseModel]) -> Dict[str, Any]:
+        """
+        共通プレフィックスをGeminiのコンテキストキャッシュに載せてJSONを生成する。
+        キャッシュが無効・作成できない場合は連結したプロンプトで generate_json を呼ぶ (暗黙的キャッシュに任せる)。
+        """
+        cache_name = self._get_context_cache(prefix) if USE_CONTEXT_CACHE else None
+        if not cache_name:
+            return self.generate_json(prefix + suffix, schema)
+
+        generation_config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=schema,
+            temperature=EXTRACTION_TEMPERATURE,
+            cached_content=cache_name,
+        )
+
+        def generate():
+            response = self._call_api_with_retry(suffix, generation_config)
+            return self._parse_json_response(response)
+
+        # キャッシュキーはコンテキストキャッシュの有無によらず、連結したプロンプトで作る
+        return get_response_cache().get_or_generate(
+            f"gemini.json.{schema.__name__}", generate,
+            model=MODEL_NAME, prompt=prefix + suffix, schema=schema, temperature=generation_config.temperature,
         )
 
-        # リトライロジック込みでAPI呼び出し
-        response = self._call_api_with_retry(prompt, generation_config)
+    def _get_context_cache(self, prefix: str) -> Optional[str]:
+        """プレフィックスに対応するコンテキストキャッシュ名を返す (なければ作成する)"""
+        if not client:
+            return None
+
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        cache_name = self._lookup_context_cache(key)
+        if cache_name is not False:
+            return cache_name
+
+        # 同じプレフィックスで並列に呼ばれた場合に重複作成しないよう、作成はキーごとのロックで直列化する
+        # (グローバルロックはレート制限の待ちや作成APIの間は保持しない。別のプレフィックスの呼び出しを止めないため)
+        token = current_cancel_token()
+
+        def wait_limit() -> float:
+            # 待ち時間はタイムスライスの残り (スライス外なら CONTEXT_CACHE_ACQUIRE_TIMEOUT_SEC) まで
+            remaining = token.remaining() if token is not None else None
+            return CONTEXT_CACHE_ACQUIRE_TIMEOUT_SEC if remaining is None else remaining
+
+        with _context_cache_lock:
+            key_lock = _context_cache_key_locks.setdefault(key, threading.Lock())
+        if not key_lock.acquire(timeout=wait_limit()):
+            logger.warning("Gemini context cache: timed out waiting for another request to create the cache")
+            return None
+        try:
+            # 待っている間に他の呼び出しが作成した場合はそれを使う
+            cache_name = self._lookup_context_cache(key)
+            if cache_name is not False:
+                return cache_name
+
+            try:
+                gemini_rate_limiter.acquire(estimate_tokens(prefix), timeout=wait_limit())
+            except RateLimitTimeout as e:
+                # 枠が空かないだけなので記録はせず、今回は暗黙的キャッシュに任せる
+                logger.warning(f"Gemini context cache skipped, rate limit wait timed out: {e}")
+                return None
 
+            try:
+                cache = client.caches.create(
+                    model=MODEL_NAME,
+                    config=types.CreateCachedContentConfig(
+                        contents=[prefix],
+                        ttl=f"{CONTEXT_CACHE_TTL_SEC}s",
+                        display_name=f"rehab-prefix-{key[:12]}",
+                    ),
+                )
+                cache_name = cache.name
+                logger.info(f"Gemini context cache created: {cache_name}")
+            except Exception as e:
+                # 最小トークン数に満たない場合などは作成に失敗する
+                logger.warning(f"Gemini context cache unavailable, falling back to implicit caching: {e}")
+                cache_name = None
+
+            with _context_cache_lock:
+                _context_caches[key] = (cache_name, time.time() + CONTEXT_CACHE_TTL_SEC)
+            return cache_name
+        finally:
+            key_lock.release()
+
+    @staticmethod
+    def _lookup_context_cache(key: str):
+        """
+        有効なキャッシュ名 (作成できなかった場合は None) を返す。未登録・期限切れ間際の場合は False を返す。
+        あわせて期限切れのエントリを削除する。
+        """
+        with _context_cache_lock:
+            now = time.time()
+            entry = _context_caches.get(key)
+            # 期限切れ間際のキャッシュは使わない (生成中に失効するのを避ける)
+            if entry and entry[1] > now + 10:
+                return entry[0]
+
+            for expired_key in [k for k, (_, expires_at) in _context_caches.items() if expires_at <= now]:
+                del _context_caches[expired_key]
+                lock = _context_cache_key_locks.get(expired_key)
+                if lock is not None and not lock.locked():
+                    del _context_cache_key_locks[expired_key]
+            return False
+
+    def _parse_json_response(self, response) -> Dict[str, Any]:
+        """generate_content のレスポンスからJSONを取り出す"""
         if response and response.parsed:
             return response.parsed.model_dump(mode="json")
         elif response and response.text:
@@ -304,22 +550,137 @@ class GeminiClient(LLMClient):
 
     # --- Helper Methods ---
 
+    def _stream_group_fields(
+        self, prompt: str, config: types.GenerateContentConfig, group_schema: Type[BaseModel]
+    ) -> Generator[tuple, None, None]:
+        """
+        1グループ分のJSONをストリーミング生成し、トップレベルのフィールドを値が閉じた順に (キー, 値) で返す。
+        ストリーム完了後にスキーマで検証し、逐次解析で取り出せなかったフィールド (未出力の項目など) を補う。
+        """
+        parser = IncrementalJSONParser()
+        parser_failed = False
+        raw_chunks = []
+        emitted = set()
+
+        for chunk in self._call_stream_api_with_retry(prompt, config):
+            text = chunk.text or ""
+            raw_chunks.append(text)
+            if parser_failed:
+                continue
+            try:
+                for key, value in parser.feed(text):
+                    if key in group_schema.model_fields and key not in emitted:
+                        emitted.add(key)
+                        yield key, value
+            except IncrementalJSONError as e:
+                # 逐次解析できない出力は、ストリーム完了後の一括検証に任せる
+                logger.warning(f"Incremental JSON parsing stopped for {group_schema.__name__}: {e}")
+                parser_failed = True
+
+        try:
+            validated = group_schema.model_validate_json("".join(raw_chunks)).model_dump()
+        except Exception as e:
+            if not emitted:
+                raise Exception(f"グループ {group_schema.__name__} のJSON生成に失敗しました。") from e
+            logger.warning(f"{group_schema.__name__}: 完成したJSONの検証に失敗しました。送信済みの項目のみ使用します: {e}")
+            validated = {}
+
+        for key, value in validated.items():
+            if key not in emitted:
+                yield key, value
+
+    def _acquire_rate_limit(self, prompt: str, token=None) -> int:
+        """
+        共有のレートリミッタ (RPM / TPM) で呼び出し1回分の枠を確保し、推定トークン数を返す。
+        タイムスライス内の呼び出しは、締め切りまでに枠を確保できなければ CallCancelledError を送出する。
+        """
+        estimated_tokens = estimate_tokens(prompt)
+        timeout = token.remaining() if token is not None else None
+        try:
+            gemini_rate_limiter.acquire(estimated_tokens, timeout=timeout)
+        except RateLimitTimeout as e:
+            raise CallCancelledError(str(e)) from e
+        return estimated_tokens
+
+    def _record_rate_limit_usage(self, estimated_tokens: int, response) -> None:
+        """レスポンスの usage_metadata で、リミッタのトークン数を実際の値に補正する"""
+        usage = getattr(response, "usage_metadata", None)
+        actual_tokens = getattr(usage, "total_token_count", None)
+        if isinstance(actual_tokens, int):
+            gemini_rate_limiter.record_usage(estimated_tokens, actual_tokens)
+
+    def _call_stream_api_with_retry(self, prompt: str, config: types.GenerateContentConfig, max_retries: int = 3):
+        """ストリーミングAPI呼び出しのリトライロジック (最初のチャンクを受け取る前のエラーのみ再試行する)"""
+        if not client:
+            raise RuntimeError("Gemini Client is not initialized.")
+
+        backoff_factor = 2
+        for attempt in range(max_retries):
+            received = False
+            estimated_tokens = self._acquire_rate_limit(prompt)
+            try:
+                # ストリームを読み終えるまで同時呼び出しの枠を占有する
+                with llm_client_pool.slot("gemini"):
+                    last_chunk = None
+                    for chunk in client.models.generate_content_stream(
+                        model=MODEL_NAME,
+                        contents=prompt,
+                        config=config
+                    ):
+                        received = True
+                        last_chunk = chunk
+                        yield chunk
+                    # 使用トークン数は最後のチャンクに含まれる
+                    self._record_rate_limit_usage(estimated_tokens, last_chunk)
+                return
+            except (ResourceExhausted, ServiceUnavailable) as e:
+                if not received and attempt < max_retries - 1:
+                    wait_time = backoff_factor * (2**attempt)
+                    if isinstance(e, ResourceExhausted):
+                        # 他の呼び出しも一斉に待たせ、ばらばらのリトライで制限を悪化させない
+                        gemini_rate_limiter.pause(wait_time)
+                    logger.warning(f"API Error: {e}. Retrying in {wait_time}s... ({attempt + 1}/{max_retries})")
+                    time.sleep(wait_time)
+                else:
+                    logger.error(f"Streaming API call failed after {attempt + 1} attempts.")
+                    raise e
+
     def _call_api_with_retry(self, prompt: str, config: types.GenerateContentConfig, max_retries: int = 3):
         """API呼び出しのリトライロジック"""
         if not client:
             raise RuntimeError("Gemini Client is not initialized.")
 
+        # 抽出スケジューラから呼ばれた場合は、割り当てられたタイムスライスを超えて呼び出し・リトライしない
+        token = current_cancel_token()
+
         backoff_factor = 2
         for attempt in range(max_retries):
+            estimated_tokens = self._acquire_rate_limit(prompt, token)
             try:
-                return client.models.generate_content(
-                    model="gemini-2.5-flash-lite",
-                    contents=prompt,
-                    config=config
-                )
+                # 同時呼び出し数の上限 (LLM_MAX_IN_FLIGHT_GEMINI) に達している場合は空きを待つ
+                with llm_client_pool.slot("gemini"):
+                    request_config = config
+                    if token is not None:
+                        token.raise_if_cancelled()
+                        if token.remaining() is not None:
+                            # HTTPリクエスト自体も締め切りで打ち切る (timeout はミリ秒指定)
+                            timeout_ms = max(1000, int(token.remaining() * 1000))
+                            request_config = config.model_copy(update={"http_options": types.HttpOptions(timeout=timeout_ms)})
+                    response = client.models.generate_content(
+                        model=MODEL_NAME,
+                        contents=prompt,
+                        config=request_config
+                    )
+                self._record_rate_limit_usage(estimated_tokens, response)
+                return response
             except (ResourceExhausted, ServiceUnavailable) as e:
                 if attempt < max_retries - 1:
                     wait_time = backoff_factor * (2**attempt)
+                    if isinstance(e, ResourceExhausted):
+                        # 他の呼び出しも一斉に待たせ、ばらばらのリトライで制限を悪化させない
+                        gemini_rate_limiter.pause(wait_time)
+                    if token is not None and token.remaining() is not None:
+                        wait_time = min(wait_time, token.remaining())
                     logger.warning(f"API Error: {e}. Retrying in {wait_time}s... ({attempt + 1}/{max_retries})")
                     time.sleep(wait_time)
                 else:
@@ -335,24 +696,22 @@ class GeminiClient(LLMClient):
         """
         final_text = generated_text
 
-        # このフィールドが「詳細テキスト」側であるか確認
+        # このフィールドが「詳細テキスト」側であるか確認 (項目レジストリで対応するチェックボックスを引く)
         # 例: field_name="func_pain_txt" -> chk_key="func_pain_chk"
-        if field_name in CHECK_TO_TEXT_MAP.values():
-            chk_key = next((chk for chk, txt in CHECK_TO_TEXT_MAP.items() if txt == field_name), None)
-
-            if chk_key:
-                is_checked_in_db = patient_data.get(chk_key)
-                is_truly_checked = str(is_checked_in_db).lower() in ["true", "1", "on"]
-
-                if not is_truly_checked:
-                    # チェックがないなら強制的に「特記なし」
-                    final_text = "特記なし"
-                elif is_truly_checked and generated_text == "特記なし":
-                    # チェックがあるのにAIが「特記なし」と返した場合、
-                    # 元データに何か記述があればそれを復元する（安全策）
-                    original_text = patient_data.get(field_name)
-                    if original_text and original_text != "特記なし":
-                        final_text = original_text
+        chk_key = get_field_registry().check_key_for(field_name)
+        if chk_key:
+            is_checked_in_db = patient_data.get(chk_key)
+            is_truly_checked = str(is_checked_in_db).lower() in ["true", "1", "on"]
+
+            if not is_truly_checked:
+                # チェックがないなら強制的に「特記なし」
+                final_text = "特記なし"
+            elif is_truly_checked and generated_text == "特記なし":
+                # チェックがあるのにAIが「特記なし」と返した場合、
+                # 元データに何か記述があればそれを復元する（安全策）
+                original_text = patient_data.get(field_name)
+                if original_text and original_text != "特記なし":
+                    final_text = original_text
 
         return final_text
 
@@ -0,0 +1,229 @@
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class IncrementalJSONError(ValueError):
+    """ストリームの途中で、JSONオブジェクトとして解釈できない文字が現れたことを表す例外"""
+
+
+class IncrementalJSONParser:
+    """
+    LLMがストリーミングで出力するJSONオブジェクトを逐次解析し、
+    トップレベルのフィールドの値が閉じた時点で (キー, 値) を返すパーサ。
+
+    - ルートの "{" より前の文字 (```json などのコードフェンス) は読み飛ばします。
+    - ネストしたオブジェクト・配列は、閉じた時点でまとめて1つの値として返します。
+    - ルートの "}" より後の文字は trailing_text に溜めます (呼び出し側で暴走出力の検知に使う)。
+
+    使い方:
+        parser = IncrementalJSONParser()
+        for chunk in stream:
+            for key, value in parser.feed(chunk):
+                ...  # 完成したフィールドをすぐに画面へ送る
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.trailing_text = ""
+        self._state = "before_root"
+        self._key_chars: List[str] = []
+        self._key = None
+        self._value_chars: List[str] = []
+        self._value_kind = None  # "string" | "container" | "scalar"
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._consumed = 0
+
+    @property
+    def started(self) -> bool:
+        """ルートオブジェクトの "{" を読んだかどうか"""
+        return self._state != "before_root"
+
+    @property
+    def done(self) -> bool:
+        """ルートオブジェクトの "}" まで読み終えたかどうか"""
+        return self._state == "done"
+
+    @property
+    def current_key(self):
+        """値を読み取り中のフィールド名 (値の読み取り中でなければ None)"""
+        return self._key if self._state in ("value", "after_colon") else None
+
+    @property
+    def partial_string(self) -> Optional[str]:
+        """
+        文字列の値を読み取り中であれば、ここまでに届いた部分をエスケープ解除して返す (それ以外は None)。
+        末尾の途中までのエスケープ (\\ や \\u30 など) は、次のチャンクで確定するまで含めない。
+        """
+        if self._state != "value" or self._value_kind != "string":
+            return None
+        raw = "".join(self._value_chars[1:])
+        # エスケープは最長6文字 (\\uXXXX) なので、末尾を最大5文字まで削れば必ず解釈できる
+        for cut in range(0, 6):
+            try:
+                text = json.loads('"' + raw[: len(raw) - cut] + '"')
+            except json.JSONDecodeError:
+                continue
+            # サロゲートペアの片割れで終わる場合は、次の \\uXXXX を待つ
+            if text and "\ud800" <= text[-1] <= "\udbff":
+                text = text[:-1]
+            return text
+        return None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        チャンクを読み込み、このチャンクで値が閉じたトップレベルのフィールドを (キー, 値) のリストで返す。
+
+        Raises:
+            IncrementalJSONError: JSONオブジェクトとして不正な文字が現れた場合
+        """
+        completed: List[Tuple[str, Any]] = []
+        for ch in chunk:
+            self._consumed += 1
+            self._feed_char(ch, completed)
+        return completed
+
+    def _error(self, message: str, ch: str):
+        raise IncrementalJSONError(f"{message} (位置 {self._consumed}, 文字 {ch!r})")
+
+    def _feed_char(self, ch: str, completed: List[Tuple[str, Any]]) -> None:
+        state = self._state
+
+        if state == "done":
+            self.trailing_text += ch
+        elif state == "before_root":
+            if ch == "{":
+                self._state = "expect_key"
+        elif state == "expect_key":
+            if ch == '"':
+                self._key_chars = []
+                self._escape = False
+                self._state = "key"
+            elif ch == "}" and not self.fields:
+                self._state = "done"
+            elif not ch.isspace():
+                self._error("フィールド名が必要です", ch)
+        elif state == "key":
+            if self._escape:
+                self._key_chars.append(ch)
+                self._escape = False
+            elif ch == "\\":
+                self._key_chars.append(ch)
+                self._escape = True
+            elif ch == '"':
+                self._key = json.loads('"' + "".join(self._key_chars) + '"')
+                self._state = "expect_colon"
+            else:
+                self._key_chars.append(ch)
+        elif state == "expect_colon":
+            if ch == ":":
+                self._state = "after_colon"
+            elif not ch.isspace():
+                self._error("':' が必要です", ch)
+        elif state == "after_colon":
+            if ch.isspace():
+                return
+            self._value_chars = [ch]
+            self._escape = False
+            if ch == '"':
+                self._value_kind = "string"
+            elif ch in "{[":
+                self._value_kind = "container"
+                self._depth = 1
+                self._in_string = False
+            elif ch in "-0123456789tfn":
+                self._value_kind = "scalar"
+            else:
+                self._error("値が必要です", ch)
+            self._state = "value"
+        elif state == "value":
+            self._feed_value_char(ch, completed)
+        elif state == "after_value":
+            if ch == ",":
+                self._state = "expect_key"
+            elif ch == "}":
+                self._state = "done"
+            elif not ch.isspace():
+                self._error("',' または '}' が必要です", ch)
+
+    def _feed_value_char(self, ch: str, completed: List[Tuple[str, Any]]) -> None:
+        kind = self._value_kind
+
+        if kind == "string":
+            self._value_chars.append(ch)
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._complete_value(completed)
+                self._state = "after_value"
+        elif kind == "container":
+            self._value_chars.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_value(completed)
+                    self._state = "after_value"
+        else:
+            # 数値・true/false/null は区切り文字が来た時点で確定する
+            if ch == "," or ch == "}" or ch.isspace():
+                self._complete_value(completed)
+                self._state = "after_value"
+                self._feed_char(ch, completed)
+            else:
+                self._value_chars.append(ch)
+
+    def _complete_value(self, completed: List[Tuple[str, Any]]) -> None:
+        raw = "".join(self._value_chars)
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise IncrementalJSONError(f"フィールド '{self._key}' の値を解釈できません: {raw[:50]!r} ({e})") from e
+        self.fields[self._key] = value
+        completed.append((self._key, value))
+        self._key = None
+        self._value_chars = []
+
+
+def iter_string_field_deltas(parser: IncrementalJSONParser, chunks: Iterable[str], key: str) -> Iterator[str]:
+    """
+    chunks を parser に読ませながら、トップレベルの key の文字列値を、届いた分だけ差分で返す。
+    ルートのオブジェクトが閉じた時点で読み取りを終える (値全体は parser.fields で確認できる)。
+    逐次解析できない出力になった場合は差分の送信をやめ、呼び出し側が一括でパースできるよう残りのチャンクは読み切る。
+    """
+    sent = ""
+    parser_failed = False
+    for chunk in chunks:
+        if parser_failed:
+            continue
+        try:
+            parser.feed(chunk)
+        except IncrementalJSONError:
+            parser_failed = True
+            continue
+        if key in parser.fields:
+            value = parser.fields[key]
+            current = value if isinstance(value, str) else None
+        elif parser.current_key == key:
+            current = parser.partial_string
+        else:
+            current = None
+
+        if current and len(current) > len(sent) and current.startswith(sent):
+            yield current[len(sent):]
+            sent = current
+        if parser.done:
+            break
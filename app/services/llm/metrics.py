@@ -0,0 +1,88 @@
+import threading
+from collections import deque
+from typing import Deque, Dict
+
+
+class LatencyMetrics:
+    """
+    LLM呼び出し周りの所要時間 (秒) を名前ごとに記録し、件数・平均・パーセンタイルを集計する。
+    プロンプトの推定トークン数 ("prompt_tokens.<グループ名>") も同じ形式で集計します。
+    直近 max_samples 件のみを保持するため、長時間稼働してもメモリは増え続けません。
+    集計結果は管理者用API (/admin/api/llm-stats) で確認できます。
+    """
+
+    def __init__(self, max_samples: int = 500):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.max_samples)
+                self._counts[name] = 0
+            self._samples[name].append(seconds)
+            self._counts[name] += 1
+
+    @staticmethod
+    def _percentile(sorted_samples, ratio: float) -> float:
+        index = min(len(sorted_samples) - 1, int(round(ratio * (len(sorted_samples) - 1))))
+        return sorted_samples[index]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            snapshot = {name: (list(samples), self._counts[name]) for name, samples in self._samples.items()}
+        stats = {}
+        for name, (samples, count) in snapshot.items():
+            ordered = sorted(samples)
+            stats[name] = {
+                "count": count,
+                "last": round(samples[-1], 3),
+                "mean": round(sum(samples) / len(samples), 3),
+                "p50": round(self._percentile(ordered, 0.5), 3),
+                "p95": round(self._percentile(ordered, 0.95), 3),
+                "max": round(ordered[-1], 3),
+            }
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+class RetryStats:
+    """
+    グループ (スキーマ) ごとに、LLM呼び出しの試行回数・リトライ回数・最終的な失敗回数を集計する。
+    出力形式の崩れによるリトライがどのグループで起きているかを、管理者用API (/admin/api/llm-stats) で確認できます。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, name: str, attempts: int, succeeded: bool) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(name, {"calls": 0, "attempts": 0, "retries": 0, "failures": 0})
+            stats["calls"] += 1
+            stats["attempts"] += attempts
+            stats["retries"] += max(0, attempts - 1)
+            if not succeeded:
+                stats["failures"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            snapshot = {name: dict(stats) for name, stats in self._stats.items()}
+        for stats in snapshot.values():
+            stats["retry_rate"] = round(stats["retries"] / stats["calls"], 3) if stats["calls"] else 0.0
+        return snapshot
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# アプリケーション全体で共有する計測値
+llm_metrics = LatencyMetrics()
+llm_retry_stats = RetryStats()
@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from typing import Any, Dict, Generator, List, Optional, Type
+
+from pydantic import BaseModel
+
+from app.schemas.schemas import GENERATION_GROUPS
+from app.services.llm.base import LLMClient
+from app.services.llm.rag_executor import RAGExecutor
+
+logger = logging.getLogger(__name__)
+
+# 英数字の連続は1トークン、それ以外 (日本語・記号) は1文字1トークンとみなす簡易トークナイザ
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+|\s+|.", re.DOTALL)
+
+
+def approximate_tokens(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text)
+
+
+def _common_prefix_length(a: List[str], b: List[str]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class MockLLMClient(LLMClient):
+    """
+    APIやGPUのないCPU専用環境 (テスト・計測用) で使うモックのLLMクライアント。
+    LLM_CLIENT_TYPE=mock で有効になります。
+
+    実際には生成を行わず、スキーマの各項目を None で埋めたJSONを返します。
+    Ollama (llama.cpp) のKVキャッシュを模擬し、直近 num_slots 件のプロンプトと先頭が一致するトークン数を
+    「再利用されたプレフィックストークン」として集計します。プロンプトのレイアウト変更による削減効果の計測に使います。
+    """
+
+    def __init__(self, num_slots: Optional[int] = None):
+        if num_slots is None:
+            num_slots = int(os.getenv("MOCK_LLM_KV_SLOTS", "1"))
+        self._slots = deque(maxlen=max(1, num_slots))
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.reused_prefix_tokens = 0
+        self.prompts: List[str] = []
+
+    def _record_prompt(self, prompt: str) -> int:
+        """プロンプトを処理したものとして記録し、再利用できたプレフィックスのトークン数を返す"""
+        tokens = approximate_tokens(prompt)
+        with self._lock:
+            reused = max((_common_prefix_length(tokens, cached) for cached in self._slots), default=0)
+            self._slots.append(tokens)
+            self.calls += 1
+            self.prompt_tokens += len(tokens)
+            self.reused_prefix_tokens += reused
+            self.prompts.append(prompt)
+        return reused
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "reused_prefix_tokens": self.reused_prefix_tokens,
+                "reuse_ratio": round(self.reused_prefix_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            }
+
+    def generate_json(self, prompt: str, schema: Type[BaseModel]) -> Dict[str, Any]:
+        self._record_prompt(prompt)
+        return {name: None for name in schema.model_fields}
+
+    def generate_text(self, prompt: str) -> str:
+        self._record_prompt(prompt)
+        return ""
+
+    def generate_plan_stream(self, patient_data: Dict[str, Any], incremental: bool = False) -> Generator[str, None, None]:
+        for group_schema in GENERATION_GROUPS:
+            for key in group_schema.model_fields:
+                yield self._create_event("update", {"key": key, "value": "特記なし", "model_type": "general"})
+        yield "event: general_finished\ndata: {}\n\n"
+
+    def regenerate_plan_item_stream(
+        self,
+        patient_data: Dict[str, Any],
+        item_key: str,
+        current_text: str,
+        instruction: str,
+        rag_executor: Optional[RAGExecutor] = None
+    ) -> Generator[str, None, None]:
+        yield self._create_event("update", {"key": item_key, "chunk": current_text})
+        yield "event: finished\ndata: {}\n\n"
+
+    def generate_rag_plan_stream(
+        self,
+        patient_data: Dict[str, Any],
+        rag_executor: RAGExecutor
+    ) -> Generator[str, None, None]:
+        yield "event: finished\ndata: {}\n\n"
+
+    def _create_event(self, event_type: str, data: Dict[str, Any]) -> str:
+        return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
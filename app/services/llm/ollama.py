@@ -3,21 +3,30 @@ import logging
 import os
 import re
 import time
-from typing import Any, Dict, Generator, Optional, Type
+from typing import Any, Dict, Generator, List, Optional, Type
 
-import ollama
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field, ValidationError, create_model
+from pydantic import BaseModel, ValidationError
 
 from app.schemas.schemas import GENERATION_GROUPS
+from app.services.field_registry import get_field_registry
 from app.services.llm.base import LLMClient
+from app.services.llm.cancellation import current_cancel_token
+from app.services.llm.client_pool import llm_client_pool
+from app.services.llm.incremental_json import IncrementalJSONError, IncrementalJSONParser, iter_string_field_deltas
+from app.services.llm.metrics import llm_retry_stats
+from app.services.llm.plan_snapshots import changed_fact_categories, fields_to_regenerate, plan_snapshot_store
 from app.services.llm.context_builder import (
-    CHECK_TO_TEXT_MAP,
     USER_INPUT_FIELDS,
-    prepare_patient_facts,
+    get_patient_facts,
 )
-from app.services.llm.prompts import build_group_prompt, build_regeneration_prompt
+from app.services.llm.prompts import build_batch_regeneration_prompt, build_group_prompt, build_regeneration_prompt
 from app.services.llm.rag_executor import RAGExecutor
+from app.services.llm.rehab_rag_path import REHAB_RAG_PATH  # noqa: F401  (rag_components より前に読み込む)
+from app.services.llm.schema_registry import schema_registry
+from app.services.llm.text_coalescer import coalesce_text
+# LLM応答のキャッシュは、Rehab_RAG と同じもの (プロセス内で共有) を使う
+from rag_components.response_cache import get_response_cache
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -26,9 +35,29 @@ logger = logging.getLogger(__name__)
 OLLAMA_MODEL_NAME = os.getenv("OLLAMA_MODEL_NAME", "qwen3:8b")
 # 構造的出力（JSONモード）を使用するかどうかのフラグ
 OLLAMA_USE_STRUCTURED_OUTPUT = os.getenv("OLLAMA_USE_STRUCTURED_OUTPUT", "true").lower() == "true"
+# JSONモードの代わりに、各グループのJSONスキーマを format に渡して文法制約付きでデコードするかどうか
+# (Ollama 0.5 以降が必要。OLLAMA_USE_STRUCTURED_OUTPUT が true の場合のみ有効)
+OLLAMA_USE_SCHEMA_FORMAT = os.getenv("OLLAMA_USE_SCHEMA_FORMAT", "false").lower() == "true"
 GENERATION_TIMEOUT_SEC = 60
 USE_DUMMY_DATA = False
 
+# 抽出・標準化用の呼び出しで共通にするコンテキスト長
+# num_ctx が呼び出しごとに異なるとモデルが再ロードされ、KVキャッシュ (プロンプトの共通プレフィックス) が再利用されない
+EXTRACTION_NUM_CTX = int(os.getenv("OLLAMA_EXTRACTION_NUM_CTX", "8192"))
+# 患者情報の抽出 (generate_json) の温度。決定的な出力にし、同じカルテの再抽出を応答キャッシュから返せるようにする
+EXTRACTION_TEMPERATURE = 0.0
+# モデルをメモリに保持する時間。保持中はKVキャッシュも残るため、同じカルテに対する後続の呼び出しが速くなる
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# JSONの開始 ("{") までに許容する文章の長さ (<think> ブロックを除く)。これを超えたら出力が崩れているとみなす
+MAX_TEXT_BEFORE_JSON = 500
+# Ollamaがフィールドをまとめて包むことがあるキー (_resolve_nested_json と同じ)
+NESTED_WRAPPER_KEYS = ("properties", "attributes", "data")
+
+
+class StreamValidationError(ValueError):
+    """ストリーミング中の出力が、これ以上読み進めても正しいJSONにならないと判断できたことを表す例外"""
+
 
 class OllamaClient(LLMClient):
     """
@@ -45,22 +74,32 @@ class OllamaClient(LLMClient):
         # 抽出・標準化用のモデル（指定がなければメインと同じ）
         self.extraction_model_name = os.getenv("OLLAMA_EXTRACTION_MODEL_NAME", self.model_name)
         
-        # OllamaサーバーのURL（必要に応じて使用）
-        self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        # OllamaサーバーのURL (未指定の場合は ollama ライブラリと同じく OLLAMA_HOST を使う)
+        self.base_url = os.getenv("OLLAMA_BASE_URL") or os.getenv("OLLAMA_HOST") or "http://localhost:11434"
         
         logger.info(f"OllamaClient initialized. Model: {self.model_name}, Extraction: {self.extraction_model_name}")
 
-    def generate_plan_stream(self, patient_data: Dict[str, Any]) -> Generator[str, None, None]:
+    def generate_plan_stream(self, patient_data: Dict[str, Any], incremental: bool = False) -> Generator[str, None, None]:
+        """
+        Ollamaを使用して計画案をストリーミングで生成する。
+        incremental=True の場合は、前回の生成から参照先の患者データが変わった項目だけを生成し、残りは前回の結果を送る。
+        """
         if USE_DUMMY_DATA:
              yield self._create_event("error", {"error": "ダミーデータモードは現在サポートされていません。"})
              return
 
         try:
             # 1. 患者情報の整形
-            patient_facts = prepare_patient_facts(patient_data)
-            patient_facts_str = json.dumps(patient_facts, indent=2, ensure_ascii=False, default=str)
+            patient_facts, patient_facts_str = get_patient_facts(patient_data)
             generated_plan_so_far = {}
 
+            # 差分生成: 同じ患者の前回の生成で使った患者データと比べる
+            snapshot_key = (self.__class__.__name__, patient_data.get("patient_id"))
+            snapshot = plan_snapshot_store.get(snapshot_key) if incremental and snapshot_key[1] is not None else None
+            changed_categories = changed_fact_categories(snapshot["facts"], patient_facts) if snapshot else set()
+            if snapshot:
+                logger.info(f"Incremental generation: changed fact categories = {sorted(changed_categories)}")
+
             # ユーザー入力済み項目の処理
             for field_name in USER_INPUT_FIELDS:
                 if patient_data.get(field_name):
@@ -74,77 +113,85 @@ class OllamaClient(LLMClient):
             for group_schema in GENERATION_GROUPS:
                 logger.info(f"--- Ollama Generating Group: {group_schema.__name__} ---")
 
-                # プロンプト構築 (Ollama用フラグON)
-                prompt = build_group_prompt(
-                    group_schema,
-                    patient_facts_str,
-                    generated_plan_so_far,
-                    is_ollama=True
-                )
-
-                # JSONモードの設定
-                format_param = "json" if OLLAMA_USE_STRUCTURED_OUTPUT else None
-                if not OLLAMA_USE_STRUCTURED_OUTPUT:
-                    prompt += "\n\nEnsure the output is a valid JSON object."
+                # 失敗した試行でも、検証済みのフィールドは保持して次の試行では残りだけを依頼する
+                # 差分生成で再利用する項目も、保持済みのフィールドとして扱う
+                salvaged_fields = {}
+                stale_fields = fields_to_regenerate(group_schema, snapshot, changed_categories, generated_plan_so_far)
+                for field_name in group_schema.model_fields:
+                    if field_name not in stale_fields:
+                        salvaged_fields[field_name] = snapshot["plan"][field_name]
+                        generated_plan_so_far[field_name] = snapshot["plan"][field_name]
+                        yield self._create_event(
+                            "update", {"key": field_name, "value": snapshot["plan"][field_name], "model_type": "ollama_general"}
+                        )
+                if snapshot:
+                    plan_snapshot_store.record(len(salvaged_fields), len(stale_fields))
+                attempts = 0
+                succeeded = False
 
                 # リトライループ
                 for attempt in range(max_retries):
+                    missing_fields = tuple(f for f in group_schema.model_fields if f not in salvaged_fields)
+                    if not missing_fields:
+                        # 前回までの試行で全項目が揃っている
+                        succeeded = True
+                        break
+                    attempts += 1
                     try:
                         logger.info(f"--- Group: {group_schema.__name__} (Attempt: {attempt+1}/{max_retries}) ---")
 
+                        target_schema = (
+                            schema_registry.partial_schema(group_schema, missing_fields) if salvaged_fields else group_schema
+                        )
+
+                        # プロンプト構築 (Ollama用フラグON)
+                        # 保持済みのフィールドは「これまでの生成結果」としてプロンプトに含まれる
+                        prompt = build_group_prompt(
+                            target_schema,
+                            patient_facts_str,
+                            generated_plan_so_far,
+                            is_ollama=True,
+                            context_group=group_schema,
+                        )
+                        if not OLLAMA_USE_STRUCTURED_OUTPUT:
+                            prompt += "\n\nEnsure the output is a valid JSON object."
+
                         start_time = time.time()
 
                         # API呼び出し (ストリーミング)
-                        stream = ollama.chat(
+                        stream = self._chat(
                             model=self.model_name,
                             messages=[{"role": "user", "content": prompt}],
-                            format=format_param,
+                            format=self._format_param(target_schema),
                             stream=True
                         )
 
-                        accumulated_json_string = ""
-                        for chunk in stream:
-                            if time.time() - start_time > GENERATION_TIMEOUT_SEC:
-                                raise TimeoutError(f"Generation exceeded {GENERATION_TIMEOUT_SEC} seconds.")
-                            if chunk["message"]["content"]:
-                                accumulated_json_string += chunk["message"]["content"]
-
-                        logger.debug(f"Ollama Raw Response:\n{accumulated_json_string}")
-
-                        # JSON抽出とパース
-                        raw_response_dict = {}
-                        if OLLAMA_USE_STRUCTURED_OUTPUT:
-                            try:
-                                raw_response_dict = json.loads(accumulated_json_string)
-                            except json.JSONDecodeError:
-                                # 構造化モードでも失敗する場合があるため、フォールバックとして抽出関数を試す
-                                raw_response_dict = self._extract_and_parse_json(accumulated_json_string)
-                        else:
-                            raw_response_dict = self._extract_and_parse_json(accumulated_json_string)
-
-                        # ネスト構造の解決とバリデーション
-                        data_to_validate = self._resolve_nested_json(raw_response_dict, group_schema)
-
-                        # Pydantic検証
-                        group_result_obj = group_schema.model_validate(data_to_validate)
-                        group_result_dict = group_result_obj.model_dump()
-
-                        # 成功時: 結果を反映してストリーミング
-                        for field_name, generated_text in group_result_dict.items():
+                        # 値が閉じたフィールドから順に反映してストリーミング
+                        for field_name, generated_text in self._iter_stream_fields(stream, target_schema, start_time):
+                            salvaged_fields[field_name] = generated_text
                             final_text = self._post_process_text(field_name, generated_text, patient_data)
                             generated_plan_so_far[field_name] = final_text
                             yield self._create_event("update", {"key": field_name, "value": final_text, "model_type": "ollama_general"})
 
+                        succeeded = True
                         break  # 成功したらリトライループを抜ける
 
                     except (ValidationError, json.JSONDecodeError, ValueError, TimeoutError) as e:
-                        logger.warning(f"Ollama generation failed (Attempt {attempt+1}): {e}")
+                        logger.warning(
+                            f"Ollama generation failed (Attempt {attempt+1}): {e} "
+                            f"(kept {len(salvaged_fields)}/{len(group_schema.model_fields)} fields)"
+                        )
                         if attempt == max_retries - 1:
                             logger.error(f"Group {group_schema.__name__} failed after max retries.")
                             yield self._create_event("error", {"error": f"グループ {group_schema.__name__} の生成に失敗しました: {str(e)}"})
                         else:
                             time.sleep(1)
 
+                if attempts:
+                    llm_retry_stats.record(f"ollama.plan.{group_schema.__name__}", attempts, succeeded)
+
+            if snapshot_key[1] is not None:
+                plan_snapshot_store.save(snapshot_key, patient_facts, generated_plan_so_far)
             yield "event: general_finished\ndata: {}\n\n"
 
         except Exception as e:
@@ -161,8 +208,7 @@ class OllamaClient(LLMClient):
     ) -> Generator[str, None, None]:
 
         try:
-            patient_facts = prepare_patient_facts(patient_data)
-            patient_facts_str = json.dumps(patient_facts, indent=2, ensure_ascii=False, default=str)
+            patient_facts, patient_facts_str = get_patient_facts(patient_data)
 
             generated_plan_so_far = patient_data.copy()
             if item_key in generated_plan_so_far:
@@ -180,11 +226,8 @@ class OllamaClient(LLMClient):
                 except Exception as e:
                     logger.error(f"RAGExecutor error during regeneration: {e}")
 
-            # 動的スキーマ生成
-            RegenerationSchema = create_model(
-                f"RegenerationSchema_{item_key}",
-                **{item_key: (str, Field(..., description=f"修正指示に基づいて書き直された'{item_key}'の新しい文章。"))},
-            )
+            # 動的スキーマ生成 (項目ごとにレジストリでキャッシュ)
+            RegenerationSchema = schema_registry.regeneration_schema(item_key)
 
             # プロンプト構築
             prompt = build_regeneration_prompt(
@@ -197,28 +240,33 @@ class OllamaClient(LLMClient):
                 schema=RegenerationSchema # Ollamaの場合はスキーマも渡す
             )
 
-            format_param = "json" if OLLAMA_USE_STRUCTURED_OUTPUT else None
+            format_param = self._format_param(RegenerationSchema)
             if not OLLAMA_USE_STRUCTURED_OUTPUT:
                 prompt += "\n\nEnsure the output is a valid JSON object."
 
-            regenerated_text = ""
             max_retries = 5
 
             for attempt in range(max_retries):
+                # この試行で画面に送信済みの文章 (失敗した場合は reset イベントで取り消す)
+                sent_text = ""
                 try:
                     logger.info(f"--- Regenerating Item: {item_key} (Attempt: {attempt+1}) ---")
 
-                    stream = ollama.chat(
+                    stream = self._chat(
                         model=self.model_name,
                         messages=[{"role": "user", "content": prompt}],
                         format=format_param,
                         stream=True
                     )
 
-                    accumulated_json_string = ""
-                    for chunk in stream:
-                        if chunk["message"]["content"]:
-                            accumulated_json_string += chunk["message"]["content"]
+                    # 生成中の文章を文単位・一定時間ごとにまとめて送信する
+                    raw_parts = []
+                    parser = IncrementalJSONParser()
+                    deltas = iter_string_field_deltas(parser, self._iter_json_content(stream, raw_parts), item_key)
+                    for text in coalesce_text(deltas):
+                        sent_text += text
+                        yield self._create_event("update", {"key": item_key, "chunk": text})
+                    accumulated_json_string = "".join(raw_parts)
 
                     # パースと検証
                     json_data_raw = {}
@@ -240,24 +288,119 @@ class OllamaClient(LLMClient):
 
                     validated_data = RegenerationSchema.model_validate(data_to_validate)
                     regenerated_text = validated_data.model_dump().get(item_key, "")
+                    if not regenerated_text.startswith(sent_text):
+                        raise ValueError("送信済みの文章と、完成したJSONの文章が一致しません。")
+
+                    # 逐次解析で送信できなかった残り (ネストされた出力など) を送る
+                    if len(regenerated_text) > len(sent_text):
+                        yield self._create_event("update", {"key": item_key, "chunk": regenerated_text[len(sent_text):]})
+                    llm_retry_stats.record("ollama.regeneration", attempt + 1, True)
                     break
 
                 except Exception as e:
                     logger.warning(f"Regeneration failed (Attempt {attempt+1}): {e}")
                     if attempt == max_retries - 1:
+                        llm_retry_stats.record("ollama.regeneration", max_retries, False)
                         raise e
+                    if sent_text:
+                        # 途中まで表示した文章を取り消してから再試行する
+                        yield self._create_event("reset", {"key": item_key})
                     time.sleep(1)
 
-            # 結果をストリーミング
-            for char in regenerated_text:
-                yield self._create_event("update", {"key": item_key, "chunk": char})
-
             yield "event: finished\ndata: {}\n\n"
 
         except Exception as e:
             logger.error(f"Regeneration Error: {e}", exc_info=True)
             yield self._create_event("error", {"error": f"再生成中にエラーが発生しました: {str(e)}"})
 
+    def regenerate_plan_items_stream(
+        self,
+        patient_data: Dict[str, Any],
+        items: List[Dict[str, str]],
+        rag_executor: Optional[RAGExecutor] = None
+    ) -> Generator[str, None, None]:
+        """
+        複数の項目を一括で再生成する。
+        患者情報の整形とRAG検索は1回だけ行い、全項目を含むスキーマで生成して、値が閉じた項目から順に送信する。
+        失敗した試行でも検証済みの項目は保持し、次の試行では残りの項目だけを依頼する。
+        """
+        try:
+            item_keys = tuple(item["item_key"] for item in items)
+
+            patient_facts, patient_facts_str = get_patient_facts(patient_data)
+
+            generated_plan_so_far = {k: v for k, v in patient_data.items() if k not in item_keys}
+
+            # RAG検索 (全項目で共有)
+            rag_context_str = None
+            if rag_executor:
+                try:
+                    rag_result = rag_executor.execute(patient_facts)
+                    contexts = rag_result.get("contexts", [])
+                    if contexts:
+                        rag_context_str = "\n\n".join([ctx.get("content", str(ctx)) for ctx in contexts])
+                        logger.info(f"--- RAG一括再生成: {len(contexts)}件の専門知識を発見 ---")
+                except Exception as e:
+                    logger.error(f"RAGExecutor error during batch regeneration: {e}")
+
+            # 動的スキーマ生成 (項目の組み合わせごとにレジストリでキャッシュ)
+            BatchRegenerationSchema = schema_registry.batch_regeneration_schema(item_keys)
+
+            max_retries = 5
+            salvaged_items = {}
+
+            for attempt in range(max_retries):
+                # スキーマのフィールド順 (キー順) で並べ、部分スキーマのキャッシュが指定順ごとに増えないようにする
+                missing_keys = tuple(key for key in BatchRegenerationSchema.model_fields if key not in salvaged_items)
+                try:
+                    logger.info(f"--- Regenerating Items: {', '.join(missing_keys)} (Attempt: {attempt+1}) ---")
+
+                    target_schema = (
+                        schema_registry.partial_schema(BatchRegenerationSchema, missing_keys)
+                        if salvaged_items else BatchRegenerationSchema
+                    )
+                    prompt = build_batch_regeneration_prompt(
+                        patient_facts_str,
+                        generated_plan_so_far,
+                        [item for item in items if item["item_key"] in missing_keys],
+                        rag_context_str,
+                        schema=target_schema # Ollamaの場合はスキーマも渡す
+                    )
+                    if not OLLAMA_USE_STRUCTURED_OUTPUT:
+                        prompt += "\n\nEnsure the output is a valid JSON object."
+
+                    start_time = time.time()
+                    stream = self._chat(
+                        model=self.model_name,
+                        messages=[{"role": "user", "content": prompt}],
+                        format=self._format_param(target_schema),
+                        stream=True
+                    )
+
+                    # 値が閉じた項目から順に送信する
+                    for item_key, regenerated_text in self._iter_stream_fields(stream, target_schema, start_time):
+                        salvaged_items[item_key] = regenerated_text
+                        yield self._create_event("update", {"key": item_key, "chunk": regenerated_text})
+
+                    llm_retry_stats.record("ollama.regeneration_batch", attempt + 1, True)
+                    break
+
+                except (ValidationError, json.JSONDecodeError, ValueError, TimeoutError) as e:
+                    logger.warning(
+                        f"Batch regeneration failed (Attempt {attempt+1}): {e} "
+                        f"(kept {len(salvaged_items)}/{len(item_keys)} items)"
+                    )
+                    if attempt == max_retries - 1:
+                        llm_retry_stats.record("ollama.regeneration_batch", max_retries, False)
+                        raise e
+                    time.sleep(1)
+
+            yield "event: finished\ndata: {}\n\n"
+
+        except Exception as e:
+            logger.error(f"Batch Regeneration Error: {e}", exc_info=True)
+            yield self._create_event("error", {"error": f"一括再生成中にエラーが発生しました: {str(e)}"})
+
     def generate_rag_plan_stream(
         self,
         patient_data: Dict[str, Any],
@@ -266,7 +409,7 @@ class OllamaClient(LLMClient):
 
         try:
             logger.info("--- Ollama RAGモデルによる生成を開始 ---")
-            patient_facts = prepare_patient_facts(patient_data)
+            patient_facts, _ = get_patient_facts(patient_data)
 
             # RAGExecutor実行 (内部でOllama LLMを呼ぶ)
             rag_result = rag_executor.execute(patient_facts)
@@ -331,17 +474,29 @@ class OllamaClient(LLMClient):
     def generate_json(self, prompt: str, schema: Type[BaseModel]) -> Dict[str, Any]:
         """
         Ollamaを使用してJSONを生成する（同期処理）
+        失敗時は例外を送出し、再試行は呼び出し元に任せる (試行回数は再試行する側でグループごとに llm_retry_stats へ記録する)。
+        同じプロンプト・スキーマでの呼び出しは応答キャッシュから返す (温度が LLM_CACHE_MAX_TEMPERATURE 以下の場合のみ)。
         """
-        format_param = "json" if OLLAMA_USE_STRUCTURED_OUTPUT else None
+        options = {"temperature": EXTRACTION_TEMPERATURE, "num_ctx": EXTRACTION_NUM_CTX}
+        format_param = self._format_param(schema)
+        return get_response_cache().get_or_generate(
+            f"ollama.json.{schema.__name__}",
+            lambda: self._generate_json_uncached(prompt, schema, format_param, options),
+            model=self.extraction_model_name, prompt=prompt, schema=schema,
+            temperature=options["temperature"], format=format_param, num_ctx=EXTRACTION_NUM_CTX,
+        )
 
+    def _generate_json_uncached(
+        self, prompt: str, schema: Type[BaseModel], format_param, options: Dict[str, Any]
+    ) -> Dict[str, Any]:
         # 呼び出し (ストリーミングなし)
-        # optionsでtemperature等を調整
-        response = ollama.chat(
+        response = self._chat(
             model=self.extraction_model_name,
             messages=[{"role": "user", "content": prompt}],
             format=format_param,
             stream=False,
-            options={"temperature": 0.2, "num_ctx": 8192}
+            options=options,
+            keep_alive=OLLAMA_KEEP_ALIVE,
         )
 
         raw_json_str = response["message"]["content"]
@@ -372,18 +527,223 @@ class OllamaClient(LLMClient):
     def generate_text(self, prompt: str) -> str:
         """
         プレーンテキストを生成 (同期) - 標準化(HyDE)で使用
+        変更のないカルテの標準化など、同じプロンプトでの呼び出しは応答キャッシュから返す。
         """
-        try:
-            response = ollama.chat(
+        options = {'temperature': 0.0, 'num_ctx': EXTRACTION_NUM_CTX}
+
+        def generate():
+            response = self._chat(
                 model=self.extraction_model_name,
                 messages=[{'role': 'user', 'content': prompt}],
-                options={'temperature': 0.0}
+                options=options,
+                keep_alive=OLLAMA_KEEP_ALIVE,
             )
             return response.get('message', {}).get('content', '').strip()
+
+        try:
+            return get_response_cache().get_or_generate(
+                "ollama.text", generate,
+                model=self.extraction_model_name, prompt=prompt,
+                temperature=options['temperature'], num_ctx=EXTRACTION_NUM_CTX,
+            )
         except Exception as e:
             logger.error(f"Ollama generate_text failed: {e}")
             return ""
 
+    def _iter_json_content(self, stream, raw_parts: list) -> Generator[str, None, None]:
+        """
+        self._chat(stream=True) の出力から、<think> ブロックを除いた本文を順に返す。
+        生の出力は raw_parts に溜める (ストリーム完了後の一括パース用)。終了時にはストリームを閉じる。
+        """
+        pending_prefix = ""
+        json_started = False
+        try:
+            for chunk in stream:
+                content = chunk["message"]["content"]
+                if not content:
+                    continue
+                raw_parts.append(content)
+                if json_started:
+                    yield content
+                    continue
+                # JSONの開始が確定するまでは溜めておく (<think> 内の "{" をJSONと誤認しないため)
+                pending_prefix += content
+                visible = re.sub(r'<think>.*?</think>', '', pending_prefix, flags=re.DOTALL)
+                if '<think>' in visible or '{' not in visible:
+                    continue
+                json_started = True
+                yield visible
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
+    def _format_param(self, schema: Type[BaseModel]):
+        """
+        chat の format 引数。
+        スキーマ指定モードではグループのJSONスキーマを渡し、出力をスキーマどおりのJSONに制約する
+        (ネストの崩れや項目の欠落によるリトライが起きなくなる)。
+        """
+        if not OLLAMA_USE_STRUCTURED_OUTPUT:
+            return None
+        if OLLAMA_USE_SCHEMA_FORMAT:
+            return schema_registry.ollama_format(schema)
+        return "json"
+
+    def _chat(self, **kwargs):
+        """
+        プールで共有する ollama.Client (keep-alive で接続を再利用) 経由で chat を呼び出す。
+        同時呼び出し数が上限 (LLM_MAX_IN_FLIGHT_OLLAMA) に達している場合は空きを待つ。
+        stream=True の場合は、ストリームを読み終える (閉じる) まで枠を占有する。
+
+        抽出スケジューラのタイムスライス内では、締め切りを過ぎていれば呼び出さず、
+        呼び出し中のリクエストも残り時間でタイムアウトさせる。
+        """
+        if kwargs.get("stream"):
+            return self._chat_stream(**kwargs)
+        with llm_client_pool.slot("ollama"):
+            return self._http_client().chat(**kwargs)
+
+    def _chat_stream(self, **kwargs) -> Generator[Any, None, None]:
+        with llm_client_pool.slot("ollama"):
+            stream = self._http_client().chat(**kwargs)
+            try:
+                yield from stream
+            finally:
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+
+    def _http_client(self):
+        token = current_cancel_token()
+        if token is None or token.remaining() is None:
+            return llm_client_pool.ollama_http_client(self.base_url)
+        token.raise_if_cancelled()
+        return llm_client_pool.ollama_http_client(self.base_url, timeout=max(1.0, token.remaining()))
+
+    def _iter_stream_fields(
+        self, stream, group_schema: Type[BaseModel], start_time: float
+    ) -> Generator[tuple, None, None]:
+        """
+        self._chat(stream=True) の出力を逐次解析し、スキーマの型で検証できたトップレベルのフィールドを
+        値が閉じた順に (キー, 値) で返す。
+
+        次のように、読み進めても正しいJSONにならないことが分かった時点でストリームを打ち切り、
+        StreamValidationError を送出する (それまでに返したフィールドは呼び出し側で保持できる)。
+        - JSONとして不正な文字、スキーマにないキー、型の合わない値
+        - JSONが始まらないまま MAX_TEXT_BEFORE_JSON 文字を超える文章
+        ルートのオブジェクトが閉じた時点で読み取りを終え、その後の出力 (説明文など) は待たない。
+
+        最後に全体を一括で検証し、逐次解析で取り出せなかったフィールドを補う。
+        一括の検証に失敗した場合は例外を送出する (呼び出し側でリトライする)。
+        """
+        parser = IncrementalJSONParser()
+        accumulated_json_string = ""
+        # ルートの "{" より前のテキスト (<think> タグなど) は、JSONの開始が確定するまで溜めておく
+        pending_prefix = ""
+        emitted = {}
+
+        try:
+            for chunk in stream:
+                if time.time() - start_time > GENERATION_TIMEOUT_SEC:
+                    raise TimeoutError(f"Generation exceeded {GENERATION_TIMEOUT_SEC} seconds.")
+                content = chunk["message"]["content"]
+                if not content:
+                    continue
+                accumulated_json_string += content
+
+                if not parser.started:
+                    pending_prefix += content
+                    visible = re.sub(r'<think>.*?</think>', '', pending_prefix, flags=re.DOTALL)
+                    if '<think>' in visible:
+                        continue
+                    if '{' not in visible:
+                        if len(visible.strip()) > MAX_TEXT_BEFORE_JSON:
+                            raise StreamValidationError("JSONが始まらないまま文章が出力されています。")
+                        continue
+                    content = visible
+                    pending_prefix = ""
+
+                try:
+                    completed = parser.feed(content)
+                except IncrementalJSONError as e:
+                    raise StreamValidationError(f"不正なJSONが出力されました: {e}") from e
+
+                for key, value in completed:
+                    for field_name, field_value in self._validate_stream_field(group_schema, key, value):
+                        if field_name not in emitted:
+                            emitted[field_name] = field_value
+                            yield field_name, field_value
+
+                # 値の完了を待たずに、キー名の時点でスキーマ外の出力を検知する
+                current_key = parser.current_key
+                if current_key is not None and not self._is_allowed_stream_key(group_schema, current_key):
+                    raise StreamValidationError(f"スキーマにない項目 '{current_key}' が出力されました。")
+
+                if parser.done:
+                    break
+        finally:
+            # 打ち切った場合も接続を閉じ、Ollama側の生成を止める
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
+        logger.debug(f"Ollama Raw Response:\n{accumulated_json_string}")
+
+        # JSON抽出とパース
+        raw_response_dict = {}
+        if parser.done:
+            raw_response_dict = parser.fields
+        elif OLLAMA_USE_STRUCTURED_OUTPUT:
+            try:
+                raw_response_dict = json.loads(accumulated_json_string)
+            except json.JSONDecodeError:
+                # 構造化モードでも失敗する場合があるため、フォールバックとして抽出関数を試す
+                raw_response_dict = self._extract_and_parse_json(accumulated_json_string)
+        else:
+            raw_response_dict = self._extract_and_parse_json(accumulated_json_string)
+
+        # ネスト構造の解決とバリデーション
+        data_to_validate = self._resolve_nested_json(raw_response_dict, group_schema)
+        if isinstance(data_to_validate, dict):
+            # 逐次検証済みのフィールドは、ネストの形に関わらずそのまま使う
+            data_to_validate = {**data_to_validate, **emitted}
+
+        # Pydantic検証
+        group_result_obj = group_schema.model_validate(data_to_validate)
+        group_result_dict = group_result_obj.model_dump()
+
+        for field_name, generated_text in group_result_dict.items():
+            if field_name not in emitted:
+                yield field_name, generated_text
+
+    def _is_allowed_stream_key(self, group_schema: Type[BaseModel], key: str) -> bool:
+        """スキーマのフィールド、またはフィールドを包むキー (スキーマ名・"properties" など) かどうか"""
+        if key in group_schema.model_fields:
+            return True
+        return key.lower() in NESTED_WRAPPER_KEYS or key.lower() == group_schema.__name__.lower()
+
+    def _validate_stream_field(self, group_schema: Type[BaseModel], key: str, value: Any) -> list:
+        """
+        逐次解析で取り出したトップレベルの (キー, 値) をスキーマのフィールドの型で検証する。
+        スキーマ名や "properties" などでネストされている場合は、内側のフィールドを取り出す。
+
+        Raises:
+            StreamValidationError: スキーマにないキー、または型の合わない値の場合
+        """
+        if key in group_schema.model_fields:
+            try:
+                return [(key, schema_registry.field_adapter(group_schema, key).validate_python(value))]
+            except ValidationError as e:
+                raise StreamValidationError(f"項目 '{key}' の値がスキーマの型と一致しません: {e.errors()[0]['msg']}") from e
+        if isinstance(value, dict) and self._is_allowed_stream_key(group_schema, key):
+            results = []
+            for inner_key, inner_value in value.items():
+                if inner_key in group_schema.model_fields:
+                    results.extend(self._validate_stream_field(group_schema, inner_key, inner_value))
+            return results
+        raise StreamValidationError(f"スキーマにない項目 '{key}' が出力されました。")
+
     def _extract_and_parse_json(self, text: str) -> dict:
         """
         LLMの出力テキストからJSON部分を抽出してパースする。
@@ -442,16 +802,15 @@ class OllamaClient(LLMClient):
     def _post_process_text(self, field_name: str, generated_text: str, patient_data: Dict[str, Any]) -> str:
         """特記なしの復元処理など"""
         final_text = generated_text
-        if field_name in CHECK_TO_TEXT_MAP.values():
-            chk_key = next((c for c, t in CHECK_TO_TEXT_MAP.items() if t == field_name), None)
-            if chk_key:
-                is_checked = str(patient_data.get(chk_key)).lower() in ["true", "1", "on"]
-                if not is_checked:
-                    final_text = "特記なし"
-                elif generated_text == "特記なし":
-                    orig = patient_data.get(field_name)
-                    if orig and orig != "特記なし":
-                        final_text = orig
+        chk_key = get_field_registry().check_key_for(field_name)
+        if chk_key:
+            is_checked = str(patient_data.get(chk_key)).lower() in ["true", "1", "on"]
+            if not is_checked:
+                final_text = "特記なし"
+            elif generated_text == "特記なし":
+                orig = patient_data.get(field_name)
+                if orig and orig != "特記なし":
+                    final_text = orig
         return final_text
 
     def _create_event(self, event_type: str, data: Dict[str, Any]) -> str:
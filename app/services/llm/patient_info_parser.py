@@ -10,65 +10,48 @@ from pydantic import BaseModel
 
 # from app.schemas.schemas import HYBRID_GENERATION_GROUPS, PATIENT_INFO_EXTRACTION_GROUPS
 from app.schemas.schemas import (
+    PATIENT_INFO_EXTRACTION_DEPENDENCIES,
     PATIENT_INFO_EXTRACTION_GROUPS,
+    PATIENT_INFO_EXTRACTION_PRIORITIES,
     HYBRID_COMBINED_GROUPS  # <--- 新しく作った統合グループのみインポート
 )
 from app.services.extraction.fast_extractor import FastExtractor
+from app.services.llm.cancellation import CallCancelledError, CancelToken, current_cancel_token, run_with_token
+from app.services.llm.extraction_scheduler import ExtractionScheduler
+from app.services.llm.metrics import llm_retry_stats
+# optimize_schema_for_prompt は schema_registry.py へ移動 (既存のimport先を壊さないよう再エクスポート)
+from app.services.llm.schema_registry import optimize_schema_for_prompt, schema_registry  # noqa: F401
 
 # リファクタリング: ファクトリ関数のインポート
 from app.services.llm import get_llm_client
 
 load_dotenv()
 GENERATION_TIMEOUT_SEC = 300
+# 1グループあたりのLLM呼び出しのタイムアウト (秒)
+GROUP_TIMEOUT_SEC = 180
+# 1グループに割り当てる最小の実行時間 (秒)。残り時間がこれを下回るグループは開始せずにスキップする
+MIN_GROUP_SLICE_SEC = float(os.getenv("EXTRACTION_MIN_SLICE_SEC", "20"))
+# 1グループあたりのLLM呼び出しの最大試行回数。出力の検証に失敗した場合は、タイムスライスの範囲内で再試行する
+EXTRACTION_MAX_ATTEMPTS = int(os.getenv("EXTRACTION_MAX_ATTEMPTS", "2"))
 
 logger = logging.getLogger(__name__)
 
-def optimize_schema_for_prompt(schema_cls: type, target_fields_pattern: str = None, filter_mode: bool = False) -> dict:
-    """
-    LLMプロンプト用にJSONスキーマを最適化する。
-    1. Optional (anyOf: [type, null]) を削除し、シンプルな型定義にする。
-    2. 生成させたいフィールドを全て 'required' に追加する。
-    3. (オプション) target_fields_pattern に一致しないフィールドを除外する（ノイズ削減）。
-    """
-    raw_schema = schema_cls.model_json_schema()
-    properties = raw_schema.get("properties", {})
-    new_properties = {}
-    required_fields = []
-
-    for key, prop in properties.items():
-        # A. フィルタリング (Hybridモード用)
-        if filter_mode:
-            # 除外対象: _chk
-            if key.endswith('_chk'):
-                continue
-            
-            # 許可対象: _txt (文章) と _val (数値) のみ
-            if not (key.endswith('_txt') or key.endswith('_val')):
-                continue
-
-        # B. 型定義の簡略化 (anyOf -> type)
-        if "anyOf" in prop:
-            # anyOfの中から 'null' でない方の型定義を探す
-            real_type = next((x for x in prop["anyOf"] if x.get("type") != "null"), None)
-            if real_type:
-                # descriptionやtitleは元のpropから引き継ぐ
-                new_prop = {k: v for k, v in prop.items() if k != "anyOf" and k != "default"}
-                new_prop.update(real_type)
-                new_properties[key] = new_prop
-        else:
-            new_properties[key] = prop
-
-        # C. 全フィールドを必須(required)にする
-        # LLMに「不明ならnull」と指示してあるので、スキーマ上は必須にして
-        # キー自体は必ず出力させたほうが安定する。
-        required_fields.append(key)
-
-    return {
-        "type": "object",
-        "properties": new_properties,
-        "required": required_fields, # ここで強力に指定
-        "description": raw_schema.get("description", "")
-    }
+# 通常モード（段階的抽出）の全グループで共通の指示事項
+EXTRACTION_INSTRUCTIONS = """# 指示事項
+- テキスト内には、異なる日付の情報が混在している可能性があります。**必ず最も新しい日付の情報や、文脈上最新と思われる情報（例：「現在」「本日」）を優先して抽出してください。**
+- 古い情報（例：「初回評価時」「〇月〇日時点では」）は、新しい情報で上書きしてください。
+- 例えば、「7/1に疼痛NRS 5/10だったが、7/10にはNRS 3/10に軽減」という記述があれば、疼痛は「NRS 3/10」としてください。
+- **最重要**: 今回のタスクでは、以下の「JSONスキーマ」で定義されている項目のみを抽出対象とします。
+- **ADLスコアの時系列解釈**: テキスト内に複数の日付のADLスコア（FIMやBI）がある場合、**最も新しいスコアを `_current_val`** に、**その直前のスコア（2番目に新しいスコア）を `_start_val`** に設定してください。スコアが1つしか記録されていない場合は、`_current_val` と `_start_val` の両方に同じ値を設定してください。
+- **ADLの記述をFIMスコアに変換してください。** 具体的には、「自立」は7点、「監視・準備」は6点、「最小介助」は5点、「中等度介助」は3点、「全介助」は1点として解釈し、対応する`_fim_current_val`項目に数値を設定してください。
+- **基本動作・活動目標のレベル解釈**: テキスト内の記述（例：「寝返りは自立」）を解釈し、対応するラジオボタン用のフィールド（例：`func_basic_rolling_level`）に適切な選択肢の文字列（例：`'independent'`）を設定してください。同時に、関連するチェックボックス（例：`func_basic_rolling_chk` と `func_basic_rolling_independent_chk`）も `true` に設定してください。「一部介助」や「軽介助」は `'partial_assist'` と解釈してください。
+- テキストから情報が読み取れない項目は、無理に推測せず、`null`値としてください。
+- **`True`の値の保持**: 「これまでに抽出された情報」で既に `True` になっているチェックボックス項目は、カルテテキストから反証（例：「意識障害なし」という明確な記述）が見つからない限り、`True` のまま保持してください。`null` で上書きしないでください。
+- **障害者手帳の情報を解釈してください。** 例えば、「右上肢機能障害3級」という記述があれば、`social_disability_certificate_physical_chk`を`true`に、`social_disability_certificate_physical_type_txt`に「上肢」と設定し、`social_disability_certificate_physical_rank_val`に`3`を設定してください。`social_disability_certificate_physical_type_txt`に設定する値は、['視覚', '聴覚', '平衡機能', '言語機能', '音声機能', '咀嚼機能', '上肢', '下肢', '体幹', '心臓機能', '腎臓機能', '呼吸器機能', 'ぼうこう又は直腸機能', '小腸機能', 'ヒト免疫不全ウイルスによる免疫機能', '肝臓機能']の中から最も適切なものを選択してください。
+- **嚥下調整食の必要性**: 「嚥下調整食の必要性あり」という記述があれば `nutrition_swallowing_diet_slct` を `'True'` に、「必要性なし」なら `'None'` に設定してください。 `学会分類コード` の情報があれば `nutrition_swallowing_diet_code_txt` に設定してください。
+- **栄養状態の評価**: テキスト内の「栄養状態は低栄養リスク」などの記述を解釈し、`nutrition_status_assessment_slct` フィールドに `['no_problem', 'malnutrition', 'malnutrition_risk', 'overnutrition', 'other']` の中から最も適切な値を設定してください。
+- **栄養補給方法の親子関係**: 「経口摂取」や「食事」という記述があれば、`nutrition_method_oral_chk`と`nutrition_method_oral_meal_chk`の両方を`true`にしてください。「経管栄養」や「経鼻栄養」という記述があれば`nutrition_method_tube_chk`を`true`にしてください。
+- **不整脈の有無**: `func_circulatory_arrhythmia_status_slct` には、不整脈の有無を `'yes'` または `'no'` で設定してください。"""
 
 
 def get_standardization_prompt(text: str) -> str:
@@ -115,7 +98,7 @@ class PatientInfoParser:
     2. ハイブリッドモード (Local GPU): GLiNER2で事実を高速抽出し、LLMで考察のみを生成する（高速・高スペック環境向け）。
     """
 
-    def __init__(self, use_hybrid_mode: bool = False):
+    def __init__(self, use_hybrid_mode: bool = False, max_concurrency: int = None):
         self.llm_client = get_llm_client()
 
         # ログ出力用にクラス名から判定
@@ -128,6 +111,18 @@ class PatientInfoParser:
         default_ollama_model = os.getenv("OLLAMA_MODEL_NAME", "qwen3:8b")
         self.ollama_model_name = os.getenv("OLLAMA_EXTRACTION_MODEL_NAME", default_ollama_model)
 
+        # 通常モードで同時に実行する抽出グループ数の上限
+        # ローカルのOllamaはリクエストを直列処理することが多いため、既定値は1にしておく
+        if max_concurrency is None:
+            default_concurrency = "4" if self.client_type == "gemini" else "1"
+            max_concurrency = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", default_concurrency))
+        self.max_concurrency = max(1, max_concurrency)
+
+        # 通常モードのプロンプト構成
+        # shared_prefix: 指示事項 + カルテ全文を先頭に固定し、LLM側のプレフィックスキャッシュを効かせる
+        # legacy: 従来どおりスキーマ・サマリーの後にカルテ全文を置く
+        self.prompt_layout = os.getenv("PARSER_PROMPT_LAYOUT", "shared_prefix").lower()
+
         print(f"PatientInfoParser: {client_class_name} を使用します。")
 
         self.fast_extractor = None
@@ -237,32 +232,21 @@ class PatientInfoParser:
 
     def _build_prompt(self, text: str, group_schema: type[BaseModel], extracted_data_so_far: dict) -> str:
         """通常モード（段階的抽出）のためのプロンプト構築"""
+        if self.prompt_layout == "shared_prefix":
+            prefix, suffix = self._build_prompt_parts(text, group_schema, extracted_data_so_far)
+            return prefix + suffix
 
         # これまでに抽出されたデータを簡潔なサマリーにする
         summary = (
             json.dumps(extracted_data_so_far, indent=2, ensure_ascii=False) if extracted_data_so_far else "まだありません。"
         )
 
-        # 今回の抽出対象スキーマをJSON形式の文字列としてプロンプトに含める
-        schema_json = json.dumps(group_schema.model_json_schema(), indent=2, ensure_ascii=False)
+        # 今回の抽出対象スキーマをJSON形式の文字列としてプロンプトに含める (レジストリでキャッシュ済みのコンパクト形式)
+        schema_json = schema_registry.schema_json(group_schema)
 
         return f"""あなたは医療情報抽出の専門家です。以下の「カルテテキスト」から患者の最新の状態を抽出し、後述する「JSONスキーマ」に従って構造化データを作成してください。
 
-# 指示事項
-- テキスト内には、異なる日付の情報が混在している可能性があります。**必ず最も新しい日付の情報や、文脈上最新と思われる情報（例：「現在」「本日」）を優先して抽出してください。**
-- 古い情報（例：「初回評価時」「〇月〇日時点では」）は、新しい情報で上書きしてください。
-- 例えば、「7/1に疼痛NRS 5/10だったが、7/10にはNRS 3/10に軽減」という記述があれば、疼痛は「NRS 3/10」としてください。
-- **最重要**: 今回のタスクでは、以下の「JSONスキーマ」で定義されている項目のみを抽出対象とします。
-- **ADLスコアの時系列解釈**: テキスト内に複数の日付のADLスコア（FIMやBI）がある場合、**最も新しいスコアを `_current_val`** に、**その直前のスコア（2番目に新しいスコア）を `_start_val`** に設定してください。スコアが1つしか記録されていない場合は、`_current_val` と `_start_val` の両方に同じ値を設定してください。
-- **ADLの記述をFIMスコアに変換してください。** 具体的には、「自立」は7点、「監視・準備」は6点、「最小介助」は5点、「中等度介助」は3点、「全介助」は1点として解釈し、対応する`_fim_current_val`項目に数値を設定してください。
-- **基本動作・活動目標のレベル解釈**: テキスト内の記述（例：「寝返りは自立」）を解釈し、対応するラジオボタン用のフィールド（例：`func_basic_rolling_level`）に適切な選択肢の文字列（例：`'independent'`）を設定してください。同時に、関連するチェックボックス（例：`func_basic_rolling_chk` と `func_basic_rolling_independent_chk`）も `true` に設定してください。「一部介助」や「軽介助」は `'partial_assist'` と解釈してください。
-- テキストから情報が読み取れない項目は、無理に推測せず、`null`値としてください。
-- **`True`の値の保持**: 「これまでに抽出された情報」で既に `True` になっているチェックボックス項目は、カルテテキストから反証（例：「意識障害なし」という明確な記述）が見つからない限り、`True` のまま保持してください。`null` で上書きしないでください。
-- **障害者手帳の情報を解釈してください。** 例えば、「右上肢機能障害3級」という記述があれば、`social_disability_certificate_physical_chk`を`true`に、`social_disability_certificate_physical_type_txt`に「上肢」と設定し、`social_disability_certificate_physical_rank_val`に`3`を設定してください。`social_disability_certificate_physical_type_txt`に設定する値は、['視覚', '聴覚', '平衡機能', '言語機能', '音声機能', '咀嚼機能', '上肢', '下肢', '体幹', '心臓機能', '腎臓機能', '呼吸器機能', 'ぼうこう又は直腸機能', '小腸機能', 'ヒト免疫不全ウイルスによる免疫機能', '肝臓機能']の中から最も適切なものを選択してください。
-- **嚥下調整食の必要性**: 「嚥下調整食の必要性あり」という記述があれば `nutrition_swallowing_diet_slct` を `'True'` に、「必要性なし」なら `'None'` に設定してください。 `学会分類コード` の情報があれば `nutrition_swallowing_diet_code_txt` に設定してください。
-- **栄養状態の評価**: テキスト内の「栄養状態は低栄養リスク」などの記述を解釈し、`nutrition_status_assessment_slct` フィールドに `['no_problem', 'malnutrition', 'malnutrition_risk', 'overnutrition', 'other']` の中から最も適切な値を設定してください。
-- **栄養補給方法の親子関係**: 「経口摂取」や「食事」という記述があれば、`nutrition_method_oral_chk`と`nutrition_method_oral_meal_chk`の両方を`true`にしてください。「経管栄養」や「経鼻栄養」という記述があれば`nutrition_method_tube_chk`を`true`にしてください。
-- **不整脈の有無**: `func_circulatory_arrhythmia_status_slct` には、不整脈の有無を `'yes'` または `'no'` で設定してください。
+{EXTRACTION_INSTRUCTIONS}
 
 ## これまでに抽出された情報（今回の抽出の参考にしてください）
 ```json
@@ -282,10 +266,44 @@ class PatientInfoParser:
 ---
 """
 
+    def _build_prompt_parts(self, text: str, group_schema: type[BaseModel], extracted_data_so_far: dict) -> tuple:
+        """
+        通常モード用: 共通プレフィックス型のプロンプトを (prefix, suffix) に分けて構築する。
+        prefix (指示事項 + カルテ全文) は同じカルテに対する全グループの呼び出しで完全に同一になるため、
+        OllamaのKVキャッシュやGeminiのコンテキストキャッシュで再利用できる。
+        suffix にはグループごとに変わるスキーマとこれまでの抽出結果を置く。
+        """
+        prefix = f"""あなたは医療情報抽出の専門家です。以下の「カルテテキスト」から患者の最新の状態を抽出し、後述する「JSONスキーマ」に従って構造化データを作成してください。
+
+{EXTRACTION_INSTRUCTIONS}
+
+## カルテテキスト (全文)
+---
+{text}
+---
+"""
+        summary = (
+            json.dumps(extracted_data_so_far, indent=2, ensure_ascii=False) if extracted_data_so_far else "まだありません。"
+        )
+        suffix = f"""
+## jsonスキーマ
+```json
+{schema_registry.schema_json(group_schema)}
+```
+
+## これまでに抽出された情報（今回の抽出の参考にしてください）
+```json
+{summary}
+```
+
+最重要: 上記の「カルテテキスト」から、スキーマで定義されたキー名（例: "func_pain_txt"）を絶対に変更せず、そのまま使用してJSONを生成してください。
+"""
+        return prefix, suffix
+
     def _build_generation_prompt(self, text: str, facts: dict, schema: type) -> str:
         """ハイブリッドモード用: 文章生成専用プロンプト"""
         facts_json = json.dumps(facts, indent=2, ensure_ascii=False)
-        schema_json = json.dumps(schema.model_json_schema(), indent=2, ensure_ascii=False)
+        schema_json = schema_registry.schema_json(schema)
 
         return f"""
     あなたはリハビリテーション専門医です。
@@ -361,6 +379,42 @@ JSONではなく、プレーンテキストで出力してください。
             return text
 
 
+    def _iter_groups_concurrently(self, text: str, deadline: float):
+        """
+        通常モード用: PATIENT_INFO_EXTRACTION_GROUPS を依存グラフに従って並列に抽出し、
+        完了したグループから順にイベントを返すジェネレータ。
+        各グループのプロンプトには、依存先グループの抽出結果のみを「これまでに抽出された情報」として渡す。
+        """
+        scheduler = ExtractionScheduler(
+            PATIENT_INFO_EXTRACTION_GROUPS,
+            PATIENT_INFO_EXTRACTION_DEPENDENCIES,
+            max_concurrency=self.max_concurrency,
+            group_timeout=GROUP_TIMEOUT_SEC,
+            priorities=PATIENT_INFO_EXTRACTION_PRIORITIES,
+            min_slice=MIN_GROUP_SLICE_SEC,
+        )
+        print(
+            f"--- Scheduling {len(scheduler.groups)} groups "
+            f"(concurrency={scheduler.max_concurrency}, critical path={scheduler.critical_path_length()}) ---"
+        )
+
+        def run_group(schema: type[BaseModel], context: dict) -> dict:
+            if self.prompt_layout == "shared_prefix":
+                prefix, suffix = self._build_prompt_parts(text, schema, context)
+                return self._generate_group_json(
+                    schema, lambda: self.llm_client.generate_json_with_prefix(prefix=prefix, suffix=suffix, schema=schema)
+                )
+            prompt = self._build_prompt(text, schema, context)
+            return self._generate_group_json(schema, lambda: self.llm_client.generate_json(prompt=prompt, schema=schema))
+
+        for event in scheduler.run(run_group, deadline=deadline):
+            schema = event["group"]
+            if event["status"] == "success":
+                logger.info(f"Finished: {schema.__name__} ({event['elapsed']:.1f}s)")
+            else:
+                logger.error(f"{event['status']} in {schema.__name__}: {event['error']}")
+            yield self._group_event(schema, event["status"], event["data"], event["error"], event["elapsed"])
+
     # def parse_text(self, text: str) -> dict:
     #     """
     #     与えられたテキストを解析し、複数のスキーマグループに基づいて段階的に情報を抽出し、結果をマージして返す。
@@ -501,114 +555,215 @@ JSONではなく、プレーンテキストで出力してください。
     #     return final_result
 
 
-    def parse_text(self, text: str) -> dict:
+    def _generate_group_json(self, schema: type[BaseModel], generate) -> dict:
         """
-        ハイブリッドモード: 標準化 -> Regex -> LLM(統合スキーマで2回実行)
-        通常モード: 順次抽出
+        抽出グループ1つ分のJSON生成。出力の検証に失敗した (ValueError) 場合は、締め切りまでに
+        EXTRACTION_MAX_ATTEMPTS 回まで再試行し、試行回数をグループごとに llm_retry_stats へ記録する。
         """
-        final_result = {}
-        total_start_time = time.time()
-        
-        def get_remaining_time():
-            elapsed = time.time() - total_start_time
-            return max(0.1, GENERATION_TIMEOUT_SEC - elapsed)
-
-        # --- Step 1 & 2: Standardization & Fast Extraction ---
-        if self.use_hybrid_mode and self.fast_extractor:
-            print("--- [Step 1] Standardizing Text (LLM) ---")
-            standardized_text = self._standardize_text(text)
-            print(f">>> Standardized Text Preview:\n{standardized_text[:100]}...")
-            
-            # 原文と標準化テキストを結合
-            combined_text = text + "\n\n" + ("="*20) + "\n[AI補完情報]\n" + standardized_text
-            
-            print("--- [Step 2] FastExtractor (Regex+NegEx) ---")
+        name = f"extraction.{schema.__name__}"
+        token = current_cancel_token()
+        for attempt in range(1, EXTRACTION_MAX_ATTEMPTS + 1):
             try:
-                facts = self.fast_extractor.extract_facts(combined_text)
-                final_result.update(facts)
-                pprint.pprint(facts)
+                result = generate()
+            except ValueError as e:
+                if attempt < EXTRACTION_MAX_ATTEMPTS and not (token is not None and token.cancelled):
+                    logger.warning(f"{schema.__name__}: invalid output, retrying ({attempt}/{EXTRACTION_MAX_ATTEMPTS}): {e}")
+                    continue
+                llm_retry_stats.record(name, attempt, False)
+                raise
+            except Exception:
+                llm_retry_stats.record(name, attempt, False)
+                raise
+            llm_retry_stats.record(name, attempt, True)
+            return result
+
+    @staticmethod
+    def _group_event(schema: type, status: str, data: dict = None, error: str = None, elapsed: float = 0.0) -> dict:
+        """抽出グループ1つ分の完了イベント"""
+        return {
+            "event": "group",
+            "group": schema.__name__,
+            "status": status,
+            "data": data or {},
+            "error": error,
+            "elapsed": round(elapsed, 3),
+        }
+
+    def _extract_hybrid_facts(self, text: str) -> dict:
+        """ハイブリッドモード用: 標準化 (LLM) -> FastExtractor (Regex+NegEx) で事実情報を抽出する"""
+        print("--- [Step 1] Standardizing Text (LLM) ---")
+        standardized_text = self._standardize_text(text)
+        print(f">>> Standardized Text Preview:\n{standardized_text[:100]}...")
+
+        # 原文と標準化テキストを結合
+        combined_text = text + "\n\n" + ("="*20) + "\n[AI補完情報]\n" + standardized_text
+
+        print("--- [Step 2] FastExtractor (Regex+NegEx) ---")
+        try:
+            facts = self.fast_extractor.extract_facts(combined_text)
+            pprint.pprint(facts)
+            return facts
+        except Exception as e:
+            logger.error(f"FastExtractor Error: {e}")
+            return {}
+
+    def _run_hybrid_group(self, text: str, context: dict, schema: type[BaseModel]) -> dict:
+        """ハイブリッドモード用: 統合スキーマ1つ分のLLM抽出を実行する"""
+        # フィルタリング有効化 (True: _chk除外, _val/_level/_txtなどは残す)
+        opt_schema = schema_registry.prompt_schema(schema, filter_mode=True)
+        if not opt_schema["properties"]:
+            return {}
+
+        prompt = self._build_hybrid_prompt(
+            text, # 数値抽出のために原文を渡す
+            context,
+            schema_registry.prompt_schema_json(schema, filter_mode=True)
+        )
+        return self._generate_group_json(schema, lambda: self.llm_client.generate_json(prompt=prompt, schema=schema)) or {}
+
+    def _iter_hybrid_pipelined(self, text: str, deadline: float):
+        """
+        ハイブリッドモードのパイプライン実行。完了したステップから順にイベントを返すジェネレータ。
+        HybridCombined_Extraction のプロンプトは原文のみから作れるため、標準化 + FastExtractor と並行して開始する。
+        HybridCombined_Plan は「事実情報」と「Extractionの結果」の両方が揃ってから実行する。
+
+            [標準化 -> FastExtractor] ──┐
+                                         ├─> HybridCombined_Plan
+            [HybridCombined_Extraction] ─┘
+        """
+        extraction_schema, plan_schema = HYBRID_COMBINED_GROUPS
+
+        def submit_group(schema, context):
+            # グループのタイムアウトと全体の締め切りの早い方で打ち切る
+            submitted_at = time.time()
+            token = CancelToken(deadline=min(submitted_at + GROUP_TIMEOUT_SEC, deadline))
+            future = executor.submit(run_with_token, token, self._run_hybrid_group, text, context, schema)
+            return future, token, submitted_at
+
+        def wait_group(future, token, schema, submitted_at):
+            try:
+                data = future.result(timeout=max(0.1, token.remaining()))
+                logger.info(f"Finished: {schema.__name__}")
+                return self._group_event(schema, "success", data, elapsed=time.time() - submitted_at)
+            except (concurrent.futures.TimeoutError, CallCancelledError):
+                # 実行中の呼び出しはトークン経由でリトライ・後続の呼び出しを止めて見捨てる
+                token.cancel()
+                logger.error(f"Timed out: {schema.__name__}")
+                return self._group_event(schema, "timeout", error="group timeout", elapsed=time.time() - submitted_at)
             except Exception as e:
-                logger.error(f"FastExtractor Error: {e}")
+                logger.error(f"Error in {schema.__name__}: {e}")
+                return self._group_event(schema, "error", error=str(e), elapsed=time.time() - submitted_at)
 
-        # --- Step 3: LLM Detailed Extraction (Batched) ---
-        print(f"--- [Step 3] Detailed Extraction (LLM: {self.client_type}) ---")
+        context = {}
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="hybrid")
+        try:
+            print(f"--- [Step 3] {extraction_schema.__name__} (LLM: {self.client_type}) started in parallel ---")
+            extraction_future, extraction_token, submitted_at = submit_group(extraction_schema, {})
+
+            # LLM抽出を待つ間に、このスレッドで標準化と事実抽出を進める
+            if self.fast_extractor:
+                facts_start = time.time()
+                facts = self._extract_hybrid_facts(text)
+                context.update(facts)
+                yield {"event": "facts", "data": facts, "elapsed": round(time.time() - facts_start, 3)}
+
+            event = wait_group(extraction_future, extraction_token, extraction_schema, submitted_at)
+            # 事実情報よりもLLMの抽出結果 (数値・レベル) を優先する
+            context.update(event["data"])
+            yield event
+
+            if deadline - time.time() <= 1.0:
+                print("--- Time Limit Exceeded. Stopping. ---")
+                yield self._group_event(plan_schema, "skipped", error="deadline exceeded")
+                return
+
+            print(f"--- [Step 4] {plan_schema.__name__} (LLM: {self.client_type}) ---")
+            plan_future, plan_token, submitted_at = submit_group(plan_schema, dict(context))
+            yield wait_group(plan_future, plan_token, plan_schema, submitted_at)
+        finally:
+            # タイムアウトしたスレッドの完了は待たない
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def parse_text_stream(self, text: str):
+        """
+        parse_text のストリーミング版。抽出の進捗をイベント (dict) として順次返すジェネレータ。
+
+        Yields:
+            {"event": "facts", "data": FastExtractorの抽出結果, "elapsed": 秒}  (ハイブリッドモードのみ)
+            {"event": "group", "group": グループ名, "status": ..., "data": 抽出結果, "error": ..., "elapsed": 秒}
+            {"event": "final", "data": チェックボックス復元後の統合結果, "timings": {名前: 秒},
+             "missing_groups": 時間切れ・失敗で結果が欠けているグループ名のリスト, "elapsed": 秒}
+        """
+        final_result = {}
+        timings = {}
+        missing_groups = []
+        start_time = time.time()
+        deadline = start_time + GENERATION_TIMEOUT_SEC
 
-        # バッチ定義: 統合スキーマを使用することで呼び出し回数を削減 (実質2回)
-        extraction_batches = []
         if self.use_hybrid_mode:
-            # HYBRID_COMBINED_GROUPS = [HybridCombined_Extraction, HybridCombined_Plan]
-            # 各要素を1つのリストに入れることで、依存関係(Extraction -> Plan)を順次処理として表現
-            extraction_batches = [[group] for group in HYBRID_COMBINED_GROUPS]
+            events = self._iter_hybrid_pipelined(text, deadline)
         else:
-            # 通常モードは順次実行
-            extraction_batches = [[g] for g in PATIENT_INFO_EXTRACTION_GROUPS]
-
-        # バッチ実行ループ
-        for batch_index, batch in enumerate(extraction_batches):
-            print(f"--- Processing Batch {batch_index + 1}/{len(extraction_batches)} ---")
-            
-            # 全体タイムアウトチェック
-            if get_remaining_time() <= 1.0:
-                print("--- Time Limit Exceeded. Stopping. ---")
-                break
-
-            batch_results = {}
-
-            # ThreadPoolExecutorによる並列実行
-            # (現在は1バッチ1アイテムだが、将来的に分割した場合に対応可能な構造)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=len(batch)) as executor:
-                future_to_schema = {}
-                for schema in batch:
-                    # プロンプト作成
-                    if self.use_hybrid_mode:
-                        # フィルタリング有効化 (True: _chk除外, _val/_level/_txtなどは残す)
-                        opt_schema = optimize_schema_for_prompt(schema, filter_mode=True)
-                        if not opt_schema["properties"]: continue
-                        
-                        prompt = self._build_hybrid_prompt(
-                            text, # 数値抽出のために原文を渡す
-                            final_result, # 直前のバッチまでの結果をコンテキストとして渡す
-                            json.dumps(opt_schema, indent=2, ensure_ascii=False)
-                        )
-                    else:
-                        prompt = self._build_prompt(text, schema, final_result)
-
-                    future = executor.submit(
-                        self.llm_client.generate_json,
-                        prompt=prompt,
-                        schema=schema
-                    )
-                    future_to_schema[future] = schema
-
-                # 結果収集
-                for future in concurrent.futures.as_completed(future_to_schema):
-                    schema = future_to_schema[future]
-                    try:
-                        # 統合スキーマは生成量が多いのでタイムアウトを長めに設定(180秒)
-                        data = future.result(timeout=180)
-                        if data:
-                            batch_results.update(data)
-                            logger.info(f"Finished: {schema.__name__}")
-                    except Exception as e:
-                        logger.error(f"Error in {schema.__name__}: {e}")
-
-            # バッチ完了後に結果を統合
-            final_result.update(batch_results)
+            print(f"--- Detailed Extraction (LLM: {self.client_type}) ---")
+            # 通常モード: 依存関係のないグループ同士を並列に抽出する
+            events = self._iter_groups_concurrently(text, deadline)
+
+        # 通常モードはグループの定義順でマージして、完了順に関係なく結果を安定させる
+        group_results = {}
+        for event in events:
+            if event["event"] == "facts":
+                timings["FastExtractor"] = event["elapsed"]
+                final_result.update(event["data"])
+            else:
+                timings[event["group"]] = event["elapsed"]
+                if event["status"] != "success":
+                    missing_groups.append(event["group"])
+                if self.use_hybrid_mode:
+                    final_result.update(event["data"])
+                else:
+                    group_results[event["group"]] = event["data"]
+            yield event
+
+        if not self.use_hybrid_mode:
+            for schema in PATIENT_INFO_EXTRACTION_GROUPS:
+                final_result.update(group_results.get(schema.__name__) or {})
 
         # 後処理
         if self.use_hybrid_mode:
             final_result = self._restore_checkboxes(final_result)
 
         if not final_result:
-            return {"error": "抽出に失敗しました。"}
-
+            final_result = {"error": "抽出に失敗しました。"}
+        else:
+            print("\n" + "="*30 + " FINAL EXTRACTION RESULT " + "="*30)
+            try:
+                # pprintで整形して表示（日本語も崩れにくい設定）
+                pprint.pprint(final_result, width=120, sort_dicts=True)
+            except Exception as e:
+                print(f"Result printing failed: {e}")
+            print("="*85 + "\n")
+
+        yield {
+            "event": "final",
+            "data": final_result,
+            "timings": timings,
+            "missing_groups": missing_groups,
+            "elapsed": round(time.time() - start_time, 3),
+        }
 
-        print("\n" + "="*30 + " FINAL EXTRACTION RESULT " + "="*30)
-        try:
-            # pprintで整形して表示（日本語も崩れにくい設定）
-            pprint.pprint(final_result, width=120, sort_dicts=True)
-        except Exception as e:
-            print(f"Result printing failed: {e}")
-        print("="*85 + "\n")
+    def parse_text(self, text: str) -> dict:
+        """
+        ハイブリッドモード: [標準化 -> Regex] と LLM(Extraction) を並行実行 -> LLM(Plan)
+        通常モード: 依存グラフに従ってグループを並列抽出
+        """
+        return self.parse_text_with_missing_groups(text)[0]
 
-        return final_result
\ No newline at end of file
+    def parse_text_with_missing_groups(self, text: str) -> tuple[dict, list]:
+        """
+        parse_text の抽出結果と、時間切れ・失敗で結果が欠けているグループ名のリストを返す。
+        抽出結果はそのままフォームに反映されるため、項目以外のキーは含めない。
+        """
+        for event in self.parse_text_stream(text):
+            if event["event"] == "final":
+                missing_groups = [] if "error" in event["data"] else event["missing_groups"]
+                return event["data"], missing_groups
+        return {}, []
@@ -0,0 +1,106 @@
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Set, Type
+
+from pydantic import BaseModel
+
+from app.schemas.schemas import GENERATION_GROUP_DEPENDENCIES
+from app.services.llm.context_builder import PLAN_FIELD_FACT_DEPENDENCIES
+
+
+def changed_fact_categories(previous_facts: Dict[str, Any], facts: Dict[str, Any]) -> Set[str]:
+    """prepare_patient_facts の出力を前回と比べ、内容が変わったカテゴリ (トップレベルのキー) を返す"""
+    return {key for key in set(previous_facts) | set(facts) if previous_facts.get(key) != facts.get(key)}
+
+
+def fields_to_regenerate(
+    group_schema: Type[BaseModel],
+    snapshot: Optional[Dict[str, Any]],
+    changed_categories: Set[str],
+    generated_plan_so_far: Dict[str, Any],
+) -> List[str]:
+    """
+    差分生成で、group_schema のうち生成し直す項目を返す (残りは前回の生成結果を再利用できる)。
+
+    - 前回の生成結果がない、または前回の結果に含まれない項目は生成する。
+    - グループが参照する前段の項目 (GENERATION_GROUP_DEPENDENCIES) が前回と変わっていれば、全項目を生成し直す。
+    - それ以外は、項目が参照する患者データのカテゴリ (PLAN_FIELD_FACT_DEPENDENCIES) が変わった項目だけを生成し直す。
+    """
+    fields = list(group_schema.model_fields)
+    if snapshot is None:
+        return fields
+    previous_plan = snapshot["plan"]
+
+    upstream_fields = GENERATION_GROUP_DEPENDENCIES.get(group_schema)
+    if upstream_fields is None:
+        upstream_fields = [key for key in generated_plan_so_far if key not in group_schema.model_fields]
+    if any(generated_plan_so_far.get(key) != previous_plan.get(key) for key in upstream_fields):
+        return fields
+
+    stale = []
+    for field in fields:
+        dependencies = PLAN_FIELD_FACT_DEPENDENCIES.get(field)
+        if field not in previous_plan:
+            stale.append(field)
+        elif dependencies is None and changed_categories:
+            stale.append(field)
+        elif dependencies is not None and changed_categories.intersection(dependencies):
+            stale.append(field)
+    return stale
+
+
+class PlanSnapshotStore:
+    """
+    患者ごとに、直近の計画書生成で使った患者データ (prepare_patient_facts の出力) と生成結果を保持するストア。
+    差分生成 (generate_plan_stream の incremental=True) では、この前回の内容と比べて変わった項目だけを生成し直します。
+    プロセス内のメモリに直近 max_patients 人分のみを保持します (再起動後の最初の生成は全項目を生成)。
+    """
+
+    def __init__(self, max_patients: int = 256):
+        self.max_patients = max_patients
+        self._lock = threading.Lock()
+        self._snapshots: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._reused_fields = 0
+        self._regenerated_fields = 0
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None:
+                return None
+            self._snapshots.move_to_end(key)
+            return copy.deepcopy(snapshot)
+
+    def save(self, key: Hashable, facts: Dict[str, Any], plan: Dict[str, Any]) -> None:
+        with self._lock:
+            self._snapshots[key] = {"facts": copy.deepcopy(facts), "plan": dict(plan)}
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > self.max_patients:
+                self._snapshots.popitem(last=False)
+
+    def record(self, reused: int, regenerated: int) -> None:
+        """差分生成で再利用・再生成した項目数を記録する"""
+        with self._lock:
+            self._reused_fields += reused
+            self._regenerated_fields += regenerated
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self._reused_fields + self._regenerated_fields
+            return {
+                "patients": len(self._snapshots),
+                "reused_fields": self._reused_fields,
+                "regenerated_fields": self._regenerated_fields,
+                "reuse_ratio": round(self._reused_fields / total, 3) if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+            self._reused_fields = 0
+            self._regenerated_fields = 0
+
+
+# アプリケーション全体で共有するストア
+plan_snapshot_store = PlanSnapshotStore()
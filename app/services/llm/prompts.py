@@ -1,9 +1,18 @@
 import json
+import logging
 import textwrap
-from typing import Any, Dict, Optional, Type
+from typing import Any, Dict, List, Optional, Type
 
 from pydantic import BaseModel
 
+from app.schemas.schemas import GENERATION_GROUP_DEPENDENCIES
+from app.services.llm.metrics import llm_metrics
+from app.services.llm.rehab_rag_path import REHAB_RAG_PATH  # noqa: F401  (rag_components より前に読み込む)
+from app.services.llm.schema_registry import schema_registry
+from rag_components.rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
 FIM_GUIDELINES = """
     【FIM（機能的自立度評価法）の点数目安】
     ・7点：完全自立（安全にかつ合理的な時間内で遂行）
@@ -15,20 +24,47 @@ FIM_GUIDELINES = """
     ・1点：全介助（25%未満しか行えない）
 """
 
+def select_plan_context(
+    group_schema: Type[BaseModel],
+    generated_plan_so_far: Dict[str, Any],
+    context_group: Optional[Type[BaseModel]] = None
+) -> Dict[str, Any]:
+    """
+    これまでの生成結果から、グループの生成に必要な項目 (GENERATION_GROUP_DEPENDENCIES) だけを取り出す。
+    グループ自身の項目 (リトライで保持した生成済みの項目) は常に含める。
+    依存関係が宣言されていないグループには、すべての項目を返す。
+
+    Args:
+        group_schema: 生成対象のPydanticスキーマクラス
+        generated_plan_so_far: これまでに生成された計画書の辞書
+        context_group: 依存関係を参照するグループ (部分スキーマで再生成する場合に元のグループを指定)
+    """
+    group = context_group or group_schema
+    dependencies = GENERATION_GROUP_DEPENDENCIES.get(group)
+    if dependencies is None:
+        return dict(generated_plan_so_far)
+    wanted = set(dependencies) | set(group.model_fields)
+    return {key: value for key, value in generated_plan_so_far.items() if key in wanted}
+
+
 def build_group_prompt(
     group_schema: Type[BaseModel],
     patient_facts_str: str,
     generated_plan_so_far: Dict[str, Any],
-    is_ollama: bool = False
+    is_ollama: bool = False,
+    context_group: Optional[Type[BaseModel]] = None
 ) -> str:
     """
     グループ生成用のプロンプトを構築する
+    これまでの生成結果は、グループが依存する項目だけを改行・インデントなしのJSONで埋め込む。
+    プロンプトの推定トークン数は llm_metrics の "prompt_tokens.<グループ名>" に記録する。
 
     Args:
         group_schema: 生成対象のPydanticスキーマクラス
         patient_facts_str: 整形済みの患者事実情報（JSON文字列）
         generated_plan_so_far: これまでに生成された計画書の辞書
         is_ollama: Ollama向けにプロンプトを調整するかどうかのフラグ
+        context_group: 依存関係を参照するグループ (部分スキーマで再生成する場合に元のグループを指定)
     """
 
     instruction_suffix = ""
@@ -36,7 +72,10 @@ def build_group_prompt(
         # Ollamaの場合、最後に生成を促すサフィックスを追加することが有効
         instruction_suffix = f"\n        --- \n        生成するJSON ({group_schema.__name__} の項目のみ):"
 
-    return textwrap.dedent(f"""
+    plan_context = select_plan_context(group_schema, generated_plan_so_far, context_group)
+    plan_context_str = json.dumps(plan_context, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    prompt = textwrap.dedent(f"""
         # 役割
         あなたは、患者様とそのご家族にリハビリテーション計画を説明する、経験豊富で説明上手なリハビリテーション科の専門医です。
         専門用語を避け、誰にでも理解できる平易な言葉で、誠実かつ丁寧に説明する文章を使用して、患者の個別性を最大限に尊重し、一貫性のあるリハビリテーション総合実施計画書を作成してください。
@@ -51,7 +90,7 @@ def build_group_prompt(
         これは、あなたがこれまでに生成した計画書の一部です。
         この内容を十分に参照し、矛盾のない、より質の高い記述を生成してください。
         ```json
-        {json.dumps(generated_plan_so_far, indent=2, ensure_ascii=False, default=str)}
+        {plan_context_str}
         ```
 
         # 重要な参照基準
@@ -78,11 +117,21 @@ def build_group_prompt(
         - 各項目は、他の項目との関連性や一貫性を保つように記述してください。
 
         ```json
-        {json.dumps(group_schema.model_json_schema(), indent=2, ensure_ascii=False)}
+        {schema_registry.schema_json(group_schema)}
         ```
         {instruction_suffix}
     """)
 
+    # グループごとのプロンプトの長さを記録し、依存項目の絞り込みによる削減量を確認できるようにする
+    group_name = (context_group or group_schema).__name__
+    prompt_tokens = estimate_tokens(prompt)
+    llm_metrics.record(f"prompt_tokens.{group_name}", prompt_tokens)
+    logger.info(
+        f"Prompt for {group_name}: ~{prompt_tokens} tokens "
+        f"(plan context: {len(plan_context)}/{len(generated_plan_so_far)} fields, ~{estimate_tokens(plan_context_str)} tokens)"
+    )
+    return prompt
+
 
 def build_regeneration_prompt(
     patient_facts_str: str,
@@ -109,7 +158,7 @@ def build_regeneration_prompt(
     schema_block = ""
     if schema:
         try:
-            schema_json = json.dumps(schema.model_json_schema(), indent=2, ensure_ascii=False)
+            schema_json = schema_registry.schema_json(schema)
             schema_block = f"\n        JSONスキーマ:\n        ```json\n        {schema_json}\n        ```\n        ---\n        生成するJSON:"
         except Exception:
             pass
@@ -164,3 +213,87 @@ def build_regeneration_prompt(
         - 完成した文章のみを出力し、他の前置きや解説は一切不要です。
         {schema_block}
     """)
+
+
+def build_batch_regeneration_prompt(
+    patient_facts_str: str,
+    generated_plan_so_far: Dict[str, Any],
+    items: List[Dict[str, str]],
+    rag_context: Optional[str] = None,
+    schema: Optional[Type[BaseModel]] = None
+) -> str:
+    """
+    複数項目の一括再生成用のプロンプトを構築する
+
+    Args:
+        patient_facts_str: 整形済みの患者事実情報（JSON文字列）
+        generated_plan_so_far: これまでに生成された計画書の辞書（修正対象の項目を除く）
+        items: 再生成する項目のリスト。各要素は item_key, current_text, instruction を持つ辞書
+        rag_context: RAGによって検索された専門知識（任意）
+        schema: 一括再生成用のPydanticスキーマ（任意・OllamaのJSONモード強制用）
+    """
+
+    schema_block = ""
+    if schema:
+        try:
+            schema_json = schema_registry.schema_json(schema)
+            schema_block = f"\n        JSONスキーマ:\n        ```json\n        {schema_json}\n        ```\n        ---\n        生成するJSON:"
+        except Exception:
+            pass
+
+    rag_section = ""
+    if rag_context:
+        rag_section = f"""
+        # 参考情報 (専門知識)
+        これは、あなたの知識を補うための専門的な参考情報です。この情報を最優先で活用し、より根拠のある文章に修正してください。
+        ```text
+        {rag_context}
+        ```
+        """
+
+    item_sections = "\n".join(
+        f"""
+        ## {i}. `{item["item_key"]}`
+        現在の文章:
+        ```text
+        {item.get("current_text", "")}
+        ```
+        修正指示: `{item["instruction"]}`
+        """
+        for i, item in enumerate(items, start=1)
+    )
+
+    return textwrap.dedent(f"""
+        # 役割
+        あなたは、経験豊富なリハビリテーション科の専門医です。
+        これから提示する複数の項目の「現在の文章」を、それぞれの「修正指示」に従って、より質の高い内容に書き換えてください。
+        ただし、文章全体の構成や他の項目との一貫性も考慮し、不自然にならないように修正してください。
+        同時に修正する項目どうしも、互いに矛盾しないようにしてください。
+        専門用語を避け、誰にでも理解できる平易な言葉遣いを心がけてください。
+
+        # 患者データ (事実情報)
+        これは、文章を修正する上で参考となる患者の客観的な評価結果や基本情報です。
+        ```json
+        {patient_facts_str}
+        ```
+
+        # これまでの生成結果
+        これは、あなたがこれまでに生成した計画書の一部です。修正する項目以外の内容です。
+        この内容を十分に参照し、矛盾のない、より質の高い記述を生成してください。
+        ```json
+        {json.dumps(generated_plan_so_far, indent=2, ensure_ascii=False, default=str)}
+        ```
+        {rag_section}
+
+        # 修正対象の項目
+        {item_sections}
+
+        # 作成指示
+        上記のすべての情報を踏まえ、各項目の「現在の文章」を、その項目の「修正指示」に従って書き直してください。
+        - 修正対象の項目のキーをそのままJSONのキーとし、上に示した順に出力してください。
+        - **重要**: 最終的な出力は、印刷して使用されることを想定したプレーンテキスト形式にしてください。
+        - 箇条書きが必要な場合は、Markdownの `*` や `-` ではなく、全角の「・」や「■」を使用し、**各項目の後で必ず改行を入れてください**。
+        - 例: 「・項目1\n・項目2\n・項目3」のように、`\n` を使って改行してください。
+        - 完成した文章のみを出力し、他の前置きや解説は一切不要です。
+        {schema_block}
+    """)
@@ -2,21 +2,16 @@ import importlib
 import json
 import logging
 import os
-import sys
 
 import yaml
 
 # gemini_client.pyで定義されている、アプリケーション本体のデータ構造スキーマをインポート
 # from gemini_client import RehabPlanSchema # 循環参照が発生してしまいます。
 from app.schemas.schemas import RehabPlanSchema
+from app.services.llm.singleflight import llm_singleflight, snapshot_hash
 
 # Rehab_RAGライブラリへのパスを追加
-REHAB_RAG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../Rehab_RAG"))
-if os.path.exists(REHAB_RAG_PATH) and REHAB_RAG_PATH not in sys.path:
-    sys.path.append(REHAB_RAG_PATH)
-    print(f"INFO: Rehab_RAG path added: {REHAB_RAG_PATH}")
-elif not os.path.exists(REHAB_RAG_PATH):
-    print(f"WARNING: Rehab_RAG path not found at: {REHAB_RAG_PATH}")
+from app.services.llm.rehab_rag_path import REHAB_RAG_PATH  # noqa: F401
 
 log_directory = "logs"
 if not os.path.exists(log_directory):
@@ -68,6 +63,7 @@ class RAGExecutor:
             self.pipeline_config = yaml.safe_load(f)
 
         # 実行中のパイプラインのディレクトリを基準パスとして保持
+        self.pipeline_name = pipeline_name
         self.experiment_dir = os.path.dirname(pipeline_config_path)
 
         # 3. RAGパイプラインのコンポーネントを初期化
@@ -209,6 +205,14 @@ class RAGExecutor:
 
 
     def execute(self, patient_facts: dict):
+        """
+        患者情報を元にパイプラインを実行する。
+        同じパイプライン・同じ患者情報での実行が進行中であれば、新たに実行せずその結果を共有する (二度押し・複数タブ対策)。
+        """
+        key = ("rag.execute", self.pipeline_name, snapshot_hash(patient_facts))
+        return llm_singleflight.do(key, lambda: self._execute(patient_facts))
+
+    def _execute(self, patient_facts: dict):
         print(f"DEBUG [rag_executor.py]: '担当者からの所見' received = {patient_facts.get('担当者からの所見')}")
         if not self.llm or not self.retriever:
             error_msg = "必須コンポーネントが初期化されていません。"
@@ -0,0 +1,13 @@
+"""
+Rehab_RAG ライブラリ (rag_components) を import できるよう、sys.path にパスを追加する。
+rag_components を import するモジュールは、その前にこのモジュールを import すること。
+"""
+import os
+import sys
+
+REHAB_RAG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../Rehab_RAG"))
+if os.path.exists(REHAB_RAG_PATH) and REHAB_RAG_PATH not in sys.path:
+    sys.path.append(REHAB_RAG_PATH)
+    print(f"INFO: Rehab_RAG path added: {REHAB_RAG_PATH}")
+elif not os.path.exists(REHAB_RAG_PATH):
+    print(f"WARNING: Rehab_RAG path not found at: {REHAB_RAG_PATH}")
@@ -0,0 +1,261 @@
+import copy
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterable, Tuple, Type
+
+from pydantic import BaseModel, Field, TypeAdapter, create_model
+
+from app.services.field_registry import get_field_registry
+
+logger = logging.getLogger(__name__)
+
+
+def optimize_schema_for_prompt(schema_cls: type, target_fields_pattern: str = None, filter_mode: bool = False) -> dict:
+    """
+    LLMプロンプト用にJSONスキーマを最適化する。
+    1. Optional (anyOf: [type, null]) を削除し、シンプルな型定義にする。
+    2. 生成させたいフィールドを全て 'required' に追加する。
+    3. (オプション) target_fields_pattern に一致しないフィールドを除外する（ノイズ削減）。
+    """
+    raw_schema = schema_cls.model_json_schema()
+    properties = raw_schema.get("properties", {})
+    new_properties = {}
+    required_fields = []
+
+    for key, prop in properties.items():
+        # A. フィルタリング (Hybridモード用)
+        if filter_mode:
+            # 除外対象: _chk
+            if key.endswith('_chk'):
+                continue
+
+            # 許可対象: _txt (文章) と _val (数値) のみ
+            if not (key.endswith('_txt') or key.endswith('_val')):
+                continue
+
+        # B. 型定義の簡略化 (anyOf -> type)
+        if "anyOf" in prop:
+            # anyOfの中から 'null' でない方の型定義を探す
+            real_type = next((x for x in prop["anyOf"] if x.get("type") != "null"), None)
+            if real_type:
+                # descriptionやtitleは元のpropから引き継ぐ
+                new_prop = {k: v for k, v in prop.items() if k != "anyOf" and k != "default"}
+                new_prop.update(real_type)
+                new_properties[key] = new_prop
+        else:
+            new_properties[key] = prop
+
+        # C. 全フィールドを必須(required)にする
+        # LLMに「不明ならnull」と指示してあるので、スキーマ上は必須にして
+        # キー自体は必ず出力させたほうが安定する。
+        required_fields.append(key)
+
+    return {
+        "type": "object",
+        "properties": new_properties,
+        "required": required_fields, # ここで強力に指定
+        "description": raw_schema.get("description", "")
+    }
+
+
+def _strip_titles(node: Any, is_properties_map: bool = False) -> Any:
+    """
+    "title" はキー名を英単語に直しただけ (例: "Func Pain Txt") でLLMへの情報がないため取り除く。
+    properties 直下のキーはフィールド名なので、"title" という名前のフィールドは残す。
+    """
+    if isinstance(node, dict):
+        return {
+            k: _strip_titles(v, is_properties_map=(k == "properties" and not is_properties_map))
+            for k, v in node.items()
+            if is_properties_map or k != "title"
+        }
+    if isinstance(node, list):
+        return [_strip_titles(v) for v in node]
+    return node
+
+
+def _dumps_compact(schema: dict) -> str:
+    return json.dumps(_strip_titles(schema), ensure_ascii=False, separators=(",", ":"))
+
+
+def _dumps_pretty(schema: dict) -> str:
+    # 旧来のプロンプトに埋め込んでいた形式 (削減量の計測用)
+    return json.dumps(schema, indent=2, ensure_ascii=False)
+
+
+def _require_editable(item_keys) -> None:
+    invalid = [key for key in item_keys if not (isinstance(key, str) and get_field_registry().is_editable(key))]
+    if invalid:
+        raise ValueError(f"再生成できない項目が指定されました: {invalid}")
+
+
+class SchemaRegistry:
+    """
+    プロンプト生成に使うスキーマ関連の成果物をスキーマクラスごとに1度だけ計算して保持するレジストリ。
+
+    - model_json_schema() の結果
+    - optimize_schema_for_prompt() の結果 (filter_mode 別)
+    - 上記のプロンプト埋め込み用シリアライズ (title除去 + 空白なしのコンパクト形式)
+    - 項目再生成用の RegenerationSchema_{item_key} モデル
+    - ストリーミング出力をフィールド単位で検証するための TypeAdapter
+    - 一部のフィールドだけを生成し直すための部分スキーマ
+    - Ollamaの構造化出力 (format) に渡す、全項目を必須にしたJSONスキーマ
+
+    キャッシュのヒット率と、indent=2 形式と比べてプロンプトから削減できたバイト数を get_stats() で確認できます。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: Dict[Tuple, Any] = {}
+        # シリアライズ結果ごとの「旧形式との差分バイト数」
+        self._saved_bytes_per_entry: Dict[Tuple, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def _get_or_build(self, key: Tuple, builder) -> Any:
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+        # 構築は重いのでロックの外で行う (同時に構築されても結果は同じなので問題ない)
+        value = builder()
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+            self._cache[key] = value
+            return value
+
+    def _get_serialized(self, key: Tuple, schema_builder) -> str:
+        def build():
+            schema = schema_builder()
+            compact = _dumps_compact(schema)
+            pretty = _dumps_pretty(schema)
+            saved = len(pretty.encode("utf-8")) - len(compact.encode("utf-8"))
+            with self._lock:
+                self._saved_bytes_per_entry[key] = saved
+            return compact
+
+        serialized = self._get_or_build(key, build)
+        with self._lock:
+            self.bytes_saved += self._saved_bytes_per_entry.get(key, 0)
+        return serialized
+
+    def json_schema(self, schema_cls: Type[BaseModel]) -> dict:
+        """schema_cls.model_json_schema() のキャッシュ (呼び出し側で変更しないこと)"""
+        return self._get_or_build(("json_schema", schema_cls), schema_cls.model_json_schema)
+
+    def prompt_schema(self, schema_cls: Type[BaseModel], filter_mode: bool = False) -> dict:
+        """optimize_schema_for_prompt() のキャッシュ (呼び出し側で変更しないこと)"""
+        return self._get_or_build(
+            ("prompt_schema", schema_cls, filter_mode),
+            lambda: optimize_schema_for_prompt(schema_cls, filter_mode=filter_mode),
+        )
+
+    def schema_json(self, schema_cls: Type[BaseModel]) -> str:
+        """model_json_schema() をプロンプト埋め込み用にコンパクト化した文字列"""
+        return self._get_serialized(("schema_json", schema_cls), lambda: self.json_schema(schema_cls))
+
+    def prompt_schema_json(self, schema_cls: Type[BaseModel], filter_mode: bool = False) -> str:
+        """optimize_schema_for_prompt() の結果をプロンプト埋め込み用にコンパクト化した文字列"""
+        return self._get_serialized(
+            ("prompt_schema_json", schema_cls, filter_mode),
+            lambda: self.prompt_schema(schema_cls, filter_mode=filter_mode),
+        )
+
+    def regeneration_schema(self, item_key: str) -> Type[BaseModel]:
+        """
+        項目再生成用の動的スキーマ (再生成対象の1項目のみを含む)。
+        キャッシュが際限なく増えないよう、再生成できる項目 (EDITABLE_KEYS) 以外のキーは ValueError とする。
+        """
+        _require_editable((item_key,))
+        return self._get_or_build(
+            ("regeneration_schema", item_key),
+            lambda: create_model(
+                f"RegenerationSchema_{item_key}",
+                **{item_key: (str, Field(..., description=f"修正指示に基づいて書き直された'{item_key}'の新しい文章。"))},
+            ),
+        )
+
+    def batch_regeneration_schema(self, item_keys: Iterable[str]) -> Type[BaseModel]:
+        """
+        複数項目の一括再生成用の動的スキーマ (再生成対象の項目をキー順に含む)。
+        指定順の違いで別のエントリができないよう、項目の組み合わせ (キー順に並べたもの) ごとにキャッシュする。
+        項目の出力順はプロンプトの項目の並びで指示し、スキーマのフィールド順には依存させない。
+        再生成できる項目 (EDITABLE_KEYS) 以外のキーは ValueError とする。
+        """
+        item_keys = tuple(item_keys)
+        _require_editable(item_keys)
+        canonical_keys = tuple(sorted(item_keys))
+        return self._get_or_build(
+            ("batch_regeneration_schema", canonical_keys),
+            lambda: create_model(
+                "BatchRegenerationSchema",
+                **{
+                    key: (str, Field(..., description=f"修正指示に基づいて書き直された'{key}'の新しい文章。"))
+                    for key in canonical_keys
+                },
+            ),
+        )
+
+    def field_adapter(self, schema_cls: Type[BaseModel], field_name: str) -> TypeAdapter:
+        """schema_cls の1フィールド分の型で値を検証する TypeAdapter (ストリーミング中の逐次検証用)"""
+        return self._get_or_build(
+            ("field_adapter", schema_cls, field_name),
+            lambda: TypeAdapter(schema_cls.model_fields[field_name].annotation),
+        )
+
+    def partial_schema(self, schema_cls: Type[BaseModel], field_names: Tuple[str, ...]) -> Type[BaseModel]:
+        """
+        schema_cls のうち field_names のフィールドだけを持つスキーマ (リトライ時に未生成の項目だけを依頼するため)。
+        クラス名と説明は元のスキーマと同じにして、プロンプト上は同じグループとして扱わせる。
+        """
+        return self._get_or_build(
+            ("partial_schema", schema_cls, field_names),
+            lambda: create_model(
+                schema_cls.__name__,
+                __doc__=schema_cls.__doc__,
+                **{name: (schema_cls.model_fields[name].annotation, schema_cls.model_fields[name]) for name in field_names},
+            ),
+        )
+
+    def ollama_format(self, schema_cls: Type[BaseModel]) -> dict:
+        """
+        Ollamaの format 引数に渡すJSONスキーマ (呼び出し側で変更しないこと)。
+        Ollamaはこのスキーマから文法を作ってデコードを制約するため、トップレベルの全項目を必須にし、
+        スキーマ外のキーを禁止して、項目の欠落やネストの崩れが起きないようにする。
+        """
+
+        def build():
+            schema = copy.deepcopy(self.json_schema(schema_cls))
+            schema["required"] = list(schema.get("properties", {}).keys())
+            schema["additionalProperties"] = False
+            return schema
+
+        return self._get_or_build(("ollama_format", schema_cls), build)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._saved_bytes_per_entry.clear()
+            self.hits = 0
+            self.misses = 0
+            self.bytes_saved = 0
+
+
+# アプリケーション全体で共有するレジストリ
+schema_registry = SchemaRegistry()
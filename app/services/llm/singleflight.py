@@ -0,0 +1,183 @@
+import copy
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_hash(data: Any) -> str:
+    """患者データなどの内容から、キーの比較に使うハッシュを作る (辞書のキーの順序には依存しない)"""
+    material = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _kind(key: Hashable) -> str:
+    """キーの種類 (タプルの先頭要素)。統計とログで使う"""
+    return str(key[0]) if isinstance(key, tuple) and key else str(key)
+
+
+class _Call:
+    """do() で実行中の1回分の呼び出し"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class _Flight:
+    """stream() で実行中の1本のストリーム。届いたイベントを全て保持し、後から参加した購読者にも最初から送る"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.events: List[str] = []
+        self.done = False
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中であれば、新たに実行せずその結果を共有する (Singleflight)。
+
+    - do(): 通常の関数呼び出し (RAGExecutor.execute など)。実行中の呼び出しの戻り値 (または例外) を共有する。
+    - stream(): SSEストリーム (generate_plan_stream など)。1本だけ生成し、イベントを全ての購読者に配信する。
+      途中から参加した購読者には、それまでのイベントを先に送る。購読者が全員切断したら生成を止める。
+
+    生成ボタンの二度押しや、確認画面を2つのタブで開いた場合に、同じ患者の同じ生成が並行して走るのを防ぎます。
+    キーのタプルの先頭要素 (処理の種類) ごとの実行回数・共有回数は、管理者用API (/admin/api/llm-stats) で確認できます。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _record(self, key: Hashable, coalesced: bool) -> None:
+        """ロックを保持した状態で呼ぶこと"""
+        stats = self._stats.setdefault(_kind(key), {"executions": 0, "coalesced": 0})
+        stats["coalesced" if coalesced else "executions"] += 1
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        key の呼び出しが実行中であればその完了を待って結果を返し、なければ fn() を実行する。
+        待っていた呼び出し元にはコピーを返すため、結果を書き換えても互いに影響しない。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+            self._record(key, coalesced=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+            if call.waiters:
+                logger.info(f"SingleFlight: shared result of {_kind(key)} with {call.waiters} waiter(s)")
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def stream(self, key: Hashable, factory: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        key のストリームが生成中であればそれを購読し、なければ factory() の生成を別スレッドで開始して購読する。
+        (ジェネレータなので、最初のイベントを要求した時点で参加する)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            with flight.cond:
+                flight.subscribers += 1
+            self._record(key, coalesced=not leader)
+
+        if leader:
+            threading.Thread(
+                target=self._pump, args=(key, flight, factory), name=f"singleflight-{_kind(key)}", daemon=True
+            ).start()
+        else:
+            logger.info(f"SingleFlight: joined in-flight stream {_kind(key)}")
+
+        index = 0
+        try:
+            while True:
+                with flight.cond:
+                    while index >= len(flight.events) and not flight.done:
+                        flight.cond.wait()
+                    if index >= len(flight.events):
+                        return
+                    chunk = flight.events[index]
+                    index += 1
+                yield chunk
+        finally:
+            with self._lock:
+                with flight.cond:
+                    flight.subscribers -= 1
+                    # 全員が切断したストリームには新たに参加させない (生成は次のイベントで止まる)
+                    if flight.subscribers == 0 and self._flights.get(key) is flight:
+                        del self._flights[key]
+
+    def _pump(self, key: Hashable, flight: _Flight, factory: Callable[[], Iterator[str]]) -> None:
+        stream = None
+        try:
+            stream = factory()
+            for chunk in stream:
+                with flight.cond:
+                    if flight.subscribers == 0:
+                        logger.info(f"SingleFlight: stream stopped (all subscribers disconnected): {_kind(key)}")
+                        break
+                    flight.events.append(chunk)
+                    flight.cond.notify_all()
+        except Exception as e:
+            logger.error(f"SingleFlight: stream failed: {e}", exc_info=True)
+            error_event = f"event: error\ndata: {json.dumps({'error': f'生成中にエラーが発生しました: {e}'}, ensure_ascii=False)}\n\n"
+            with flight.cond:
+                flight.events.append(error_event)
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = {label: dict(values) for label, values in self._stats.items()}
+            in_flight: List[Tuple[str, int]] = [(_kind(key), flight.subscribers) for key, flight in self._flights.items()]
+        return {
+            "by_kind": stats,
+            "in_flight_streams": [{"kind": kind, "subscribers": subscribers} for kind, subscribers in in_flight],
+            "in_flight_calls": len(self._calls),
+        }
+
+    def clear_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# アプリケーション全体で共有するインスタンス
+llm_singleflight = SingleFlight()
@@ -0,0 +1,90 @@
+import json
+import logging
+import queue
+import threading
+from typing import Callable, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+# ストリームの終了を表す番兵
+_STREAM_END = object()
+
+
+def tag_sse_event(chunk: str, model_type: str) -> str:
+    """
+    SSE形式のイベント文字列の data (JSONオブジェクト) に model_type を付与する。
+    クライアントが独自の model_type (Ollamaの "ollama_specialized" など) を付けていても、
+    フロントエンドが振り分けに使うストリームのキーで上書きする。
+    data がオブジェクトでないイベント (context_update など) はそのまま返す。
+    """
+    lines = chunk.strip("\n").split("\n")
+    data_index = next((i for i, line in enumerate(lines) if line.startswith("data:")), None)
+    if data_index is None:
+        return chunk
+    try:
+        data = json.loads(lines[data_index][len("data:"):].strip())
+    except json.JSONDecodeError:
+        return chunk
+    if not isinstance(data, dict) or data.get("model_type") == model_type:
+        return chunk
+    data["model_type"] = model_type
+    lines[data_index] = f"data: {json.dumps(data, ensure_ascii=False)}"
+    return "\n".join(lines) + "\n\n"
+
+
+def multiplex_sse_streams(
+    stream_factories: Dict[str, Callable[[], Iterator[str]]],
+    finished_event: str = "all_finished",
+) -> Iterator[str]:
+    """
+    複数のSSEストリームを並行して実行し、届いた順に1本のストリームへまとめるジェネレータ。
+
+    各ストリームは専用のスレッドで生成されるため、Gunicornのリクエストスレッドは1本だけで済みます。
+    イベントには model_type (stream_factories のキー) が付与され、フロントエンドはそれで振り分けます。
+    すべてのストリームが終わると finished_event を送信します。
+
+    Args:
+        stream_factories: {model_type: SSE文字列を返すジェネレータを作る関数}。
+            ジェネレータの生成 (RAGExecutorの準備など) もスレッド内で行うため、遅い初期化が他のストリームを待たせません。
+        finished_event: 全ストリーム完了時に送信するイベント名。
+    """
+    events: queue.Queue = queue.Queue()
+    # クライアントが切断した場合に、生成中のストリームを止めるためのフラグ
+    stop = threading.Event()
+
+    def pump(model_type: str, factory: Callable[[], Iterator[str]]) -> None:
+        stream = None
+        try:
+            stream = factory()
+            for chunk in stream:
+                if stop.is_set():
+                    logger.info(f"multiplex_sse_streams: {model_type} stream stopped (client disconnected)")
+                    break
+                events.put(tag_sse_event(chunk, model_type))
+        except Exception as e:
+            logger.error(f"multiplex_sse_streams: {model_type} stream failed: {e}", exc_info=True)
+            error_data = {"error": f"生成中にエラーが発生しました: {e}", "model_type": model_type}
+            events.put(f"event: error\ndata: {json.dumps(error_data, ensure_ascii=False)}\n\n")
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            events.put(_STREAM_END)
+
+    threads = [
+        threading.Thread(target=pump, args=(model_type, factory), name=f"sse-{model_type}", daemon=True)
+        for model_type, factory in stream_factories.items()
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        remaining = len(threads)
+        while remaining:
+            item = events.get()
+            if item is _STREAM_END:
+                remaining -= 1
+                continue
+            yield item
+        yield f"event: {finished_event}\ndata: {{}}\n\n"
+    finally:
+        stop.set()
@@ -0,0 +1,46 @@
+import time
+from typing import Callable, Iterable, Iterator
+
+# 区切りとして送信する文末の文字
+SENTENCE_ENDINGS = ("。", "！", "？", "!", "?", "\n")
+
+
+def coalesce_text(
+    pieces: Iterable[str],
+    max_interval: float = 0.3,
+    max_chars: int = 200,
+    clock: Callable[[], float] = time.monotonic,
+) -> Iterator[str]:
+    """
+    LLMのストリーミング出力 (数文字ずつの断片) を、文単位または一定時間ごとにまとめて返すジェネレータ。
+
+    - 文末 (。！？ や改行) が届いたら、最後の文末までをまとめて返す。
+    - 文末が来なくても、最初の断片を溜めてから max_interval 秒経つか max_chars 文字溜まったら返す。
+    - 入力が終わったら残りをすべて返す。
+
+    SSEのイベント数 (= JSONエンコードとネットワーク書き込みの回数) を減らしつつ、
+    画面に文章が表示されるまでの遅れを max_interval 程度に抑えるために使います。
+    """
+    buffer = ""
+    buffered_since = None
+
+    for piece in pieces:
+        if not piece:
+            continue
+        if not buffer:
+            buffered_since = clock()
+        buffer += piece
+
+        cut = max(buffer.rfind(ending) for ending in SENTENCE_ENDINGS)
+        if cut != -1:
+            cut += 1
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+            buffered_since = clock() if buffer else None
+        elif len(buffer) >= max_chars or clock() - buffered_since >= max_interval:
+            yield buffer
+            buffer = ""
+            buffered_since = None
+
+    if buffer:
+        yield buffer
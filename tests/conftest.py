@@ -1,3 +1,5 @@
+import os
+
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -9,6 +11,11 @@ import app.core.database as database
 # ファクトリ関数をインポート
 from app import create_app
 from app.models import Base, Staff
+from app.services.llm.context_builder import patient_facts_cache
+
+# LLM応答キャッシュは、同じプロンプトでモックの戻り値を変えるテストに影響するため無効にする
+# (キャッシュ自体のテストは tests/test_response_cache.py で個別のインスタンスを使う)
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
 
 
 # クラス定義にはデコレータをつけない
@@ -19,6 +26,13 @@ class MockUser:
         self.username = username
         self.is_authenticated = is_authenticated
 
+
+@pytest.fixture(autouse=True)
+def clear_patient_facts_cache():
+    """患者の事実情報のメモ化は、同じ患者IDで内容の異なるデータを使うテストに影響するため、テストごとに破棄する"""
+    patient_facts_cache.clear()
+    yield
+
 @pytest.fixture(scope="function")
 def app():
     """Flaskアプリケーションのフィクスチャ (テストごとに初期化)"""
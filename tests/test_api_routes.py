@@ -141,3 +141,80 @@ def test_like_suggestion_api(login_staff, app, db_session, mocker):
 
     assert response_del.status_code == 200
     mock_delete_like.assert_called_once()
+
+
+def test_regenerate_item_rejects_non_editable_key(login_staff, app, db_session, mocker):
+    """再生成API (/api/regenerate) は、再生成できない項目を患者データの取得前に 400 で拒否すること"""
+    patient = Patient(name="Regenerate Key Patient", gender="男性")
+    db_session.add(patient)
+    db_session.commit()
+
+    mock_get_patient = mocker.patch("app.routers.plan.api.patient_crud.get_patient_data_for_plan")
+    mock_get_client = mocker.patch("app.routers.plan.api.get_llm_client")
+
+    with app.test_request_context():
+        target_url = url_for('plan.regenerate_item')
+
+    for item_key in ("patient_id", "unknown_txt", 1, {"a": 1}):
+        data = {"patient_id": patient.patient_id, "item_key": item_key, "instruction": "具体的に"}
+        response = login_staff.post(target_url, json=data)
+        assert response.status_code == 400
+
+    mock_get_patient.assert_not_called()
+    mock_get_client.assert_not_called()
+
+
+def test_regenerate_items_batch_api(login_staff, app, db_session, mocker):
+    """一括再生成API (/api/regenerate/batch) のテスト"""
+    # 1. データ準備
+    patient = Patient(name="Batch Regenerate Patient", gender="男性")
+    db_session.add(patient)
+    db_session.commit()
+
+    staff = db_session.query(Staff).filter_by(username="test_user").first()
+    assign_patient_to_staff(staff.id, patient.patient_id)
+
+    mock_get_client = mocker.patch("app.routers.plan.api.get_llm_client")
+    mock_client_instance = MagicMock()
+    mock_get_client.return_value = mock_client_instance
+
+    def mock_stream_generator(*args, **kwargs):
+        yield "event: update\ndata: {}\n\n"
+        yield "event: finished\ndata: {}\n\n"
+
+    mock_client_instance.regenerate_plan_items_stream.return_value = mock_stream_generator()
+
+    with app.test_request_context():
+        target_url = url_for('plan.regenerate_items_batch')
+
+    items = [
+        {"item_key": "main_risks_txt", "current_text": "転倒", "instruction": "具体的に"},
+        {"item_key": "goals_1_month_txt", "instruction": "短く"},
+    ]
+
+    # 2. 同じ項目の重複や instruction の欠落は 400
+    response = login_staff.post(target_url, json={"patient_id": patient.patient_id, "items": [items[0], items[0]]})
+    assert response.status_code == 400
+    response = login_staff.post(target_url, json={"patient_id": patient.patient_id, "items": [{"item_key": "main_risks_txt"}]})
+    assert response.status_code == 400
+    # 整数でない patient_id は、ストリームを開始する前に 400
+    for patient_id in ("abc", 1.5, [1], True):
+        response = login_staff.post(target_url, json={"patient_id": patient_id, "items": items})
+        assert response.status_code == 400
+    # 再生成できない項目 (文字列以外のキーを含む) は 400
+    for item_key in ("patient_id", 1, {"a": 1}):
+        invalid_items = [items[0], {"item_key": item_key, "instruction": "短く"}]
+        response = login_staff.post(target_url, json={"patient_id": patient.patient_id, "items": invalid_items})
+        assert response.status_code == 400
+
+    # 3. POST実行
+    response = login_staff.post(target_url, json={"patient_id": patient.patient_id, "model_type": "general", "items": items})
+
+    # 4. 検証: 全項目が1回の呼び出しで渡される
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    mock_client_instance.regenerate_plan_items_stream.assert_called_once()
+    call_args = mock_client_instance.regenerate_plan_items_stream.call_args
+    assert [item["item_key"] for item in call_args.kwargs["items"]] == ["main_risks_txt", "goals_1_month_txt"]
+    assert call_args.kwargs["items"][1]["current_text"] == ""
+    assert call_args.kwargs["rag_executor"] is None
@@ -0,0 +1,78 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from app.services.llm.gemini import GeminiClient
+from app.services.llm.mock import MockLLMClient
+
+ITEMS = [
+    {"item_key": "main_risks_txt", "current_text": "転倒", "instruction": "具体的に"},
+    {"item_key": "goals_1_month_txt", "current_text": "歩行", "instruction": "短く"},
+]
+
+
+def _data(event):
+    return json.loads(event.split("\n")[1][len("data: "):])
+
+
+@patch("app.services.llm.gemini.client")
+def test_gemini_batch_regeneration_uses_one_call_and_one_rag_search(mock_genai_client):
+    """複数項目の再生成で、RAG検索とLLM呼び出しが1回ずつで、完成した項目から順に送られること"""
+    sent_chunks = []
+
+    def fake_stream(**kwargs):
+        for text in ['{"main_risks_txt": "ふらつきに', 'よる転倒。", "goals_1_month', '_txt": "屋内歩行の自立。"}']:
+            sent_chunks.append(text)
+            chunk = MagicMock()
+            chunk.text = text
+            yield chunk
+
+    mock_genai_client.models.generate_content_stream.side_effect = fake_stream
+    rag_executor = MagicMock()
+    rag_executor.execute.return_value = {"contexts": [{"content": "転倒予防のガイドライン"}]}
+
+    stream = GeminiClient().regenerate_plan_items_stream({"name": "テスト", "main_risks_txt": "転倒"}, ITEMS, rag_executor)
+    first = next(stream)
+    # 1つ目の項目は、ストリームの完了を待たずに送信される
+    assert _data(first) == {"key": "main_risks_txt", "chunk": "ふらつきによる転倒。"}
+    assert len(sent_chunks) == 2
+
+    rest = list(stream)
+    assert _data(rest[0]) == {"key": "goals_1_month_txt", "chunk": "屋内歩行の自立。"}
+    assert rest[-1].startswith("event: finished")
+
+    rag_executor.execute.assert_called_once()
+    assert mock_genai_client.models.generate_content_stream.call_count == 1
+    contents = mock_genai_client.models.generate_content_stream.call_args.kwargs["contents"]
+    assert "転倒予防のガイドライン" in contents
+    assert "`goals_1_month_txt`" in contents
+
+
+@patch("app.services.llm.ollama.time.sleep")
+@patch("app.services.llm.ollama.OllamaClient._chat")
+def test_ollama_batch_regeneration_retries_only_missing_items(mock_chat, mock_sleep):
+    """途中で失敗した場合、検証済みの項目は保持し、次の試行では残りの項目だけを依頼すること"""
+    from app.services.llm.ollama import OllamaClient
+
+    mock_chat.side_effect = [
+        iter([{"message": {"content": text}} for text in ['{"main_risks_txt": "転倒。", ', '"goals_1_month_txt": }']]),
+        iter([{"message": {"content": '{"goals_1_month_txt": "歩行の自立。"}'}}]),
+    ]
+
+    events = list(OllamaClient().regenerate_plan_items_stream({"name": "テスト"}, ITEMS))
+
+    assert [e.split("\n")[0] for e in events] == ["event: update", "event: update", "event: finished"]
+    assert [_data(e)["key"] for e in events[:2]] == ["main_risks_txt", "goals_1_month_txt"]
+    retry_prompt = mock_chat.call_args_list[1].kwargs["messages"][0]["content"]
+    assert "`goals_1_month_txt`" in retry_prompt
+    assert "`main_risks_txt`" not in retry_prompt
+
+
+def test_default_batch_regeneration_runs_items_in_order():
+    """既定の実装は項目ごとに再生成し、最後に finished を1回だけ送ること"""
+    events = list(MockLLMClient().regenerate_plan_items_stream({"name": "テスト"}, ITEMS))
+
+    assert sum(e.startswith("event: finished") for e in events) == 1
+    assert events[-1].startswith("event: finished")
+    keys = [_data(e)["key"] for e in events if e.startswith("event: update")]
+    assert keys == sorted(keys, key=["main_risks_txt", "goals_1_month_txt"].index)
+    assert set(keys) == {"main_risks_txt", "goals_1_month_txt"}
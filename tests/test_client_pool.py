@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from app.services.llm.cancellation import CallCancelledError, CancelToken, cancel_scope
+from app.services.llm.client_pool import LLMClientPool
+from app.services.llm.metrics import llm_metrics
+
+
+def test_get_client_creates_one_instance_per_type():
+    """クライアントは種類ごとに1度だけ生成され、共有されること"""
+    pool = LLMClientPool()
+    created = []
+
+    def factory(client_type):
+        created.append(client_type)
+        return object()
+
+    first = pool.get_client("mock", factory)
+    assert pool.get_client("mock", factory) is first
+    assert pool.get_client("ollama", factory) is not first
+    assert created == ["mock", "ollama"]
+
+
+def test_slot_limits_in_flight_calls_and_records_queue_wait():
+    """上限を超える呼び出しは空きを待ち、待ち時間が記録されること"""
+    llm_metrics.clear()
+    pool = LLMClientPool(limits={"ollama": 1})
+    release = threading.Event()
+    entered = threading.Event()
+
+    def hold_slot():
+        with pool.slot("ollama"):
+            entered.set()
+            release.wait(timeout=5)
+
+    holder = threading.Thread(target=hold_slot)
+    holder.start()
+    entered.wait(timeout=5)
+    assert pool.get_stats()["backends"]["ollama"]["in_flight"] == 1
+
+    threading.Timer(0.2, release.set).start()
+    with pool.slot("ollama"):
+        assert pool.get_stats()["backends"]["ollama"]["in_flight"] == 1
+    holder.join(timeout=5)
+
+    stats = llm_metrics.get_stats()["ollama.queue_wait"]
+    assert stats["count"] == 2
+    assert stats["max"] >= 0.15
+    assert pool.get_stats()["backends"]["ollama"] == {"limit": 1, "in_flight": 0, "waiting": 0}
+
+
+def test_slot_gives_up_at_the_cancel_token_deadline():
+    """タイムスライス内の呼び出しは、締め切りまでに枠が空かなければ打ち切られること"""
+    pool = LLMClientPool(limits={"gemini": 1})
+
+    with pool.slot("gemini"):
+        errors = []
+
+        def wait_for_slot():
+            with cancel_scope(CancelToken(deadline=time.time() + 0.1)):
+                try:
+                    with pool.slot("gemini"):
+                        pass
+                except CallCancelledError as e:
+                    errors.append(e)
+
+        waiter = threading.Thread(target=wait_for_slot)
+        waiter.start()
+        waiter.join(timeout=5)
+
+    assert len(errors) == 1
+    with pytest.raises(CallCancelledError):
+        with cancel_scope(CancelToken(deadline=time.time() - 1)):
+            with pool.slot("gemini"):
+                pass
@@ -0,0 +1,263 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from pydantic import BaseModel
+
+from app.schemas.schemas import (
+    PATIENT_INFO_EXTRACTION_DEPENDENCIES,
+    PATIENT_INFO_EXTRACTION_GROUPS,
+    PatientInfo_Goals,
+    PatientInfo_Nutrition,
+    PatientInfo_Social,
+)
+from app.services.llm.cancellation import current_cancel_token
+from app.services.llm.extraction_scheduler import ExtractionScheduler
+from app.services.llm.patient_info_parser import PatientInfoParser
+
+
+class GroupA(BaseModel):
+    a: str = None
+
+
+class GroupB(BaseModel):
+    b: str = None
+
+
+class GroupC(BaseModel):
+    c: str = None
+
+
+def test_schema_dependency_graph_is_valid():
+    """schemas.py の依存グラフが循環せず、クリティカルパスがグループ数より短いこと"""
+    scheduler = ExtractionScheduler(PATIENT_INFO_EXTRACTION_GROUPS, PATIENT_INFO_EXTRACTION_DEPENDENCIES)
+    assert scheduler.critical_path_length() == 2
+    assert PatientInfo_Social in scheduler.ancestors[PatientInfo_Goals]
+    assert scheduler.ancestors[PatientInfo_Nutrition] == []
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError):
+        ExtractionScheduler([GroupA, GroupB], {GroupA: [GroupB], GroupB: [GroupA]})
+
+
+def test_independent_groups_run_concurrently_and_dependents_get_context():
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    contexts = {}
+
+    def run_group(group, context):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        contexts[group] = context
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+        return {group.__name__: "done"}
+
+    scheduler = ExtractionScheduler([GroupA, GroupB, GroupC], {GroupC: [GroupA]}, max_concurrency=3)
+    events = list(scheduler.run(run_group))
+
+    assert peak == 2  # A と B は同時実行、C は A の完了待ち
+    assert {e["status"] for e in events} == {"success"}
+    assert [e["group"] for e in events][-1] is GroupC
+    # C には依存先 A の結果だけが渡される
+    assert contexts[GroupC] == {"GroupA": "done"}
+    assert contexts[GroupB] == {}
+
+
+def test_concurrency_cap_is_respected():
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def run_group(group, context):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        return {}
+
+    scheduler = ExtractionScheduler([GroupA, GroupB, GroupC], max_concurrency=1)
+    list(scheduler.run(run_group))
+    assert peak == 1
+
+
+def test_failed_and_overdue_groups_are_reported():
+    def run_group(group, context):
+        if group is GroupA:
+            raise RuntimeError("boom")
+        if group is GroupB:
+            time.sleep(0.5)
+        return {"ok": True}
+
+    scheduler = ExtractionScheduler([GroupA, GroupB, GroupC], {GroupC: [GroupA]}, group_timeout=0.1)
+    events = {e["group"]: e for e in scheduler.run(run_group)}
+
+    assert events[GroupA]["status"] == "error"
+    assert events[GroupB]["status"] == "timeout"
+    # 依存先が失敗しても後続グループは実行される
+    assert events[GroupC]["status"] == "success"
+
+
+@patch('app.services.llm.patient_info_parser.get_llm_client')
+def test_parser_standard_mode_uses_dependency_graph(mock_get_llm):
+    """通常モードで全グループが抽出され、目標系グループには依存先の結果だけが渡されること"""
+    mock_llm = MagicMock()
+    mock_get_llm.return_value = mock_llm
+    prompts = {}
+
+    def side_effect(prompt, schema):
+        prompts[schema] = prompt
+        return {f"{schema.__name__}_marker": True}
+
+    mock_llm.generate_json_with_prefix.side_effect = lambda prefix, suffix, schema: side_effect(prefix + suffix, schema)
+
+    parser = PatientInfoParser(use_hybrid_mode=False, max_concurrency=4)
+    result = parser.parse_text("右片麻痺あり。")
+
+    assert mock_llm.generate_json_with_prefix.call_count == len(PATIENT_INFO_EXTRACTION_GROUPS)
+    for schema in PATIENT_INFO_EXTRACTION_GROUPS:
+        assert result[f"{schema.__name__}_marker"] is True
+
+    goals_prompt = prompts[PatientInfo_Goals]
+    assert "PatientInfo_Social_marker" in goals_prompt
+    assert "PatientInfo_Nutrition_marker" not in goals_prompt
+
+
+def test_ready_groups_run_in_priority_order_with_inheritance():
+    """優先度の高いグループから実行され、依存先には依存元の優先度が引き継がれること"""
+    started = []
+
+    def run_group(group, context):
+        started.append(group)
+        return {}
+
+    # C (最重要) は A に依存するため、A も C と同じ優先度として B より先に実行される
+    scheduler = ExtractionScheduler(
+        [GroupA, GroupB, GroupC], {GroupC: [GroupA]}, max_concurrency=1,
+        priorities={GroupA: 3, GroupB: 2, GroupC: 1},
+    )
+    list(scheduler.run(run_group))
+
+    assert scheduler.priorities[GroupA] == 1
+    assert started == [GroupA, GroupC, GroupB]
+
+
+def test_time_slice_cancels_overrun_and_skips_low_priority_groups():
+    """タイムスライスを超えた呼び出しはトークンで打ち切られ、予算が尽きた低優先度グループは開始されないこと"""
+    tokens = {}
+    started = []
+
+    def run_group(group, context):
+        started.append(group)
+        tokens[group] = current_cancel_token()
+        if group is GroupB:
+            # 締め切りを無視して粘る呼び出し
+            while not tokens[group].cancelled:
+                time.sleep(0.01)
+        return {group.__name__: True}
+
+    scheduler = ExtractionScheduler(
+        [GroupA, GroupB, GroupC], max_concurrency=1, priorities={GroupA: 1, GroupB: 2, GroupC: 3}, min_slice=0.3,
+    )
+    events = {e["group"]: e for e in scheduler.run(run_group, deadline=time.time() + 0.5)}
+
+    assert events[GroupA]["status"] == "success"
+    # B には残り時間を残りの段数で割った分 (>= min_slice) だけが割り当てられる
+    assert events[GroupB]["status"] == "timeout"
+    assert 0.3 <= events[GroupB]["slice"] < 0.5
+    assert tokens[GroupB].cancelled
+    # C を開始する時間は残っていない
+    assert events[GroupC]["status"] == "skipped"
+    assert GroupC not in started
+
+
+def test_hung_group_does_not_starve_dependent_groups():
+    """トークンを無視して返らない呼び出しを見捨てても、後続グループがワーカー待ちでタイムアウトしないこと"""
+    release = threading.Event()
+
+    def run_group(group, context):
+        if group is GroupA:
+            # キャンセルされても返らない呼び出し (ワーカーを占有し続ける)
+            release.wait(5)
+            return {}
+        time.sleep(0.05)
+        return {group.__name__: True}
+
+    scheduler = ExtractionScheduler(
+        [GroupA, GroupB, GroupC], {GroupB: [GroupA], GroupC: [GroupB]}, max_concurrency=1, group_timeout=0.2,
+    )
+    try:
+        events = {e["group"]: e for e in scheduler.run(run_group)}
+    finally:
+        release.set()
+
+    assert events[GroupA]["status"] == "timeout"
+    assert events[GroupB]["status"] == "success"
+    assert events[GroupC]["status"] == "success"
+
+
+@patch('app.services.llm.patient_info_parser.GENERATION_TIMEOUT_SEC', 0.5)
+@patch('app.services.llm.patient_info_parser.MIN_GROUP_SLICE_SEC', 0.3)
+@patch('app.services.llm.patient_info_parser.get_llm_client')
+def test_parser_returns_partial_result_with_missing_groups(mock_get_llm):
+    """時間予算が足りない場合、重要度の高いグループの結果と欠けているグループ名が返ること"""
+    mock_llm = MagicMock()
+    mock_get_llm.return_value = mock_llm
+
+    def side_effect(prefix, suffix, schema):
+        time.sleep(0.15)
+        return {f"{schema.__name__}_marker": True}
+
+    mock_llm.generate_json_with_prefix.side_effect = side_effect
+
+    parser = PatientInfoParser(use_hybrid_mode=False, max_concurrency=1)
+    result, missing_groups = parser.parse_text_with_missing_groups("右片麻痺あり。")
+
+    assert result["PatientInfo_Basic_marker"] is True
+    assert "PatientInfo_Nutrition_marker" not in result
+    assert "PatientInfo_Nutrition" in missing_groups
+    assert "PatientInfo_Basic" not in missing_groups
+    # 抽出結果はフォームにそのまま反映されるため、項目以外のキーを含まない
+    assert "_missing_groups" not in result
+
+
+@patch('app.services.llm.patient_info_parser.get_llm_client')
+def test_parser_retries_invalid_output_and_records_attempts_per_group(mock_get_llm):
+    """検証に失敗したグループは再試行され、グループごとの試行回数が llm_retry_stats に記録されること"""
+    from app.services.llm.metrics import llm_retry_stats
+    from app.services.llm.patient_info_parser import EXTRACTION_MAX_ATTEMPTS
+
+    llm_retry_stats.clear()
+    mock_llm = MagicMock()
+    mock_get_llm.return_value = mock_llm
+    calls = {}
+
+    def side_effect(prefix, suffix, schema):
+        calls[schema] = calls.get(schema, 0) + 1
+        if schema is PatientInfo_Social or (schema is PatientInfo_Nutrition and calls[schema] == 1):
+            raise ValueError("invalid JSON")
+        return {f"{schema.__name__}_marker": True}
+
+    mock_llm.generate_json_with_prefix.side_effect = side_effect
+
+    parser = PatientInfoParser(use_hybrid_mode=False, max_concurrency=4)
+    result, missing_groups = parser.parse_text_with_missing_groups("右片麻痺あり。")
+
+    assert result["PatientInfo_Nutrition_marker"] is True
+    assert "PatientInfo_Social" in missing_groups
+    stats = llm_retry_stats.get_stats()
+    assert stats["extraction.PatientInfo_Nutrition"] == {
+        "calls": 1, "attempts": 2, "retries": 1, "failures": 0, "retry_rate": 1.0,
+    }
+    assert stats["extraction.PatientInfo_Social"]["attempts"] == EXTRACTION_MAX_ATTEMPTS
+    assert stats["extraction.PatientInfo_Social"]["failures"] == 1
+    assert stats["extraction.PatientInfo_Goals"]["retries"] == 0
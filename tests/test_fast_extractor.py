@@ -1,5 +1,8 @@
+import itertools
+
 import pytest
 from app.services.extraction.fast_extractor import FastExtractor
+from app.services.extraction.keyword_automaton import KeywordAutomaton
 
 @pytest.fixture(scope="module")
 def extractor():
@@ -63,4 +66,110 @@ class TestFastExtractor:
         comorbidities = result.get('main_comorbidities_txt', "")
         assert "高血圧症" in comorbidities
         assert "糖尿病" in comorbidities
-        assert "脂質異常症" in comorbidities
\ No newline at end of file
+        assert "脂質異常症" in comorbidities
+
+class TestKeywordAutomaton:
+
+    def test_finds_overlapping_keywords(self):
+        """包含関係にあるキーワード (「片麻痺」と「麻痺」) が両方ヒットするか"""
+        automaton = KeywordAutomaton({
+            "paralysis": ["麻痺", "片麻痺"],
+            "hemiplegia": ["片麻痺"],
+        })
+        matches = list(automaton.iter_matches("右片麻痺あり"))
+
+        assert (1, 4, "片麻痺") in matches
+        assert (2, 4, "麻痺") in matches
+        assert automaton.schema_keys_for("片麻痺") == ["paralysis", "hemiplegia"]
+
+    def test_matches_same_as_finditer(self):
+        """同一キーワードの出現位置が re.finditer と一致するか"""
+        import re
+        text = "PT実施。OTとPTの併用。PTPT"
+        automaton = KeywordAutomaton({"pt": ["PT"], "ot": ["OT"]})
+
+        hits = [(s, e) for s, e, kw in automaton.iter_matches(text) if kw == "PT"]
+        expected = [(m.start(), m.end()) for m in re.finditer("PT", text)]
+        assert hits == expected
+
+    def test_extractor_uses_class_level_automaton(self, extractor):
+        """オートマトンがクラスで共有され、全キーワードを網羅しているか"""
+        assert FastExtractor.KEYWORD_AUTOMATON is extractor.KEYWORD_AUTOMATON
+        for keywords in FastExtractor.LABEL_MAPPING.values():
+            for kw in keywords:
+                assert extractor.KEYWORD_AUTOMATON.schema_keys_for(kw)
+
+
+class TestFastExtractorBatch:
+
+    TEXTS = [
+        "80歳・男性。右片麻痺あり。高血圧の既往あり。",
+        "麻痺なし。疼痛は認めない。",
+        "糖尿病あり。復職を目指す。",
+    ]
+
+    def test_batch_matches_single_extraction(self, extractor):
+        """バッチ抽出の結果が、1件ずつの抽出と同じ内容・同じ順序になるか"""
+        results = extractor.extract_facts_batch(self.TEXTS, batch_size=2)
+
+        assert isinstance(results, list)
+        assert results == [extractor.extract_facts(t) for t in self.TEXTS]
+
+    def test_batch_stream_mode(self, extractor):
+        """stream=True でジェネレータを受け取り、逐次処理できるか"""
+        results = extractor.extract_facts_batch((t for t in self.TEXTS), stream=True)
+
+        assert not isinstance(results, list)
+        first = next(results)
+        assert first.get('func_motor_paralysis_chk') is True
+        rest = list(results)
+        assert len(rest) == 2
+        assert not rest[0].get('func_motor_paralysis_chk')
+
+    def test_batch_stream_yields_texts_without_hits(self, extractor):
+        """キーワードのないテキストが続いても、後続のテキストを待たずに逐次返されるか"""
+        texts = itertools.chain([self.TEXTS[0]], itertools.repeat("本日の記録。天気は晴れ。"))
+        results = extractor.extract_facts_batch(texts, batch_size=4, stream=True)
+
+        assert next(results).get('func_motor_paralysis_chk') is True
+        for _ in range(3):
+            assert not any(k.endswith("_chk") for k in next(results))
+
+    def test_batch_stream_without_nlp(self, extractor, mocker):
+        """GiNZAがない場合も、入力を読み切らずに1件ずつ返されるか"""
+        mocker.patch.object(extractor, "nlp", None)
+        results = extractor.extract_facts_batch(itertools.cycle(self.TEXTS), stream=True)
+
+        assert [next(results) for _ in range(4)] == [extractor.extract_facts(t) for t in self.TEXTS + self.TEXTS[:1]]
+
+    def test_batch_falls_back_when_ginza_fails(self, extractor, mocker):
+        """GiNZAの解析に失敗した場合、extract_facts と同様に否定判定なしで全件を返すか"""
+        mocker.patch.object(extractor.nlp, "pipe", side_effect=RuntimeError("GiNZA error"))
+        results = extractor.extract_facts_batch(self.TEXTS)
+
+        assert results == [extractor.extract_facts(t) for t in self.TEXTS]
+        assert len(results) == 3
+
+
+class TestHitDrivenParsing:
+
+    def test_hit_chunks_cover_only_hit_sentences(self, extractor):
+        """キーワードを含む文だけが解析対象となり、連続する文はまとめられるか"""
+        text = "本日の記録。右片麻痺あり。疼痛なし。天気は晴れ。復職希望。"
+        hits = list(extractor.KEYWORD_AUTOMATON.iter_matches(text))
+        chunks = extractor._hit_chunks(text, hits)
+
+        assert [text[s:e] for s, e in chunks] == ["右片麻痺あり。疼痛なし。", "復職希望。"]
+
+    def test_no_parse_without_hits(self, extractor, mocker):
+        """キーワードが1つもなければGiNZA解析を実行しないか"""
+        spy = mocker.spy(extractor.nlp, "pipe")
+        result = extractor.extract_facts("本日の記録。天気は晴れ。")
+
+        assert spy.call_count == 0
+        assert not any(k.endswith("_chk") for k in result)
+
+    def test_unused_pipes_disabled(self, extractor):
+        """否定判定に不要なコンポーネント (NERなど) が無効化されているか"""
+        assert "ner" not in extractor.nlp.pipe_names
+        assert "parser" in extractor.nlp.pipe_names
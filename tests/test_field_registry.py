@@ -0,0 +1,37 @@
+from app.services.field_registry import FieldRegistry, get_field_registry, validate_field_registry
+
+
+def test_registry_resolves_field_metadata():
+    """項目のカテゴリ・対応するチェックボックス・Excelのセル・日本語名・編集可否を辞書で引けること"""
+    registry = get_field_registry()
+
+    pain = registry.get("func_pain_txt")
+    assert registry.check_key_for("func_pain_txt") == "func_pain_chk"
+    assert pain.excel_cell == ("様式23_1", "H25")
+    assert pain.editable and registry.is_editable("func_pain_txt")
+    assert registry.label("func_pain_chk") == "疼痛"
+    assert registry.category("func_basic_rolling_chk") == "基本動作"
+    assert registry.category("header_disease_name_txt") == "基本情報"
+    assert registry.check_key_for("main_risks_txt") is None
+    # チェックボックスとのペアは通常項目として扱わない
+    assert "func_pain_txt" not in registry.fact_fields
+    assert registry.fact_fields["nutrition_height_val"] == ("身長(cm)", "栄養状態")
+    # 日付は writer の特殊処理で書き込む
+    assert all("date" not in key for key, *_ in registry.excel_text_cells)
+
+
+def test_validation_against_plan_columns():
+    """実際の項目定義はDBのカラムと矛盾せず、チェックボックスのペアがカラムにない場合はエラーになること"""
+    warnings = validate_field_registry()
+    assert any("cs_motor_details" in w for w in warnings)
+
+    registry = FieldRegistry(
+        {"func_pain_chk": "疼痛", "form_only_chk": "フォーム用"},
+        {"func_pain_chk": "func_pain_txt"},
+        ["main_comorbidities_txt"],
+        {"name": ("様式23_1", "F3")},
+        [],
+    )
+    errors, warnings = registry.validate({"func_pain_chk", "main_comorbidities_txt"}, {"name"})
+    assert errors == ["CHECK_TO_TEXT_MAP: 'func_pain_txt' は RehabilitationPlan のカラムにありません"]
+    assert warnings == ["CELL_NAME_MAPPING: 'form_only_chk' はDBのカラムにありません"]
@@ -0,0 +1,98 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services.llm import gemini
+from app.services.llm.cancellation import CancelToken, run_with_token
+from app.services.llm.gemini import GeminiClient
+from rag_components.rate_limiter import RateLimitTimeout
+
+
+@pytest.fixture
+def cache_env(monkeypatch):
+    """コンテキストキャッシュの状態を空にし、APIクライアントとレートリミッタを差し替える"""
+    monkeypatch.setattr(gemini, "_context_caches", {})
+    monkeypatch.setattr(gemini, "_context_cache_key_locks", {})
+    mock_client = MagicMock()
+    limiter = MagicMock()
+    monkeypatch.setattr(gemini, "client", mock_client)
+    monkeypatch.setattr(gemini, "gemini_rate_limiter", limiter)
+    return mock_client, limiter
+
+
+def test_same_prefix_is_created_once(cache_env):
+    """同じプレフィックスで並列に呼ばれても、キャッシュの作成は1回だけであること"""
+    mock_client, _ = cache_env
+    entered = threading.Event()
+    release = threading.Event()
+    cache = MagicMock()
+    cache.name = "cachedContents/1"
+
+    def slow_create(**kwargs):
+        entered.set()
+        release.wait(5)
+        return cache
+
+    mock_client.caches.create.side_effect = slow_create
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(GeminiClient()._get_context_cache("共通"))) for _ in range(3)
+    ]
+    for t in threads:
+        t.start()
+    assert entered.wait(5)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert results == ["cachedContents/1"] * 3
+    assert mock_client.caches.create.call_count == 1
+
+
+def test_slow_creation_does_not_block_other_prefixes(cache_env):
+    """あるプレフィックスの作成 (レート制限待ち・作成API) の間も、別のプレフィックスは待たされないこと"""
+    mock_client, _ = cache_env
+    entered = threading.Event()
+    release = threading.Event()
+
+    def create(model, config):
+        if config.contents == ["遅い"]:
+            entered.set()
+            release.wait(5)
+        return MagicMock(name=config.contents[0])
+
+    mock_client.caches.create.side_effect = create
+    slow = threading.Thread(target=GeminiClient()._get_context_cache, args=("遅い",))
+    slow.start()
+    try:
+        assert entered.wait(5)
+        done = threading.Event()
+        fast = threading.Thread(target=lambda: (GeminiClient()._get_context_cache("速い"), done.set()))
+        fast.start()
+        assert done.wait(2), "別のプレフィックスの作成がグローバルロックで待たされている"
+    finally:
+        release.set()
+        slow.join(5)
+
+
+def test_rate_limit_wait_is_bounded_by_time_slice(cache_env):
+    """レート制限の待ちはタイムスライスの残りまでで打ち切り、暗黙的キャッシュに任せること (失敗は記録しない)"""
+    mock_client, limiter = cache_env
+    limiter.acquire.side_effect = RateLimitTimeout("rate limit wait timed out")
+
+    token = CancelToken(deadline=gemini.time.time() + 5)
+    assert run_with_token(token, GeminiClient()._get_context_cache, "共通") is None
+
+    timeout = limiter.acquire.call_args.kwargs["timeout"]
+    assert 0 < timeout <= 5
+    mock_client.caches.create.assert_not_called()
+    assert gemini._context_caches == {}
+
+
+def test_rate_limit_wait_outside_time_slice_uses_default_timeout(cache_env):
+    _, limiter = cache_env
+    limiter.acquire.side_effect = RateLimitTimeout("rate limit wait timed out")
+
+    assert GeminiClient()._get_context_cache("共通") is None
+    assert limiter.acquire.call_args.kwargs["timeout"] == gemini.CONTEXT_CACHE_ACQUIRE_TIMEOUT_SEC
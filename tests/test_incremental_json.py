@@ -0,0 +1,214 @@
+import json
+from typing import Optional
+from unittest.mock import MagicMock, patch
+
+import pytest
+from pydantic import BaseModel, Field
+
+from app.services.llm.gemini import GeminiClient
+from app.services.llm.incremental_json import IncrementalJSONError, IncrementalJSONParser
+from app.services.llm.metrics import llm_metrics
+
+
+class StreamGroup(BaseModel):
+    first_txt: Optional[str] = Field(None, description="1つ目")
+    second_txt: Optional[str] = Field(None, description="2つ目")
+
+
+def _feed_all(parser, text, size):
+    fields = []
+    for i in range(0, len(text), size):
+        fields.extend(parser.feed(text[i:i + size]))
+    return fields
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_fields_are_emitted_regardless_of_chunk_boundaries(size):
+    text = '```json\n{"a": "引用\\"符}", "b": -12.5, "c": {"d": [1, "]"]}, "e": null, "f": true}\n```'
+    parser = IncrementalJSONParser()
+
+    fields = _feed_all(parser, text, size)
+
+    assert fields == [("a", '引用"符}'), ("b", -12.5), ("c", {"d": [1, "]"]}), ("e", None), ("f", True)]
+    assert parser.done
+    assert parser.trailing_text == "\n```"
+
+
+def test_field_is_emitted_as_soon_as_its_value_closes():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"a": "完了') == []
+    assert parser.feed('", "b": "途中') == [("a", "完了")]
+    assert parser.current_key == "b"
+    assert not parser.done
+
+
+def test_malformed_object_raises():
+    parser = IncrementalJSONParser()
+    with pytest.raises(IncrementalJSONError):
+        parser.feed('{"a": 1 "b": 2}')
+
+
+@patch("app.services.llm.gemini.GENERATION_GROUPS", [StreamGroup])
+@patch("app.services.llm.gemini.client")
+def test_gemini_plan_stream_sends_fields_before_group_finishes(mock_genai_client):
+    """グループのJSONが完成する前に、値が閉じたフィールドから update イベントが送られること"""
+    llm_metrics.clear()
+    sent_chunks = []
+
+    def fake_stream(**kwargs):
+        for text in ['{"first_txt": "最初', 'の項目", "second', '_txt": "次の項目"}']:
+            sent_chunks.append(text)
+            chunk = MagicMock()
+            chunk.text = text
+            yield chunk
+
+    mock_genai_client.models.generate_content_stream.side_effect = fake_stream
+
+    stream = GeminiClient().generate_plan_stream({"name": "テスト"})
+    first = next(stream)
+
+    # 1つ目の項目は、3つ目のチャンクを受け取る前に送信される
+    assert json.loads(first.split("\n")[1][len("data: "):])["key"] == "first_txt"
+    assert len(sent_chunks) == 2
+
+    rest = list(stream)
+    keys = [json.loads(e.split("\n")[1][len("data: "):])["key"] for e in rest if e.startswith("event: update")]
+    assert keys == ["second_txt"]
+    assert rest[-1].startswith("event: general_finished")
+
+    stats = llm_metrics.get_stats()
+    assert stats["gemini.time_to_first_field"]["count"] == 1
+    assert stats["gemini.group_time_to_first_field"]["count"] == 1
+
+
+class OllamaStreamGroup(BaseModel):
+    func_pain_txt: Optional[str] = Field(None, description="疼痛")
+    second_txt: Optional[str] = Field(None, description="2つ目")
+
+
+@patch("app.services.llm.ollama.GENERATION_GROUPS", [OllamaStreamGroup])
+@patch("app.services.llm.ollama.OllamaClient._chat")
+def test_ollama_plan_stream_sends_validated_fields_incrementally(mock_chat):
+    """Ollamaのストリームも、値が閉じたフィールドから後処理を適用して送信されること"""
+    from app.services.llm.ollama import OllamaClient
+
+    sent_chunks = []
+
+    def fake_stream(**kwargs):
+        pieces = ['<think>{考え中}</think>\n{"func_pain', '_txt": "右肩痛", "second_txt": ', '"途中', 'の文章"}']
+        for text in pieces:
+            sent_chunks.append(text)
+            yield {"message": {"content": text}}
+
+    mock_chat.side_effect = fake_stream
+
+    # func_pain_chk が False のため、疼痛の文章は後処理で「特記なし」になる
+    stream = OllamaClient().generate_plan_stream({"name": "テスト", "func_pain_chk": False})
+    first = json.loads(next(stream).split("\n")[1][len("data: "):])
+
+    assert first == {"key": "func_pain_txt", "value": "特記なし", "model_type": "ollama_general"}
+    assert len(sent_chunks) == 2
+
+    rest = list(stream)
+    second = json.loads(rest[0].split("\n")[1][len("data: "):])
+    assert second["key"] == "second_txt"
+    assert second["value"] == "途中の文章"
+    assert rest[-1].startswith("event: general_finished")
+
+
+@patch("app.services.llm.ollama.time.sleep")
+@patch("app.services.llm.ollama.GENERATION_GROUPS", [OllamaStreamGroup])
+@patch("app.services.llm.ollama.OllamaClient._chat")
+def test_ollama_plan_stream_aborts_on_unknown_key_and_retries_missing_fields(mock_chat, mock_sleep):
+    """スキーマ外のキーが現れた時点で読み取りを打ち切り、再試行では未取得のフィールドだけを依頼すること"""
+    from app.services.llm.metrics import llm_retry_stats
+    from app.services.llm.ollama import OllamaClient
+
+    llm_retry_stats.clear()
+    prompts = []
+    closed = []
+    read_after_abort = []
+
+    def broken_stream():
+        try:
+            yield {"message": {"content": '{"func_pain_txt": "右肩痛", "unknown'}}
+            yield {"message": {"content": '_key": "'}}
+            read_after_abort.append(True)
+            yield {"message": {"content": 'ここは読まれない"}'}}
+        finally:
+            closed.append(True)
+
+    def fixed_stream():
+        yield {"message": {"content": '{"second_txt": "再試行の文章"}'}}
+
+    def fake_chat(**kwargs):
+        prompts.append(kwargs["messages"][0]["content"])
+        return broken_stream() if len(prompts) == 1 else fixed_stream()
+
+    mock_chat.side_effect = fake_chat
+
+    events = list(OllamaClient().generate_plan_stream({"name": "テスト", "func_pain_chk": True}))
+    updates = [json.loads(e.split("\n")[1][len("data: "):]) for e in events if e.startswith("event: update")]
+
+    assert [u["key"] for u in updates] == ["func_pain_txt", "second_txt"]
+    assert closed == [True]
+    assert read_after_abort == []
+
+    # 2回目のプロンプトは残りのフィールドだけを対象にする
+    assert len(prompts) == 2
+    schema_part = prompts[1].split("```json")[-1]
+    assert "second_txt" in schema_part
+    assert "func_pain_txt" not in schema_part
+    assert not any(e.startswith("event: error") for e in events)
+
+    stats = llm_retry_stats.get_stats()["ollama.plan.OllamaStreamGroup"]
+    assert stats["attempts"] == 2
+    assert stats["retries"] == 1
+    assert stats["failures"] == 0
+
+
+def test_partial_string_waits_for_complete_escape_sequences():
+    """読み取り中の文字列値は、途中までのエスケープを含めずに返されること"""
+    parser = IncrementalJSONParser()
+    parser.feed('{"text": "一行目\\')
+    assert parser.partial_string == "一行目"
+    parser.feed('n二行目\\u30')
+    assert parser.partial_string == "一行目\n二行目"
+    parser.feed('a2')
+    assert parser.partial_string == "一行目\n二行目ア"
+    parser.feed('"}')
+    assert parser.partial_string is None
+    assert parser.fields == {"text": "一行目\n二行目ア"}
+
+
+@patch("app.services.llm.ollama.OllamaClient._chat")
+def test_ollama_regeneration_streams_coalesced_chunks(mock_chat):
+    """再生成では、モデルの出力を文単位にまとめて (1文字ずつではなく) 送信すること"""
+    from app.services.llm.ollama import OllamaClient
+
+    pieces = ['{"func_pain_txt": "', "右肩に", "痛みが", "あります。", "無理の", "ない範囲で", "動かします。", '"}']
+    mock_chat.return_value = iter([{"message": {"content": text}} for text in pieces])
+
+    events = list(OllamaClient().regenerate_plan_item_stream({"name": "テスト"}, "func_pain_txt", "旧", "わかりやすく"))
+    chunks = [json.loads(e.split("\n")[1][len("data: "):])["chunk"] for e in events if e.startswith("event: update")]
+
+    assert chunks == ["右肩に痛みがあります。", "無理のない範囲で動かします。"]
+    assert events[-1].startswith("event: finished")
+
+
+@patch("app.services.llm.ollama.time.sleep")
+@patch("app.services.llm.ollama.OllamaClient._chat")
+def test_ollama_regeneration_resets_partial_text_before_retry(mock_chat, mock_sleep):
+    """途中まで送信した後に失敗した場合、reset イベントで取り消してから再試行すること"""
+    from app.services.llm.ollama import OllamaClient
+
+    mock_chat.side_effect = [
+        iter([{"message": {"content": text}} for text in ['{"func_pain_txt": "途中まで。', '", "extra": }']]),
+        iter([{"message": {"content": '{"func_pain_txt": "やり直した文章。"}'}}]),
+    ]
+
+    events = list(OllamaClient().regenerate_plan_item_stream({"name": "テスト"}, "func_pain_txt", "旧", "わかりやすく"))
+    names = [e.split("\n")[0] for e in events]
+
+    assert names == ["event: update", "event: reset", "event: update", "event: finished"]
+    assert json.loads(events[2].split("\n")[1][len("data: "):])["chunk"] == "やり直した文章。"
@@ -79,4 +79,31 @@ def test_parser_hybrid_integration(MockFastExtractor, mock_get_llm, mock_llm_cli
     assert result['goals_at_discharge_txt'] == "自宅退院"
     
     # 5. チェックボックス復元ロジックの確認 (rolling_level='independent' -> rolling_chk=True)
-    assert result.get('func_basic_rolling_chk') is True
\ No newline at end of file
+    assert result.get('func_basic_rolling_chk') is True
+
+@patch('app.services.llm.patient_info_parser.get_llm_client')
+@patch('app.services.llm.patient_info_parser.FastExtractor')
+def test_parser_stream_events(MockFastExtractor, mock_get_llm, mock_llm_client):
+    """
+    parse_text_stream がFastExtractor・各グループの完了ごとにイベントを返し、
+    最後にチェックボックス復元後の統合結果と所要時間を返すこと
+    """
+    mock_get_llm.return_value = mock_llm_client
+    MockFastExtractor.return_value.extract_facts.return_value = {"func_motor_paralysis_chk": True}
+
+    parser = PatientInfoParser(use_hybrid_mode=True)
+    events = list(parser.parse_text_stream(SAMPLE_TEXT))
+
+    assert [e["event"] for e in events] == ["facts", "group", "group", "final"]
+    assert events[0]["data"] == {"func_motor_paralysis_chk": True}
+    assert events[1]["group"] == "HybridCombined_Extraction"
+    assert events[1]["status"] == "success"
+    assert events[2]["group"] == "HybridCombined_Plan"
+
+    final = events[-1]
+    # 統合結果はチェックボックス復元済み
+    assert final["data"]["func_basic_rolling_chk"] is True
+    assert final["data"]["goals_at_discharge_txt"] == "自宅退院"
+    assert set(final["timings"]) == {"FastExtractor", "HybridCombined_Extraction", "HybridCombined_Plan"}
+    # JSONとしてそのままSSEに載せられること
+    json.dumps(final, ensure_ascii=False, default=str)
@@ -139,12 +139,13 @@ def test_gemini_streaming_flow(mock_genai_client, sample_patient_data):
     client = GeminiClient()
 
     # ストリーミング生成のモック (GENERATION_GROUPSのループ内で呼ばれる)
-    mock_response = MagicMock()
-    # ダミーの生成結果 (Pydanticモデルのダンプを想定)
-    mock_response.parsed.model_dump.return_value = {
-        "header_disease_name_txt": "生成された病名"
-    }
-    mock_genai_client.models.generate_content.return_value = mock_response
+    # JSONが複数のチャンクに分割されて届く想定
+    def fake_stream(**kwargs):
+        for text in ['{"func_rom_', 'limitation_txt": "生成された', '可動域制限"}']:
+            chunk = MagicMock()
+            chunk.text = text
+            yield chunk
+    mock_genai_client.models.generate_content_stream.side_effect = fake_stream
 
     # ジェネレータを実行
     stream = client.generate_plan_stream(sample_patient_data)
@@ -210,7 +211,7 @@ def test_rag_integration_flow(mock_rag_executor):
 
 # --- 5. Ollamaクライアントのテスト (JSONモード) ---
 
-@patch("app.services.llm.ollama.ollama.chat")
+@patch("app.services.llm.ollama.OllamaClient._chat")
 def test_ollama_json_mode(mock_ollama_chat):
     """
     [判定項目]:
@@ -231,6 +232,28 @@ def test_ollama_json_mode(mock_ollama_chat):
         args, kwargs = mock_ollama_chat.call_args
         assert kwargs["format"] == "json"  # JSONモードが有効になっているか
 
+
+@patch("app.services.llm.ollama.OllamaClient._chat")
+def test_ollama_schema_format_mode(mock_ollama_chat):
+    """
+    [判定項目]:
+    - スキーマ指定モードでは、全項目を必須にしたJSONスキーマが format に渡されるか
+    """
+    client = OllamaClient()
+    mock_ollama_chat.return_value = {
+        "message": {"content": json.dumps({"summary": "Ollama結果", "risk_level": 1})}
+    }
+
+    with patch("app.services.llm.ollama.OLLAMA_USE_STRUCTURED_OUTPUT", True), \
+         patch("app.services.llm.ollama.OLLAMA_USE_SCHEMA_FORMAT", True):
+        result = client.generate_json("prompt", SchemaForTest)
+
+    assert result == {"summary": "Ollama結果", "risk_level": 1}
+    schema_format = mock_ollama_chat.call_args.kwargs["format"]
+    assert set(schema_format["properties"]) == {"summary", "risk_level"}
+    assert set(schema_format["required"]) == {"summary", "risk_level"}
+    assert schema_format["additionalProperties"] is False
+
 # --- 全体のまとめテスト ---
 
 def test_full_component_integration():
@@ -79,18 +79,21 @@ def test_gemini_retry_logic(mock_genai_client):
         mock_response                        # 3回目 (成功)
     ]
 
-    # 時間待ちを短縮するためにtime.sleepをモック
-    with patch("time.sleep") as mock_sleep:
+    # 時間待ちを短縮するためにtime.sleepをモック (共有リミッタの一斉停止もモックする)
+    with patch("time.sleep") as mock_sleep, \
+         patch("app.services.llm.gemini.gemini_rate_limiter.pause") as mock_pause:
         client.generate_json("prompt", MockSchema)
 
         # 3回呼ばれたか確認
         assert mock_genai_client.models.generate_content.call_count == 3
         # sleepが呼ばれたか確認 (バックオフの検証)
         assert mock_sleep.call_count == 2
+        # 他の呼び出しも待たせるよう、共有リミッタに通知されたか確認
+        assert mock_pause.call_count == 2
 
 # --- 2. Ollamaクライアントの詳細テスト ---
 
-@patch("app.services.llm.ollama.ollama.chat")
+@patch("app.services.llm.ollama.OllamaClient._chat")
 def test_ollama_api_parameters(mock_ollama_chat):
     """
     [Ollama] API呼び出し時のパラメータ(options, format)が正しいか検証
@@ -119,13 +122,14 @@ def test_ollama_api_parameters(mock_ollama_chat):
 
         # オプション設定 (temperatureなど)
         assert "options" in kwargs
-        assert kwargs["options"]["temperature"] == 0.2
+        # 抽出は温度0 (応答キャッシュの対象)
+        assert kwargs["options"]["temperature"] == 0.0
         assert kwargs["options"]["num_ctx"] == 8192
 
         # プロンプト
         assert kwargs["messages"][0]["content"] == prompt_text
 
-@patch("app.services.llm.ollama.ollama.chat")
+@patch("app.services.llm.ollama.OllamaClient._chat")
 def test_ollama_response_parsing(mock_ollama_chat):
     """
     [Ollama] 返されたJSONのパース処理（思考タグの除去など）を検証
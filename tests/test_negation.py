@@ -54,4 +54,30 @@ class TestNegationDetector:
         text = "麻痺なし"
         keyword = "麻痺"
         # nlpを使わずに簡易メソッドを呼ぶ
-        assert negation_detector.check_snippet_negation(text, keyword) is True
\ No newline at end of file
+        assert negation_detector.check_snippet_negation(text, keyword) is True
+
+    def test_token_index_reused_per_doc(self, negation_detector):
+        """同じdocに対する複数回の判定でトークンインデックスが再利用されるか"""
+        text = "麻痺なし。疼痛あり。"
+        doc = negation_detector.nlp(text)
+
+        assert negation_detector.is_negated(text, {'start': 0, 'end': 2, 'text': "麻痺"}, doc) is True
+        token_starts = negation_detector._token_index[1]
+        assert token_starts == [token.idx for token in doc]
+
+        assert negation_detector.is_negated(text, {'start': 5, 'end': 7, 'text': "疼痛"}, doc) is False
+        assert negation_detector._token_index[1] is token_starts
+
+    def test_find_target_token_matches_linear_scan(self, negation_detector):
+        """二分探索による代表トークン特定が、全トークン走査と同じ結果になるか"""
+        text = "明らかな運動麻痺は認めず、右片麻痺と感覚障害のみ。"
+        doc = negation_detector.nlp(text)
+
+        for start in range(len(text)):
+            for end in range(start + 1, len(text) + 1):
+                expected = None
+                for token in doc:
+                    if start <= token.idx < end:
+                        expected = token
+                found = negation_detector._find_target_token(doc, start, end)
+                assert (found.i if found else None) == (expected.i if expected else None)
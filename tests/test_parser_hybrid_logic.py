@@ -1,6 +1,7 @@
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import threading
 import unittest
 from unittest.mock import MagicMock, patch
 import json
@@ -108,5 +109,49 @@ class TestPatientInfoParserHybrid(unittest.TestCase):
 
         print("\n=== 全テスト成功: ロジックは正しく実装されています ===")
 
+    @patch('app.services.llm.patient_info_parser.get_llm_client')
+    @patch('app.services.llm.patient_info_parser.FastExtractor')
+    def test_extraction_overlaps_standardization(self, MockFastExtractor, mock_get_llm_client):
+        """
+        パイプライン実行の検証
+        1. Extractionは標準化の完了を待たずに開始されるか
+        2. Planのプロンプトに事実情報とExtractionの結果が両方含まれているか
+        """
+        mock_llm = MagicMock()
+        mock_get_llm_client.return_value = mock_llm
+
+        extraction_started = threading.Event()
+        observed = {}
+
+        def generate_text_side_effect(prompt):
+            # 標準化の実行中にExtractionが始まっていることを確認する
+            observed["overlapped"] = extraction_started.wait(timeout=5)
+            return "- 標準化されたテキスト"
+
+        prompts = {}
+
+        def generate_json_side_effect(prompt, schema):
+            prompts[schema.__name__] = prompt
+            if schema is HybridCombined_Extraction:
+                extraction_started.set()
+                return {"adl_eating_fim_current_val": 6}
+            return {"goals_at_discharge_txt": "自宅復帰"}
+
+        mock_llm.generate_text.side_effect = generate_text_side_effect
+        mock_llm.generate_json.side_effect = generate_json_side_effect
+        MockFastExtractor.return_value.extract_facts.return_value = {"func_pain_chk": True}
+
+        parser = PatientInfoParser(use_hybrid_mode=True)
+        result = parser.parse_text("食事は見守り。痛みあり。")
+
+        self.assertTrue(observed["overlapped"])
+        # Extraction は事実情報を待たずに開始されるため、事実情報欄は空になる
+        self.assertIn("```json\n    {}\n    ```", prompts["HybridCombined_Extraction"])
+        self.assertIn('"func_pain_chk": true', prompts["HybridCombined_Plan"])
+        self.assertIn("adl_eating_fim_current_val", prompts["HybridCombined_Plan"])
+        self.assertTrue(result["func_pain_chk"])
+        self.assertEqual(result["adl_eating_fim_current_val"], 6)
+        self.assertEqual(result["goals_at_discharge_txt"], "自宅復帰")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
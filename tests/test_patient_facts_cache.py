@@ -0,0 +1,41 @@
+from app.crud import plan as plan_crud
+from app.models import Patient
+from app.services.llm.context_builder import PatientFactsCache, patient_facts_cache, prepare_patient_facts
+
+
+def test_facts_are_reused_per_patient_plan_and_notes():
+    """患者ID・計画書ID・所見が同じ間は整形済みの事実情報を使い回し、どれかが変われば作り直すこと"""
+    cache = PatientFactsCache()
+    patient_data = {"patient_id": 1, "plan_id": 10, "age": 80, "gender": "女", "therapist_notes": "意欲的"}
+
+    facts, facts_str = cache.get(patient_data)
+    assert facts == prepare_patient_facts(patient_data)
+    assert cache.get(dict(patient_data)) == (facts, facts_str)
+    assert cache.get({**patient_data, "therapist_notes": " 意欲的 "})[1] == facts_str
+
+    assert cache.get({**patient_data, "therapist_notes": "転倒に注意"})[0]["担当者からの所見"] == "転倒に注意"
+    cache.get({**patient_data, "plan_id": 11})
+    # 患者IDがないデータはキャッシュしない
+    cache.get({"age": 80})
+    cache.get({"age": 80})
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 5, 3)
+
+    cache.invalidate(1)
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_save_new_plan_invalidates_patient_facts(app, db_session):
+    """計画書を保存すると、その患者のメモ化した事実情報が破棄されること"""
+    patient = Patient(name="Facts Cache Patient", gender="女性")
+    db_session.add(patient)
+    db_session.commit()
+
+    patient_facts_cache.get({"patient_id": patient.patient_id, "plan_id": None, "therapist_notes": ""})
+    patient_facts_cache.get({"patient_id": patient.patient_id + 1, "plan_id": None, "therapist_notes": ""})
+    assert patient_facts_cache.get_stats()["entries"] == 2
+
+    plan_crud.save_new_plan(patient.patient_id, None, {"main_risks_txt": "転倒"})
+
+    assert patient_facts_cache.get_stats()["entries"] == 1
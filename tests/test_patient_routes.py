@@ -1,4 +1,5 @@
 from datetime import date
+from unittest.mock import MagicMock
 
 from flask import url_for
 
@@ -118,3 +119,19 @@ def test_save_patient_info_update(login_staff, app, db_session):
     db_session.expire_all()
     updated_patient = db_session.query(Patient).filter_by(patient_id=patient.patient_id).first()
     assert updated_patient.gender == "女性"
+
+
+def test_parse_patient_info_keeps_missing_groups_out_of_form_data(login_staff, app, mocker):
+    """解析APIは、欠けているグループ名をフォーム用の本文ではなくヘッダーで返す"""
+    mock_parser = MagicMock()
+    mock_parser.parse_text_with_missing_groups.return_value = ({"name": "テスト"}, ["PatientInfo_Social"])
+    mocker.patch("app.routers.patient.patient_info_parser", mock_parser)
+
+    with app.test_request_context():
+        target_url = url_for('patient.api_parse_patient_info')
+
+    response = login_staff.post(target_url, json={"text": "右片麻痺あり。"})
+
+    assert response.status_code == 200
+    assert response.json == {"name": "テスト"}
+    assert response.headers["X-Missing-Groups"] == "PatientInfo_Social"
@@ -0,0 +1,69 @@
+import json
+from unittest.mock import patch
+
+from app.schemas.schemas import ComprehensiveTreatmentPlan, CurrentAssessment, Goals
+from app.services.llm.gemini import GeminiClient
+from app.services.llm.plan_snapshots import fields_to_regenerate, plan_snapshot_store
+
+
+def _updates(events):
+    return {
+        data["key"]: data["value"]
+        for data in (json.loads(e.split("\n")[1][len("data: "):]) for e in events if e.startswith("event: update"))
+    }
+
+
+def test_fields_to_regenerate_follows_fact_and_upstream_dependencies():
+    """所見だけが変わった場合は所見を参照する項目だけを、前段の項目が変わった場合はグループ全体を生成し直すこと"""
+    plan = {field: "前回" for group in (CurrentAssessment, Goals) for field in group.model_fields}
+    snapshot = {"facts": {}, "plan": plan}
+
+    stale = fields_to_regenerate(CurrentAssessment, snapshot, {"担当者からの所見"}, {})
+    assert stale == ["main_risks_txt", "main_contraindications_txt"]
+    assert fields_to_regenerate(CurrentAssessment, snapshot, set(), {}) == []
+
+    so_far = {field: "前回" for field in CurrentAssessment.model_fields}
+    assert fields_to_regenerate(Goals, snapshot, set(), so_far) == []
+    so_far["main_risks_txt"] = "今回"
+    assert fields_to_regenerate(Goals, snapshot, set(), so_far) == list(Goals.model_fields)
+
+
+@patch("app.services.llm.gemini.client")
+def test_gemini_incremental_generation_reuses_unchanged_fields(mock_genai_client):
+    """差分生成では、所見の変更に関係しない項目を再生成せず、前回の結果を送ること"""
+    plan_snapshot_store.clear()
+    requested = []
+    run = {"n": 0}
+
+    def fake_stream_group_fields(self, prompt, config, schema):
+        requested.append(list(schema.model_fields))
+        for field in schema.model_fields:
+            yield field, f"{field}-{run['n']}"
+
+    patient = {"patient_id": 1, "age": 80, "gender": "女", "therapist_notes": "意欲的", "func_pain_chk": True}
+    with patch.object(GeminiClient, "_stream_group_fields", fake_stream_group_fields):
+        run["n"] = 1
+        list(GeminiClient().generate_plan_stream(patient, incremental=True))
+        assert len(requested) == 3
+
+        requested.clear()
+        run["n"] = 2
+        events = list(GeminiClient().generate_plan_stream({**patient, "therapist_notes": "転倒に注意"}, incremental=True))
+
+        values = _updates(events)
+        assert requested[0] == ["main_risks_txt", "main_contraindications_txt"]
+        assert values["func_pain_txt"] == "func_pain_txt-1"
+        assert values["main_risks_txt"] == "main_risks_txt-2"
+        # 前段のリスクが変わったため、目標と治療計画は全項目を生成し直す
+        assert requested[1:] == [list(Goals.model_fields), list(ComprehensiveTreatmentPlan.model_fields)]
+        assert events[-1].startswith("event: general_finished")
+
+        requested.clear()
+        events = list(GeminiClient().generate_plan_stream({**patient, "therapist_notes": "転倒に注意"}, incremental=True))
+        assert requested == []
+        assert _updates(events)["goals_1_month_txt"] == "goals_1_month_txt-2"
+
+    stats = plan_snapshot_store.get_stats()
+    assert stats["regenerated_fields"] == 2 + len(Goals.model_fields) + len(ComprehensiveTreatmentPlan.model_fields)
+    all_fields = len(CurrentAssessment.model_fields) + len(Goals.model_fields) + len(ComprehensiveTreatmentPlan.model_fields)
+    assert stats["reused_fields"] == len(CurrentAssessment.model_fields) - 2 + all_fields
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.schemas.schemas import (
+    PATIENT_INFO_EXTRACTION_GROUPS,
+    ComprehensiveTreatmentPlan,
+    PatientInfo_ADL,
+    PatientInfo_Basic,
+)
+from app.services.llm.metrics import llm_metrics
+from app.services.llm.mock import MockLLMClient, approximate_tokens
+from app.services.llm.patient_info_parser import PatientInfoParser
+from app.services.llm.prompts import build_group_prompt
+from app.services.llm.schema_registry import schema_registry
+
+CHART_TEXT = "80代女性。右大腿骨頸部骨折術後。食事は自立、トイレ動作は見守り。疼痛NRS 3/10。" * 20
+
+
+def _parse_with_layout(monkeypatch, layout: str) -> MockLLMClient:
+    monkeypatch.setenv("PARSER_PROMPT_LAYOUT", layout)
+    mock_client = MockLLMClient(num_slots=1)
+    with patch('app.services.llm.patient_info_parser.get_llm_client', return_value=mock_client):
+        parser = PatientInfoParser(use_hybrid_mode=False, max_concurrency=1)
+        parser.parse_text(CHART_TEXT)
+    return mock_client
+
+
+def test_prefix_is_identical_across_groups(monkeypatch):
+    monkeypatch.setenv("PARSER_PROMPT_LAYOUT", "shared_prefix")
+    with patch('app.services.llm.patient_info_parser.get_llm_client', return_value=MockLLMClient()):
+        parser = PatientInfoParser(use_hybrid_mode=False)
+
+    prefix_a, suffix_a = parser._build_prompt_parts(CHART_TEXT, PatientInfo_Basic, {})
+    prefix_b, suffix_b = parser._build_prompt_parts(CHART_TEXT, PatientInfo_ADL, {"age": 80})
+
+    assert prefix_a == prefix_b
+    assert CHART_TEXT in prefix_a
+    # スキーマとサマリーはサフィックス側にのみ置かれる
+    assert "adl_eating_fim_current_val" in suffix_b and "adl_eating_fim_current_val" not in prefix_a
+    assert '"age": 80' in suffix_b
+    assert parser._build_prompt(CHART_TEXT, PatientInfo_ADL, {}) == prefix_b + parser._build_prompt_parts(CHART_TEXT, PatientInfo_ADL, {})[1]
+
+
+def test_mock_backend_counts_reused_prefix_tokens(monkeypatch):
+    shared = _parse_with_layout(monkeypatch, "shared_prefix").get_stats()
+    legacy = _parse_with_layout(monkeypatch, "legacy").get_stats()
+
+    assert shared["calls"] == legacy["calls"] == len(PATIENT_INFO_EXTRACTION_GROUPS)
+    # 共通プレフィックス型では、2回目以降の呼び出しでカルテ全文分のトークンが再利用される
+    chart_tokens = len(approximate_tokens(CHART_TEXT))
+    assert shared["reused_prefix_tokens"] >= chart_tokens * (shared["calls"] - 1)
+    assert shared["reused_prefix_tokens"] > legacy["reused_prefix_tokens"]
+
+
+def test_mock_backend_reuse_with_multiple_slots():
+    client = MockLLMClient(num_slots=2)
+    client.generate_text("AAAA BBBB")
+    client.generate_text("CCCC")
+    client.generate_text("AAAA DDDD")
+    stats = client.get_stats()
+    # 2スロットあれば1つ前以外のプロンプトとも共通部分を再利用できる ("AAAA" と空白)
+    assert stats["reused_prefix_tokens"] == 2
+    assert stats["reuse_ratio"] == pytest.approx(2 / stats["prompt_tokens"], abs=1e-4)
+
+
+def test_group_prompt_includes_only_declared_dependencies():
+    """計画書の生成グループには、依存関係に宣言された前段の項目だけがコンパクトなJSONで渡されること"""
+    llm_metrics.clear()
+    plan_so_far = {
+        "main_comorbidities_txt": "高血圧症・糖尿病",
+        "main_risks_txt": "転倒",
+        "func_pressure_ulcer_txt": "仙骨部に発赤あり",
+        "goals_1_month_txt": "屋内歩行自立",
+    }
+
+    prompt = build_group_prompt(ComprehensiveTreatmentPlan, "{}", plan_so_far)
+
+    assert '{"main_risks_txt":"転倒","goals_1_month_txt":"屋内歩行自立"}' in prompt
+    assert "仙骨部に発赤あり" not in prompt
+    assert "高血圧症・糖尿病" not in prompt
+
+    # 部分スキーマでの再試行では、元のグループの依存関係と保持済みの項目を使う
+    plan_so_far["policy_treatment_txt"] = "早期離床を図る"
+    partial = schema_registry.partial_schema(ComprehensiveTreatmentPlan, ("policy_content_txt",))
+    prompt = build_group_prompt(partial, "{}", plan_so_far, context_group=ComprehensiveTreatmentPlan)
+
+    assert "早期離床を図る" in prompt
+    assert "仙骨部に発赤あり" not in prompt
+    assert llm_metrics.get_stats()["prompt_tokens.ComprehensiveTreatmentPlan"]["count"] == 2
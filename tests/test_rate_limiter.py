@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+# Rehab_RAG を sys.path に追加してから rag_components を読み込む
+import app.services.llm.rehab_rag_path  # noqa: F401
+from rag_components.rate_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RateLimiter,
+    RateLimitTimeout,
+    get_rate_limiter,
+    priority_scope,
+)
+
+
+def test_acquire_waits_until_tokens_are_refilled():
+    """TPMの枠を使い切った後は、必要なトークン数が補充されるまで待つこと"""
+    limiter = RateLimiter("test", requests_per_minute=1000, tokens_per_minute=600)  # 10トークン/秒
+
+    assert limiter.acquire(600) < 0.05
+    waited = limiter.acquire(3)
+
+    assert 0.2 <= waited < 1.0
+    stats = limiter.get_stats()["wait_time"]["interactive"]
+    assert stats["count"] == 2
+    assert stats["histogram"][">=0.1s"] == 1
+
+
+def test_interactive_calls_are_served_before_background_calls():
+    """先に待っていてもバックグラウンドの呼び出しは、画面操作の呼び出しの後に通過すること"""
+    limiter = RateLimiter("test", requests_per_minute=1000, tokens_per_minute=600)
+    limiter.acquire(600)
+    order = []
+
+    def background():
+        with priority_scope(PRIORITY_BACKGROUND):
+            limiter.acquire(3)
+        order.append("background")
+
+    thread = threading.Thread(target=background)
+    thread.start()
+    time.sleep(0.05)
+    limiter.acquire(3, priority=PRIORITY_INTERACTIVE)
+    order.append("interactive")
+    thread.join(timeout=5)
+
+    assert order == ["interactive", "background"]
+    assert set(limiter.get_stats()["wait_time"]) == {"interactive", "background"}
+
+
+def test_pause_and_timeout():
+    """pause() 中の呼び出しは待たされ、timeout までに通過できなければ RateLimitTimeout になること"""
+    limiter = RateLimiter("test", requests_per_minute=1000, tokens_per_minute=1000)
+    limiter.pause(5)
+
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(1, timeout=0.1)
+    assert limiter.get_stats()["waiting"] == 0
+
+
+def test_get_rate_limiter_is_shared_and_reads_env(monkeypatch):
+    """同じ名前のリミッタは共有され、上限は環境変数で指定できること"""
+    monkeypatch.setenv("GEMINI_EMBEDDING_RPM", "42")
+    from rag_components import rate_limiter
+
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    limiter = get_rate_limiter("gemini-embedding", requests_per_minute=100)
+
+    assert limiter is get_rate_limiter("gemini-embedding")
+    assert limiter.requests_per_minute == 42
@@ -0,0 +1,112 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from pydantic import BaseModel
+
+# Rehab_RAG を sys.path に追加してから rag_components を読み込む
+import app.services.llm.rehab_rag_path  # noqa: F401
+from rag_components.response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CacheTestSchema(BaseModel):
+    summary: str
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    """メモリ層にない応答もディスク層 (SQLite) から返し、ヒットした層が site ごとに記録されること"""
+    path = str(tmp_path / "cache.sqlite3")
+    key = ResponseCache.make_key("model", "prompt", CacheTestSchema, 0.0)
+
+    ResponseCache(path=path).put(key, {"summary": "結果"})
+    cache = ResponseCache(path=path)
+
+    assert cache.get(key, site="json") == {"summary": "結果"}
+    assert cache.get(key, site="json") == {"summary": "結果"}
+    assert cache.get(ResponseCache.make_key("model", "prompt", CacheTestSchema, 0.0, max_output_tokens=10), site="json") is None
+
+    stats = cache.get_stats()
+    assert stats["sites"]["json"] == {
+        "hits": 2, "misses": 1, "memory_hits": 1, "disk_hits": 1, "bypassed": 0, "hit_ratio": 0.667,
+    }
+    assert stats["disk"]["entries"] == 1
+
+
+def test_ttl_and_lru_eviction(tmp_path):
+    """TTLを過ぎたエントリは返さず、メモリ層は max_entries 件まで、ディスク層は上限サイズまでに削られること"""
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=2, ttl_sec=60, path=None, clock=clock)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    cache.get("a")
+    cache.put("c", "C")  # 最後に使われたのが古い "b" が追い出される
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    clock.now += 61
+    assert cache.get("a") is None
+
+    disk_cache = ResponseCache(path=str(tmp_path / "small.sqlite3"), disk_max_mb=250 / (1024 * 1024))
+    for i in range(5):
+        disk_cache.put(f"key{i}", "x" * 100)
+    assert disk_cache.get_stats()["disk"]["entries"] == 2
+
+
+def test_ollama_extraction_and_standardization_are_cached():
+    """温度0で呼び出す抽出 (generate_json) と標準化 (generate_text) は、2回目以降キャッシュから返すこと"""
+    from app.services.llm.ollama import OllamaClient
+
+    cache = ResponseCache(path=None)
+    with patch("app.services.llm.ollama.get_response_cache", return_value=cache), \
+         patch("app.services.llm.ollama.OllamaClient._chat") as mock_chat:
+        client = OllamaClient()
+        mock_chat.return_value = {"message": {"content": " 高血圧症あり "}}
+        assert client.generate_text("標準化して") == "高血圧症あり"
+        assert client.generate_text("標準化して") == "高血圧症あり"
+        assert mock_chat.call_count == 1
+
+        mock_chat.return_value = {"message": {"content": json.dumps({"summary": "要約"})}}
+        assert client.generate_json("抽出して", CacheTestSchema) == {"summary": "要約"}
+        assert client.generate_json("抽出して", CacheTestSchema) == {"summary": "要約"}
+        assert mock_chat.call_count == 2
+
+    sites = cache.get_stats()["sites"]
+    assert sites["ollama.text"]["hits"] == 1
+    assert sites["ollama.json.CacheTestSchema"]["hits"] == 1
+
+
+def test_gemini_extraction_is_cached():
+    """Geminiの抽出 (generate_json) は温度0を明示し、同じプロンプトの2回目はAPIを呼ばないこと"""
+    from app.services.llm.gemini import GeminiClient
+
+    cache = ResponseCache(path=None)
+    response = MagicMock(parsed=None, text=json.dumps({"summary": "要約"}))
+    with patch("app.services.llm.gemini.get_response_cache", return_value=cache), \
+         patch("app.services.llm.gemini.client") as mock_client:
+        mock_client.models.generate_content.return_value = response
+        client = GeminiClient()
+        assert client.generate_json("抽出して", CacheTestSchema) == {"summary": "要約"}
+        assert client.generate_json("抽出して", CacheTestSchema) == {"summary": "要約"}
+
+    assert mock_client.models.generate_content.call_count == 1
+    assert mock_client.models.generate_content.call_args.kwargs["config"].temperature == 0.0
+    assert cache.get_stats()["sites"]["gemini.json.CacheTestSchema"]["hits"] == 1
+
+
+def test_disk_tier_is_opt_in(monkeypatch):
+    """LLM_CACHE_PATH を指定しない限り、共有キャッシュは応答をディスクに保存しないこと"""
+    from rag_components import response_cache
+
+    monkeypatch.delenv("LLM_CACHE_PATH", raising=False)
+    monkeypatch.setattr(response_cache, "_response_cache", None)
+    cache = response_cache.get_response_cache()
+
+    assert cache.path is None
+    assert cache.get_stats()["disk"] is None
@@ -0,0 +1,96 @@
+import json
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel, Field
+
+from app.schemas.schemas import CurrentAssessment, HybridCombined_Extraction
+from app.services.llm.prompts import build_group_prompt
+from app.services.llm.schema_registry import SchemaRegistry, optimize_schema_for_prompt
+
+
+class TitleFieldSchema(BaseModel):
+    """titleという名前のフィールドを持つスキーマ"""
+    title: Optional[str] = Field(None, description="見出し")
+    func_pain_txt: Optional[str] = Field(None, description="疼痛")
+
+
+def test_artifacts_are_computed_once_per_schema():
+    registry = SchemaRegistry()
+
+    first = registry.prompt_schema(HybridCombined_Extraction, filter_mode=True)
+    second = registry.prompt_schema(HybridCombined_Extraction, filter_mode=True)
+    assert first is second
+    # filter_mode が異なれば別のエントリになる
+    assert registry.prompt_schema(HybridCombined_Extraction, filter_mode=False) is not first
+
+    stats = registry.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_compact_serialization_matches_schema_and_saves_bytes():
+    registry = SchemaRegistry()
+
+    compact = registry.prompt_schema_json(HybridCombined_Extraction, filter_mode=True)
+    expected = optimize_schema_for_prompt(HybridCombined_Extraction, filter_mode=True)
+    parsed = json.loads(compact)
+
+    # 内容は title を除いて同一
+    assert parsed["required"] == expected["required"]
+    assert set(parsed["properties"]) == set(expected["properties"])
+    assert all("title" not in prop for prop in parsed["properties"].values())
+    assert "\n" not in compact
+
+    pretty = json.dumps(expected, indent=2, ensure_ascii=False)
+    saved_once = registry.get_stats()["bytes_saved"]
+    assert saved_once == len(pretty.encode("utf-8")) - len(compact.encode("utf-8"))
+    assert saved_once > 0
+
+    # 2回目以降の利用も削減量として積算される
+    registry.prompt_schema_json(HybridCombined_Extraction, filter_mode=True)
+    assert registry.get_stats()["bytes_saved"] == saved_once * 2
+
+
+def test_field_named_title_is_kept():
+    registry = SchemaRegistry()
+    parsed = json.loads(registry.schema_json(TitleFieldSchema))
+    assert "title" in parsed["properties"]
+    assert "title" not in parsed["properties"]["title"]
+
+
+def test_regeneration_schema_is_reused_per_item_key():
+    registry = SchemaRegistry()
+    schema = registry.regeneration_schema("main_risks_txt")
+
+    assert schema is registry.regeneration_schema("main_risks_txt")
+    assert schema.__name__ == "RegenerationSchema_main_risks_txt"
+    assert list(schema.model_fields) == ["main_risks_txt"]
+    assert registry.regeneration_schema("func_pain_txt") is not schema
+
+
+def test_regeneration_schema_rejects_non_editable_keys():
+    registry = SchemaRegistry()
+
+    for key in ("patient_id", "unknown_txt", 1):
+        with pytest.raises(ValueError):
+            registry.regeneration_schema(key)
+    assert registry.get_stats()["entries"] == 0
+
+
+def test_batch_regeneration_schema_is_cached_per_item_set():
+    registry = SchemaRegistry()
+    schema = registry.batch_regeneration_schema(("main_risks_txt", "goals_1_month_txt"))
+
+    assert schema is registry.batch_regeneration_schema(("goals_1_month_txt", "main_risks_txt"))
+    assert list(schema.model_fields) == ["goals_1_month_txt", "main_risks_txt"]
+    assert registry.get_stats()["entries"] == 1
+    with pytest.raises(ValueError):
+        registry.batch_regeneration_schema(("main_risks_txt", "patient_id"))
+    assert registry.get_stats()["entries"] == 1
+
+
+def test_group_prompt_embeds_compact_schema():
+    prompt = build_group_prompt(CurrentAssessment, "{}", {})
+    assert '"properties":{' in prompt
+    assert '"title"' not in prompt
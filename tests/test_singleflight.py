@@ -0,0 +1,86 @@
+import threading
+import time
+
+from app.services.llm.singleflight import SingleFlight, snapshot_hash
+
+
+def test_do_shares_one_execution_between_concurrent_callers():
+    """同じキーの呼び出しが並行した場合、関数は1回だけ実行され、全員が同じ結果 (のコピー) を受け取ること"""
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def execute():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=5)
+        return {"answer": {"main_risks_txt": "転倒"}}
+
+    results = []
+    key = ("rag.execute", "pipeline", snapshot_hash({"年齢": 80, "性別": "女"}))
+    leader = threading.Thread(target=lambda: results.append(flight.do(key, execute)))
+    leader.start()
+    started.wait(timeout=5)
+    # キーの順序が異なっても同じスナップショットとして扱う
+    same_key = ("rag.execute", "pipeline", snapshot_hash({"性別": "女", "年齢": 80}))
+    follower = threading.Thread(target=lambda: results.append(flight.do(same_key, execute)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(timeout=5)
+    follower.join(timeout=5)
+
+    assert len(calls) == 1
+    assert results[0] == results[1]
+    assert results[0] is not results[1]
+    assert flight.get_stats()["by_kind"]["rag.execute"] == {"executions": 1, "coalesced": 1}
+
+
+def test_stream_fans_out_events_and_replays_them_to_late_subscribers():
+    """途中から購読した側にも最初からイベントが届き、生成は1回だけ行われること"""
+    flight = SingleFlight()
+    second_event = threading.Event()
+    factory_calls = []
+
+    def generate():
+        factory_calls.append(1)
+        yield "event: update\ndata: {\"key\": \"a\"}\n\n"
+        second_event.wait(timeout=5)
+        yield "event: update\ndata: {\"key\": \"b\"}\n\n"
+        yield "event: finished\ndata: {}\n\n"
+
+    first = flight.stream(("generate.general", 1), generate)
+    assert next(first).startswith("event: update")
+
+    second = flight.stream(("generate.general", 1), generate)
+    received_by_second = [next(second)]
+    second_event.set()
+    received_by_second.extend(second)
+    received_by_first = list(first)
+
+    assert len(factory_calls) == 1
+    assert received_by_second[0] == "event: update\ndata: {\"key\": \"a\"}\n\n"
+    assert received_by_second[-1] == "event: finished\ndata: {}\n\n"
+    assert received_by_first == received_by_second[1:]
+    assert flight.get_stats()["in_flight_streams"] == []
+
+
+def test_stream_stops_generation_when_all_subscribers_disconnect():
+    """購読者が全員切断したら、上流のジェネレータを閉じること"""
+    flight = SingleFlight()
+    closed = threading.Event()
+
+    def generate():
+        try:
+            while True:
+                yield "event: update\ndata: {}\n\n"
+                time.sleep(0.01)
+        finally:
+            closed.set()
+
+    subscriber = flight.stream(("generate.rag", 1), generate)
+    next(subscriber)
+    subscriber.close()
+
+    assert closed.wait(timeout=5)
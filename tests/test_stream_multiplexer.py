@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from pydantic import BaseModel, Field
+
+from app.services.llm.stream_multiplexer import multiplex_sse_streams, tag_sse_event
+
+
+class CombinedGroup(BaseModel):
+    main_risks_txt: str = Field(..., description="リスク")
+
+
+def _parse(chunk):
+    event_type, data = chunk.strip("\n").split("\n")
+    return event_type[len("event: "):], json.loads(data[len("data: "):])
+
+
+def test_tag_sse_event_adds_model_type_only_to_objects():
+    tagged = tag_sse_event('event: error\ndata: {"error": "失敗"}\n\n', "general")
+    assert _parse(tagged) == ("error", {"error": "失敗", "model_type": "general"})
+
+    # クライアント独自の model_type はストリームのキーで上書きし、配列の data は変更しない
+    update = 'event: update\ndata: {"key": "a", "value": "b", "model_type": "ollama_specialized"}\n\n'
+    assert _parse(tag_sse_event(update, "specialized")) == ("update", {"key": "a", "value": "b", "model_type": "specialized"})
+    tagged_update = 'event: update\ndata: {"key": "a", "value": "b", "model_type": "general"}\n\n'
+    assert tag_sse_event(tagged_update, "general") == tagged_update
+    contexts = 'event: context_update\ndata: [{"id": 1}]\n\n'
+    assert tag_sse_event(contexts, "specialized") == contexts
+
+
+def test_streams_run_concurrently_and_are_interleaved():
+    """2本のストリームが並行に実行され、届いた順に1本へまとめられること"""
+    both_started = threading.Barrier(2, timeout=2)
+
+    def make_stream(model_type):
+        def stream():
+            # 両方のストリームが同時に動いていなければ Barrier で失敗する
+            both_started.wait()
+            for i in range(3):
+                time.sleep(0.01)
+                yield f'event: update\ndata: {json.dumps({"key": f"{model_type}_{i}"})}\n\n'
+            yield f"event: {model_type}_done\ndata: {{}}\n\n"
+        return stream
+
+    chunks = list(multiplex_sse_streams({"general": make_stream("general"), "specialized": make_stream("specialized")}))
+    events = [_parse(c) for c in chunks]
+
+    assert events[-1] == ("all_finished", {})
+    updates = [data for event_type, data in events if event_type == "update"]
+    assert len(updates) == 6
+    assert {u["model_type"] for u in updates if u["key"].startswith("general")} == {"general"}
+    assert {u["model_type"] for u in updates if u["key"].startswith("specialized")} == {"specialized"}
+
+
+@patch("app.services.llm.ollama.GENERATION_GROUPS", [CombinedGroup])
+@patch("app.services.llm.ollama.OllamaClient._chat")
+def test_combined_ollama_events_are_routed_by_stream(mock_chat):
+    """Ollamaの ollama_general / ollama_specialized のイベントも、ストリームのキーで振り分けられること"""
+    from app.services.llm.ollama import OllamaClient
+
+    mock_chat.side_effect = lambda **kwargs: iter([{"message": {"content": '{"main_risks_txt": "汎用の文章"}'}}])
+    rag_executor = MagicMock()
+    rag_executor.execute.return_value = {"answer": {"main_risks_txt": "RAGの文章"}, "contexts": []}
+    client = OllamaClient()
+    patient = {"name": "テスト"}
+
+    chunks = list(multiplex_sse_streams({
+        "general": lambda: client.generate_plan_stream(patient),
+        "specialized": lambda: client.generate_rag_plan_stream(patient, rag_executor),
+    }))
+    updates = [data for event_type, data in (_parse(c) for c in chunks) if event_type == "update"]
+
+    assert sorted((u["model_type"], u["value"]) for u in updates) == [("general", "汎用の文章"), ("specialized", "RAGの文章")]
+
+
+def test_failing_stream_reports_error_without_stopping_the_other():
+    def broken():
+        raise RuntimeError("executor not found")
+
+    def working():
+        yield 'event: update\ndata: {"key": "a", "value": "b"}\n\n'
+        yield "event: general_finished\ndata: {}\n\n"
+
+    events = [_parse(c) for c in multiplex_sse_streams({"general": working, "specialized": broken})]
+    event_types = [e[0] for e in events]
+
+    assert "general_finished" in event_types
+    error = next(data for event_type, data in events if event_type == "error")
+    assert error["model_type"] == "specialized"
+    assert "executor not found" in error["error"]
+    assert event_types[-1] == "all_finished"
+
+
+def test_client_disconnect_stops_streams():
+    produced = []
+    closed = threading.Event()
+
+    def endless():
+        try:
+            i = 0
+            while True:
+                produced.append(i)
+                yield f'event: update\ndata: {{"key": "k{i}"}}\n\n'
+                i += 1
+                time.sleep(0.01)
+        finally:
+            closed.set()
+
+    stream = multiplex_sse_streams({"general": endless})
+    next(stream)
+    stream.close()  # クライアント切断時に Flask が呼ぶ
+
+    assert closed.wait(1.0)
+    count = len(produced)
+    time.sleep(0.05)
+    assert len(produced) == count
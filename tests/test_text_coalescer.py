@@ -0,0 +1,30 @@
+from app.services.llm.text_coalescer import coalesce_text
+
+
+def test_coalesce_text_flushes_at_sentence_endings():
+    """文末が届いた時点で、最後の文末までをまとめて返すこと"""
+    pieces = ["右肩の", "痛みが", "あります。", "歩く", "練習を", "続けます。また", "転倒に注意"]
+    chunks = list(coalesce_text(pieces, max_interval=60))
+
+    assert chunks == ["右肩の痛みがあります。", "歩く練習を続けます。", "また転倒に注意"]
+    assert "".join(chunks) == "".join(pieces)
+
+
+def test_coalesce_text_flushes_after_time_window_and_size_limit():
+    """文末が来なくても、一定時間経過するか一定文字数溜まったら返すこと"""
+    now = [0.0]
+
+    def clock():
+        return now[0]
+
+    def pieces():
+        yield "あいう"
+        now[0] = 0.1
+        yield "えお"
+        now[0] = 0.5
+        yield "かき"
+        yield "く" * 10
+
+    chunks = list(coalesce_text(pieces(), max_interval=0.3, max_chars=8, clock=clock))
+
+    assert chunks == ["あいうえおかき", "くくくくくくくくくく"]